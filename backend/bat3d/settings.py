@@ -95,6 +95,7 @@ INSTALLED_APPS = [
     'inquiries',
     'site_settings',
     'reviews',
+    'search',
 ]
 
 MIDDLEWARE = [
@@ -172,6 +173,50 @@ DATABASES = {
 #     }
 # }
 
+# Кэш: по умолчанию в памяти процесса. Для нескольких воркеров gunicorn задайте REDIS_URL,
+# чтобы версия каталога и закэшированные ответы были общими (нужен пакет redis).
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bat3d-default',
+        }
+    }
+
+# Время жизни закэшированных ответов каталога (сек). Инвалидация - по версии каталога.
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 3600))
+
+# Файл снимка каталога, общий для всех воркеров (products/snapshot.py). Пустое значение отключает снимок.
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', os.path.join(BASE_DIR, 'var', 'catalog_snapshot.bin'))
+# Задержка пересборки снимка после изменения каталога (сек): изменения за это время собираются в одну
+# пересборку в фоновом потоке, пока ответы идут из БД. 0 - пересобирать сразу после коммита.
+CATALOG_SNAPSHOT_REBUILD_DELAY = float(os.getenv('CATALOG_SNAPSHOT_REBUILD_DELAY', 10))
+
+# Лента изменений каталога (products/changes.py): запас (сек) на транзакции, закоммиченные не в порядке номеров,
+# и срок хранения журнала (дней, очистка - manage.py prune_catalog_changes).
+CATALOG_CHANGES_SAFETY_LAG = float(os.getenv('CATALOG_CHANGES_SAFETY_LAG', 5))
+CATALOG_CHANGES_RETENTION_DAYS = int(os.getenv('CATALOG_CHANGES_RETENTION_DAYS', 30))
+
+# Каталог для карты сайта и товарного фида (products/feeds.py); файлы обновляет manage.py build_feeds по расписанию.
+FEEDS_DIR = os.getenv('FEEDS_DIR', os.path.join(BASE_DIR, 'var', 'feeds'))
+# Адрес бэкенда (схема и хост) для ссылок на изображения в фиде - SITE_URL указывает на фронтенд.
+FEEDS_MEDIA_BASE_URL = os.getenv('FEEDS_MEDIA_BASE_URL', '')
+
+# Адреса API (схема и хост, через запятую), под которыми manage.py warm_catalog прогревает кэш ответов.
+# Ключ кэша включает хост, а ссылки на изображения - схему, поэтому они должны совпадать с боевыми.
+CATALOG_WARM_URLS = [url.strip() for url in os.getenv('CATALOG_WARM_URLS', '').split(',') if url.strip()]
+
+# Срок резерва остатков под неоплаченный заказ (мин), orders/reservations.py
+STOCK_RESERVATION_TTL_MINUTES = int(os.getenv('STOCK_RESERVATION_TTL_MINUTES', 30))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -23,6 +23,7 @@ from django.http import JsonResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from products.views import product_feed, sitemap_index, sitemap_part
 
 # Удаляем заглушку для продуктов, так как будет использоваться ViewSet
 # @api_view(['GET', 'POST', 'PUT', 'DELETE'])
@@ -122,6 +123,11 @@ urlpatterns = [
     path('api/inquiries/', include('inquiries.urls')),
     path('api/site-settings/', include('site_settings.urls')),
     path('api/reviews/', include('reviews.urls')),
+
+    # Карта сайта и товарный фид для поисковиков и маркетплейсов (products/feeds.py)
+    path('sitemap.xml', sitemap_index, name='sitemap'),
+    path('sitemap-<slug:part>.xml.gz', sitemap_part, name='sitemap-part'),
+    path('feeds/products.yml', product_feed, name='product-feed'),
     
     # Маршруты для React Admin Panel (заглушки)
     # Удаляем URL-маршруты для management_products_view
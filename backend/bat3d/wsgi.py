@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bat3d.settings')
 
 application = get_wsgi_application()
+
+# Долгоживущий воркер: пересборка снимка каталога уходит в фоновый поток (products/snapshot.py)
+from products.snapshot import enable_background_rebuild  # noqa: E402
+
+enable_background_rebuild()
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:08
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Схлопывает повторяющиеся строки (двойные клики) в одну с суммарным количеством."""
+    CartItem = apps.get_model('cart', 'CartItem')
+    for key in ('product_id', 'printing_service_id'):
+        duplicates = (
+            CartItem.objects.filter(**{f'{key}__isnull': False})
+            .values('cart_id', key)
+            .annotate(lines=Count('id'), keep=Min('id'), total=Sum('quantity'))
+            .filter(lines__gt=1)
+            .order_by()
+        )
+        for group in duplicates:
+            lines = CartItem.objects.filter(cart_id=group['cart_id'], **{key: group[key]})
+            lines.filter(pk=group['keep']).update(quantity=group['total'])
+            lines.exclude(pk=group['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0002_cart_session_key_alter_cart_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('product__isnull', False)), fields=('cart', 'product'), name='cartitem_unique_product'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('printing_service__isnull', False)), fields=('cart', 'printing_service'), name='cartitem_unique_service'),
+        ),
+    ]
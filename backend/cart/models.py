@@ -58,17 +58,25 @@ class CartItem(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # Одна строка на товар / услугу в корзине; на них опирается upsert в cart/services.py
+            models.UniqueConstraint(
+                fields=['cart', 'product'], condition=models.Q(product__isnull=False), name='cartitem_unique_product'
+            ),
+            models.UniqueConstraint(
+                fields=['cart', 'printing_service'], condition=models.Q(printing_service__isnull=False),
+                name='cartitem_unique_service'
+            ),
+        ]
+
     def __str__(self):
         return f'CartItem {self.id}'
 
     def get_total_price(self):
+        # Та же формула, что в SQL-аннотации cart.services.priced_lines
         if self.product:
             return self.product.price * self.quantity
         elif self.printing_service:
-            base_price = self.printing_service.base_price
-            if self.weight:
-                base_price += self.printing_service.price_per_gram * self.weight
-            if self.printing_time:
-                base_price += self.printing_service.price_per_hour * self.printing_time
-            return base_price * self.quantity
+            return self.printing_service.base_price * self.quantity
         return 0
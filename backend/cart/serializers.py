@@ -1,29 +1,83 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from .models import Cart, CartItem
-from products.serializers import ProductSerializer, PrintingServiceSerializer
+from .services import BATCH_MAX_OPERATIONS, OP_ADD, OP_REMOVE, OP_SET, cart_lines
+from products.models import PrintingService, Product
+
+
+class CartProductSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'slug', 'price', 'image', 'description']
+
+
+class CartServiceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PrintingService
+        fields = ['id', 'name', 'base_price', 'image']
+
 
 class CartItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
-    printing_service = PrintingServiceSerializer(read_only=True)
-    total_price = serializers.SerializerMethodField()
+    """
+    Позиция корзины: только поля товара / услуги, которые показывает корзина.
+    Ожидает queryset из cart.services.priced_lines / cart_lines (unit_price, line_total).
+    """
+    product = CartProductSerializer(read_only=True)
+    printing_service = CartServiceSerializer(read_only=True)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2, source='line_total', read_only=True)
 
     class Meta:
         model = CartItem
         fields = [
             'id', 'product', 'printing_service', 'quantity',
-            'weight', 'printing_time', 'total_price'
+            'weight', 'printing_time', 'unit_price', 'total_price'
         ]
 
-    def get_total_price(self, obj):
-        return obj.get_total_price()
-
 class CartSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True, read_only=True)
+    items = serializers.SerializerMethodField()
     total_cost = serializers.SerializerMethodField()
 
     class Meta:
         model = Cart
         fields = ['id', 'items', 'total_cost', 'created', 'updated']
 
+    def _lines(self, obj):
+        # Позиции с суммами читаются одним запросом на корзину
+        if not hasattr(obj, '_priced_lines'):
+            obj._priced_lines = list(cart_lines(obj))
+        return obj._priced_lines
+
+    def get_items(self, obj):
+        return CartItemSerializer(self._lines(obj), many=True, context=self.context).data
+
     def get_total_cost(self, obj):
-        return sum(item.get_total_price() for item in obj.items.all()) 
\ No newline at end of file
+        lines = self._lines(obj)
+        return lines[0].cart_total if lines else Decimal('0.00')
+
+
+class CartBatchOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=[OP_ADD, OP_SET, OP_REMOVE])
+    product = serializers.IntegerField(required=False, min_value=1)
+    printing_service = serializers.IntegerField(required=False, min_value=1)
+    item = serializers.IntegerField(required=False, min_value=1)
+    quantity = serializers.IntegerField(required=False, min_value=0)
+    weight = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    printing_time = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+
+    def validate(self, attrs):
+        targets = [field for field in ('product', 'printing_service', 'item') if attrs.get(field) is not None]
+        if len(targets) != 1:
+            raise serializers.ValidationError('Укажите ровно одно из полей product, printing_service, item.')
+        if attrs['op'] == OP_ADD:
+            attrs.setdefault('quantity', 1)
+            if attrs['quantity'] < 1:
+                raise serializers.ValidationError({'quantity': 'Ensure this value is greater than or equal to 1.'})
+        elif attrs['op'] == OP_SET and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'This field is required.'})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartBatchOperationSerializer(many=True, allow_empty=False, max_length=BATCH_MAX_OPERATIONS)
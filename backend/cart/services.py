@@ -0,0 +1,292 @@
+"""
+Операции с корзиной, которым важны число запросов и параллельные клики: добавление
+позиции (add_to_cart) и слияние анонимной корзины с корзиной пользователя.
+
+Добавление - один INSERT ... SELECT ... ON CONFLICT DO UPDATE: товар или услуга
+проверяются тем же запросом (SELECT из их таблицы), а повторный клик по уже
+добавленной позиции упирается в уникальность (корзина, товар) / (корзина, услуга)
+и увеличивает количество вместо второй строки. Синтаксис одинаков для PostgreSQL
+и SQLite (3.35+); для прочих СУБД - обычный путь через ORM.
+
+Слияние анонимной корзины с корзиной пользователя (claim_anonymous_cart) вызывается
+при входе (signals.transfer_session_cart_to_user) и во вьюхах корзины,
+если у вошедшего пользователя в сессии осталась анонимная корзина. Слияние идет
+в одной транзакции несколькими set-based запросами на каждый вид позиций (товар /
+услуга), без цикла по позициям: совпадающие позиции корзины пользователя получают
+сумму количеств одним UPDATE, остальные позиции переносятся сменой cart_id, затем
+анонимная корзина удаляется.
+
+Параллельные входы из двух вкладок сериализуются блокировкой строки пользователя:
+вторая транзакция после ожидания уже не найдет анонимную корзину и ничего не сделает.
+
+Чтение корзины (priced_lines / cart_lines): цена за единицу, сумма позиции и сумма
+корзины считаются аннотациями в том же запросе, что и позиции, а из товара и услуги
+читаются только колонки, которые показывает корзина - ответ корзины любого размера
+строится одним запросом.
+
+Пакет операций (apply_cart_operations, POST /api/cart/batch/) применяется к позициям
+корзины, прочитанным одним запросом, в памяти; результат записывается тремя
+запросами (bulk_create, bulk_update, DELETE) в одной транзакции - число запросов
+не зависит от числа операций.
+"""
+import logging
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import DecimalField, Exists, ExpressionWrapper, F, OuterRef, Subquery, Sum, Window
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from products.models import PrintingService, Product
+from .models import Cart, CartItem
+
+logger = logging.getLogger(__name__)
+
+# Позиция корзины - либо товар, либо услуга: (поле позиции, поле, которое должно быть пустым)
+LINE_KINDS = (('product_id', 'printing_service_id'), ('printing_service_id', 'product_id'))
+
+UPSERT_VENDORS = ('postgresql', 'sqlite')
+
+# Колонки позиции, товара и услуги, которые нужны корзине (CartItemSerializer)
+LINE_FIELDS = (
+    'id', 'cart', 'quantity', 'weight', 'printing_time',
+    'product', 'product__name', 'product__slug', 'product__price', 'product__image', 'product__description',
+    'printing_service', 'printing_service__name', 'printing_service__base_price', 'printing_service__image',
+)
+
+OP_ADD = 'add'
+OP_SET = 'set'
+OP_REMOVE = 'remove'
+BATCH_MAX_OPERATIONS = 100
+
+
+class CartOperationError(Exception):
+    """Ошибки пакета операций: {номер операции: сообщение}. Пакет не применяется."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(str(errors))
+
+
+def priced_lines(queryset):
+    """
+    Позиции с ценой за единицу (unit_price) и суммой позиции (line_total):
+    цена товара или базовая цена услуги, умноженная на количество.
+    """
+    return (
+        queryset
+        .select_related('product', 'printing_service')
+        .only(*LINE_FIELDS)
+        .annotate(unit_price=Coalesce(
+            F('product__price'), F('printing_service__base_price'),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ))
+        .annotate(line_total=ExpressionWrapper(
+            F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2)
+        ))
+    )
+
+
+def cart_lines(cart):
+    """Позиции корзины для ответа; сумма корзины (cart_total) - оконной функцией в том же запросе."""
+    return (
+        priced_lines(CartItem.objects.filter(cart=cart))
+        .annotate(cart_total=Window(
+            Sum('line_total'), partition_by=[F('cart_id')],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ))
+        .order_by('pk')
+    )
+
+
+def _upsert_line(cart, key, model, object_id, quantity, weight, printing_time):
+    fields = {name: CartItem._meta.get_field(name) for name in (
+        'cart', 'product', 'printing_service', 'quantity', 'weight', 'printing_time', 'created', 'updated'
+    )}
+    columns = {name: connection.ops.quote_name(field.column) for name, field in fields.items()}
+    table = connection.ops.quote_name(CartItem._meta.db_table)
+    now = timezone.now()
+    values = {
+        'cart': '%s', 'product': 'NULL', 'printing_service': 'NULL', 'quantity': '%s',
+        'weight': '%s', 'printing_time': '%s', 'created': '%s', 'updated': '%s',
+    }
+    values[key] = connection.ops.quote_name(model._meta.pk.column)
+    params = [
+        cart.pk,
+        quantity,
+        fields['weight'].get_db_prep_save(weight, connection),
+        fields['printing_time'].get_db_prep_save(printing_time, connection),
+        fields['created'].get_db_prep_save(now, connection),
+        fields['updated'].get_db_prep_save(now, connection),
+        object_id,
+    ]
+    sql = (
+        f"INSERT INTO {table} ({', '.join(columns.values())}) "
+        f"SELECT {', '.join(values[name] for name in columns)} "
+        f"FROM {connection.ops.quote_name(model._meta.db_table)} "
+        f"WHERE {connection.ops.quote_name(model._meta.pk.column)} = %s "
+        # Условие повторяет условие частичного уникального индекса (CartItem.Meta.constraints)
+        f"ON CONFLICT ({columns['cart']}, {columns[key]}) WHERE {columns[key]} IS NOT NULL "
+        f"DO UPDATE SET {columns['quantity']} = {table}.{columns['quantity']} + excluded.{columns['quantity']}, "
+        f"{columns['updated']} = excluded.{columns['updated']} "
+        f"RETURNING {connection.ops.quote_name(CartItem._meta.pk.column)}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def _add_line_with_orm(cart, key, model, object_id, quantity, weight, printing_time):
+    with transaction.atomic():
+        if not model.objects.filter(pk=object_id).exists():
+            return None
+        item, created = CartItem.objects.get_or_create(
+            cart=cart, **{f'{key}_id': object_id},
+            defaults={'quantity': quantity, 'weight': weight, 'printing_time': printing_time},
+        )
+        if not created:
+            CartItem.objects.filter(pk=item.pk).update(quantity=F('quantity') + quantity, updated=timezone.now())
+    return item.pk
+
+
+def add_to_cart(cart, quantity, product_id=None, service_id=None, weight=None, printing_time=None):
+    """
+    Добавляет товар (или услугу, если товар не указан) в корзину; если позиция уже
+    есть, увеличивает ее количество. Возвращает id позиции или None, если такого
+    товара / услуги нет.
+    """
+    if product_id is not None:
+        key, model, object_id = 'product', Product, product_id
+    else:
+        key, model, object_id = 'printing_service', PrintingService, service_id
+    add_line = _upsert_line if connection.vendor in UPSERT_VENDORS else _add_line_with_orm
+    return add_line(cart, key, model, object_id, quantity, weight, printing_time)
+
+
+def _merge_items(source_id, target_id):
+    now = timezone.now()
+    for key, other in LINE_KINDS:
+        kind = {f'{key}__isnull': False, f'{other}__isnull': True}
+        source_lines = CartItem.objects.filter(cart_id=source_id, **kind, **{key: OuterRef(key)}).order_by()
+        total = source_lines.values(key).annotate(total=Sum('quantity')).values('total')
+        # Вес и время печати берутся из анонимной корзины, если там они заданы
+        latest = source_lines.order_by('-pk')
+        CartItem.objects.filter(Exists(source_lines), cart_id=target_id, **kind).update(
+            quantity=F('quantity') + Subquery(total),
+            weight=Coalesce(Subquery(latest.filter(weight__isnull=False).values('weight')[:1]), F('weight')),
+            printing_time=Coalesce(
+                Subquery(latest.filter(printing_time__isnull=False).values('printing_time')[:1]), F('printing_time')
+            ),
+            updated=now,
+        )
+        target_lines = CartItem.objects.filter(cart_id=target_id, **kind, **{key: OuterRef(key)})
+        CartItem.objects.filter(~Exists(target_lines), cart_id=source_id, **kind).update(cart_id=target_id, updated=now)
+
+
+def claim_anonymous_cart(user, cart_id):
+    """
+    Привязывает анонимную корзину cart_id к пользователю. Если своей корзины у него
+    нет, анонимная становится его корзиной, иначе ее позиции сливаются в корзину
+    пользователя. Возвращает корзину пользователя или None, если привязывать нечего
+    (корзины нет или она уже принадлежит пользователю).
+    """
+    with transaction.atomic():
+        # Блокировка пользователя сериализует параллельные слияния его корзин
+        list(get_user_model().objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+        session_cart = Cart.objects.select_for_update().filter(pk=cart_id, user__isnull=True).first()
+        if session_cart is None:
+            return None
+
+        user_cart = Cart.objects.filter(user=user).order_by('pk').first()
+        if user_cart is None:
+            Cart.objects.filter(pk=session_cart.pk).update(user=user, session_key=None, updated=timezone.now())
+            session_cart.user, session_cart.session_key = user, None
+            logger.info(f"[Cart Merge] Session cart ID {session_cart.pk} assigned to user {user.pk}")
+            return session_cart
+
+        _merge_items(session_cart.pk, user_cart.pk)
+        CartItem.objects.filter(cart_id=session_cart.pk).delete()
+        Cart.objects.filter(pk=session_cart.pk).delete()
+        logger.info(f"[Cart Merge] Session cart ID {session_cart.pk} merged into user cart ID {user_cart.pk}")
+        return user_cart
+
+
+def _existing_ids(model, ids):
+    if not ids:
+        return set()
+    return set(model.objects.filter(pk__in=ids).values_list('pk', flat=True))
+
+
+def apply_cart_operations(cart, operations):
+    """
+    Применяет к корзине пакет операций, проверенных CartBatchSerializer, все или ни одной.
+    Операция - {'op': 'add' | 'set' | 'remove', 'product' | 'printing_service' | 'item': id,
+    'quantity', 'weight', 'printing_time'}; операции выполняются по порядку, set с
+    quantity 0 удаляет позицию. При ошибках бросает CartOperationError.
+    """
+    with transaction.atomic():
+        # Параллельные пакеты одной корзины выполняются по очереди
+        list(Cart.objects.select_for_update().filter(pk=cart.pk).values_list('pk', flat=True))
+        lines = {}
+        for item in CartItem.objects.filter(cart=cart).order_by('pk'):
+            key = ('product', item.product_id) if item.product_id else ('printing_service', item.printing_service_id)
+            lines[key] = item
+        keys_by_item = {item.pk: key for key, item in lines.items()}
+        original = {item.pk: (item.quantity, item.weight, item.printing_time) for item in lines.values()}
+
+        # Товары и услуги, которых еще нет в корзине, проверяются одним запросом на таблицу
+        known = {}
+        for kind, model in (('product', Product), ('printing_service', PrintingService)):
+            in_cart = {object_id for line_kind, object_id in lines if line_kind == kind}
+            requested = {op[kind] for op in operations if op.get(kind)}
+            known[kind] = in_cart | _existing_ids(model, requested - in_cart)
+
+        errors = {}
+        for index, op in enumerate(operations):
+            if op.get('item'):
+                key = keys_by_item.get(op['item'])
+                if key is None:
+                    errors[index] = 'Позиция не найдена в корзине.'
+                    continue
+            else:
+                key = ('product', op['product']) if op.get('product') else ('printing_service', op['printing_service'])
+                if key[1] not in known[key[0]]:
+                    errors[index] = 'Товар не найден.' if key[0] == 'product' else 'Услуга не найдена.'
+                    continue
+
+            line = lines.get(key)
+            if op['op'] == OP_REMOVE:
+                if line is not None:
+                    line.quantity = 0
+                continue
+            if line is None:
+                line = lines[key] = CartItem(cart=cart, quantity=0, **{f'{key[0]}_id': key[1]})
+            line.quantity = line.quantity + op['quantity'] if op['op'] == OP_ADD else op['quantity']
+            for field in ('weight', 'printing_time'):
+                if op.get(field) is not None:
+                    setattr(line, field, op[field])
+        if errors:
+            raise CartOperationError(errors)
+
+        now = timezone.now()
+        to_create, to_update, to_delete = [], [], []
+        for line in lines.values():
+            if line.pk is None:
+                if line.quantity > 0:
+                    to_create.append(line)
+            elif line.quantity <= 0:
+                to_delete.append(line.pk)
+            elif (line.quantity, line.weight, line.printing_time) != original[line.pk]:
+                line.updated = now
+                to_update.append(line)
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity', 'weight', 'printing_time', 'updated'])
+        if to_delete:
+            CartItem.objects.filter(pk__in=to_delete).delete()
+    logger.info(
+        f"[Cart Batch] Cart ID {cart.pk}: {len(operations)} operations, "
+        f"created {len(to_create)}, updated {len(to_update)}, deleted {len(to_delete)}"
+    )
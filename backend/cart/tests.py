@@ -1,10 +1,14 @@
+from django.contrib.sessions.models import Session
+from django.db import IntegrityError, connection, transaction
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from products.models import Product, PrintingService, Category
+from products.models import Product, PrintingService, PrintingMaterial, Category
 from .models import Cart, CartItem
+from .services import add_to_cart, claim_anonymous_cart
 from decimal import Decimal
 from django.utils.text import slugify
 from django.conf import settings
@@ -166,3 +170,324 @@ class CartTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
         response = self.client.post(cart_items_url, {'product': self.product.id, 'quantity': 1})
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class CartQueryCountTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='cart_queries', email='cart_queries@example.com', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.material = PrintingMaterial.objects.create(name='PLA', description='', price_multiplier=Decimal('1.00'), color='white')
+
+    def _add_service(self, i):
+        service = PrintingService.objects.create(name=f'Service {i}', description='', base_price=Decimal('50.00'))
+        service.materials.add(self.material)
+        CartItem.objects.create(cart=self.cart, printing_service=service, quantity=1)
+
+    def _count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('minimal-cart'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(queries)
+
+    def test_service_materials_do_not_add_queries_per_item(self):
+        self._add_service(0)
+        self._count_queries() # прогрев справочника материалов
+        single = self._count_queries()
+        for i in range(1, 4):
+            self._add_service(i)
+        self.assertEqual(self._count_queries(), single)
+
+
+class LazyCartTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='lazy_cart', email='lazy_cart@example.com', password='testpass123')
+        category = Category.objects.create(name='Lazy', slug='lazy')
+        self.product = Product.objects.create(
+            name='Lazy Product', slug='lazy-product', price=Decimal('100.00'), stock=10, category=category
+        )
+
+    def _assert_no_writes(self, queries):
+        writes = [query['sql'] for query in queries if not query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertEqual(writes, [])
+
+    def test_anonymous_read_creates_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('minimal-cart'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+        self._assert_no_writes(queries)
+        self.assertEqual(len(queries), 0)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(Session.objects.exists())
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_authenticated_reads_do_not_create_cart(self):
+        self.client.force_authenticate(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('minimal-cart')).data, [])
+            self.assertEqual(self.client.get(reverse('cart-item-list')).status_code, status.HTTP_200_OK)
+        self._assert_no_writes(queries)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(Session.objects.exists())
+
+    def test_first_add_materializes_cart(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(reverse('cart-item-list'), {'product': self.product.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.items.get().quantity, 2)
+        self.assertEqual(len(self.client.get(reverse('minimal-cart')).data), 1)
+
+    def test_anonymous_session_cart_is_read(self):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        session = self.client.session
+        session['cart_id'] = cart.pk
+        session.save()
+        response = self.client.get(reverse('minimal-cart'))
+        self.assertEqual([item['id'] for item in response.data], [cart.items.get().pk])
+        self.assertEqual(Cart.objects.count(), 1)
+
+
+class CartMergeTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='merge_cart', email='merge_cart@example.com', password='testpass123')
+        category = Category.objects.create(name='Merge', slug='merge')
+        self.products = [
+            Product.objects.create(name=f'Merge {i}', slug=f'merge-{i}', price=Decimal('10.00'), stock=10, category=category)
+            for i in range(6)
+        ]
+        self.service = PrintingService.objects.create(name='Merge Service', description='', base_price=Decimal('50.00'))
+
+    def _merge(self, session_items):
+        user_cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=user_cart, product=self.products[0], quantity=1)
+        CartItem.objects.create(cart=user_cart, printing_service=self.service, quantity=1, weight=Decimal('10.00'))
+        session_cart = Cart.objects.create()
+        for product, quantity in session_items:
+            CartItem.objects.create(cart=session_cart, product=product, quantity=quantity)
+        CartItem.objects.create(cart=session_cart, printing_service=self.service, quantity=2, weight=Decimal('25.00'))
+        with CaptureQueriesContext(connection) as queries:
+            result = claim_anonymous_cart(self.user, session_cart.pk)
+        return user_cart, session_cart, result, len(queries)
+
+    def test_merges_with_constant_number_of_queries(self):
+        user_cart, session_cart, result, single = self._merge([(self.products[0], 2)])
+        self.assertEqual(result, user_cart)
+        self.assertFalse(Cart.objects.filter(pk=session_cart.pk).exists())
+        self.assertEqual(user_cart.items.get(product=self.products[0]).quantity, 3)
+        service_line = user_cart.items.get(printing_service=self.service)
+        self.assertEqual((service_line.quantity, service_line.weight), (3, Decimal('25.00')))
+
+        CartItem.objects.all().delete()
+        Cart.objects.all().delete()
+        user_cart, _, _, many = self._merge([(product, 1) for product in self.products])
+        self.assertEqual(many, single)
+        self.assertEqual(user_cart.items.count(), 7)
+        self.assertEqual(user_cart.items.get(product=self.products[0]).quantity, 2)
+
+    def test_session_cart_becomes_user_cart_and_second_claim_is_noop(self):
+        session_cart = Cart.objects.create()
+        CartItem.objects.create(cart=session_cart, product=self.products[1], quantity=1)
+        self.assertEqual(claim_anonymous_cart(self.user, session_cart.pk), session_cart)
+        session_cart.refresh_from_db()
+        self.assertEqual(session_cart.user, self.user)
+        # Вторая вкладка: корзина уже привязана
+        self.assertIsNone(claim_anonymous_cart(self.user, session_cart.pk))
+        self.assertEqual(Cart.objects.filter(user=self.user).count(), 1)
+
+    def test_login_merges_session_cart(self):
+        client = APIClient()
+        user_cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=user_cart, product=self.products[0], quantity=1)
+        session_cart = Cart.objects.create()
+        CartItem.objects.create(cart=session_cart, product=self.products[0], quantity=4)
+        session = client.session
+        session['cart_id'] = session_cart.pk
+        session.save()
+        self.assertTrue(client.login(email='merge_cart@example.com', password='testpass123'))
+        self.assertEqual(user_cart.items.get().quantity, 5)
+        self.assertFalse(Cart.objects.filter(pk=session_cart.pk).exists())
+        self.assertEqual(client.session['cart_id'], user_cart.pk)
+
+
+class CartUpsertTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='upsert_cart', email='upsert_cart@example.com', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        category = Category.objects.create(name='Upsert', slug='upsert')
+        self.product = Product.objects.create(
+            name='Upsert Product', slug='upsert-product', price=Decimal('10.00'), stock=10, category=category
+        )
+        self.service = PrintingService.objects.create(name='Upsert Service', description='', base_price=Decimal('50.00'))
+
+    def test_repeated_add_increments_single_line(self):
+        url = reverse('cart-item-list')
+        self.client.post(url, {'product': self.product.pk, 'quantity': 1})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'product': self.product.pk, 'quantity': 2})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['quantity'], 3)
+        self.assertEqual(self.cart.items.get().quantity, 3)
+        # Проверка товара, вставка и увеличение количества - один запрос
+        writes = [query['sql'] for query in queries if 'cart_cartitem' in query['sql'] and not query['sql'].startswith('SELECT')]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('INSERT'))
+
+    def test_service_lines_are_unique_too(self):
+        self.assertEqual(add_to_cart(self.cart, 1, service_id=self.service.pk, weight=Decimal('20.00')),
+                         add_to_cart(self.cart, 4, service_id=self.service.pk))
+        line = self.cart.items.get()
+        self.assertEqual((line.quantity, line.weight), (5, Decimal('20.00')))
+
+    def test_unknown_product_is_rejected_without_insert(self):
+        response = self.client.post(reverse('cart-item-list'), {'product': 999999, 'quantity': 1})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('product', response.data)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_database_rejects_duplicate_lines(self):
+        CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+
+
+class CartBatchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='batch_cart', email='batch_cart@example.com', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        category = Category.objects.create(name='Batch', slug='batch')
+        self.products = [
+            Product.objects.create(
+                name=f'Batch Product {i}', slug=f'batch-product-{i}', price=Decimal('10.00'), stock=10, category=category
+            )
+            for i in range(5)
+        ]
+        self.service = PrintingService.objects.create(name='Batch Service', description='', base_price=Decimal('50.00'))
+        self.url = reverse('cart-batch')
+
+    def _post(self, operations):
+        return self.client.post(self.url, {'operations': operations}, format='json')
+
+    def test_operations_are_applied_in_order(self):
+        kept = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        removed = CartItem.objects.create(cart=self.cart, product=self.products[1], quantity=1)
+        response = self._post([
+            {'op': 'add', 'product': self.products[0].pk, 'quantity': 2},
+            {'op': 'add', 'product': self.products[2].pk},
+            {'op': 'set', 'product': self.products[2].pk, 'quantity': 4},
+            {'op': 'remove', 'item': removed.pk},
+            {'op': 'add', 'printing_service': self.service.pk, 'quantity': 2},
+            {'op': 'set', 'product': self.products[3].pk, 'quantity': 0},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        quantities = dict(self.cart.items.values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {self.products[0].pk: 3, self.products[2].pk: 4, None: 2})
+        self.assertTrue(self.cart.items.filter(pk=kept.pk).exists())
+        self.assertEqual(len(response.data['items']), 3)
+        self.assertEqual(response.data['total_cost'], Decimal('170.00'))
+
+    def test_query_count_does_not_depend_on_operations(self):
+        def count(operations):
+            with CaptureQueriesContext(connection) as queries:
+                response = self._post(operations)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        p = [product.pk for product in self.products]
+        count([{'op': 'add', 'product': p[0]}, {'op': 'add', 'product': p[1]}]) # корзина в сессии
+        # В обоих пакетах есть вставка, изменение и удаление
+        few = count([{'op': 'add', 'product': p[2]}, {'op': 'set', 'product': p[0], 'quantity': 3},
+                     {'op': 'remove', 'product': p[1]}])
+        many = count([
+            {'op': 'add', 'product': p[1]}, {'op': 'add', 'product': p[3]}, {'op': 'add', 'product': p[4], 'quantity': 2},
+            {'op': 'set', 'product': p[0], 'quantity': 7}, {'op': 'add', 'product': p[0]},
+            {'op': 'remove', 'product': p[2]},
+        ])
+        self.assertEqual(few, many)
+
+    def test_invalid_operation_rejects_whole_batch(self):
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1)
+        response = self._post([
+            {'op': 'set', 'product': self.products[0].pk, 'quantity': 5},
+            {'op': 'add', 'product': 999999},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn(1, response.data['operations'])
+        self.assertEqual(self.cart.items.get().quantity, 1)
+
+    def test_operation_must_name_one_target(self):
+        response = self._post([{'op': 'add', 'product': self.products[0].pk, 'item': 1}])
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CartTotalsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='totals_cart', email='totals_cart@example.com', password='testpass123')
+        self.client.force_authenticate(user=self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.category = Category.objects.create(name='Totals', slug='totals')
+        self.material = PrintingMaterial.objects.create(name='PETG', description='', price_multiplier=Decimal('1.00'), color='black')
+        self.count = 0
+
+    def _add_lines(self, n):
+        for _ in range(n):
+            self.count += 1
+            product = Product.objects.create(
+                name=f'Totals {self.count}', slug=f'totals-{self.count}', price=Decimal('12.50'), stock=5,
+                category=self.category,
+            )
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+            service = PrintingService.objects.create(name=f'Totals {self.count}', description='', base_price=Decimal('40.00'))
+            service.materials.add(self.material)
+            CartItem.objects.create(cart=self.cart, printing_service=service, quantity=1, weight=Decimal('25.00'))
+
+    def _get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(queries)
+
+    def test_cart_read_uses_constant_number_of_queries(self):
+        self._add_lines(1)
+        _, single = self._get(reverse('minimal-cart'))
+        self._add_lines(5)
+        response, many = self._get(reverse('minimal-cart'))
+        self.assertEqual(many, single)
+        self.assertEqual(len(response.data), 12)
+
+    def test_line_totals_and_lean_fields(self):
+        self._add_lines(1)
+        response, _ = self._get(reverse('minimal-cart'))
+        product_line, service_line = response.data
+        self.assertEqual(set(product_line['product']), {'id', 'name', 'slug', 'price', 'image', 'description'})
+        self.assertEqual(set(service_line['printing_service']), {'id', 'name', 'base_price', 'image'})
+        self.assertEqual(Decimal(product_line['total_price']), Decimal('25.00'))
+        # Услуга: базовая цена за единицу, вес на цену не влияет
+        self.assertEqual(Decimal(service_line['total_price']), Decimal('40.00'))
+        self.assertEqual(Decimal(service_line['unit_price']), CartItem.objects.get(pk=service_line['id']).get_total_price())
+
+    def test_batch_response_total_is_computed_in_sql(self):
+        self._add_lines(2)
+        response = self.client.post(reverse('cart-batch'), {'operations': [
+            {'op': 'set', 'item': self.cart.items.order_by('pk').first().pk, 'quantity': 4},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal(response.data['total_cost']), Decimal('155.00'))
+        self.assertEqual(Decimal(response.data['total_cost']), sum(Decimal(line['total_price']) for line in response.data['items']))
+
+    def test_update_returns_recalculated_total(self):
+        self._add_lines(1)
+        line = self.cart.items.filter(product__isnull=False).get()
+        response = self.client.patch(reverse('cart-item-detail', args=[line.pk]), {'quantity': 3}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('37.50'))
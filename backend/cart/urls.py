@@ -2,7 +2,7 @@ from django.urls import path, include # Добавляем include
 from rest_framework.routers import DefaultRouter # Используем DefaultRouter, если rest_framework_nested не нужен явно здесь
 # from rest_framework_nested import routers # Убрано
 # from .views import CartViewSet, CartItemViewSet # CartViewSet больше не используется напрямую здесь
-from .views import MinimalCartView, CartItemViewSet # Импортируем MinimalCartView и CartItemViewSet
+from .views import MinimalCartView, CartBatchView, CartItemViewSet # Импортируем MinimalCartView и CartItemViewSet
 
 # Если CartItemViewSet все еще нужен для /api/items/, его роутер можно оставить или переделать на path()
 # Для чистоты эксперимента с GET /api/cart/, оставим только MinimalCartView
@@ -22,6 +22,7 @@ urlpatterns = [
     # path('', include(router.urls)), # Закомментировано
     # path('', include(cart_item_router.urls)), # Закомментировано
     path('', MinimalCartView.as_view(), name='minimal-cart'), # /api/cart/ будет обрабатываться MinimalCartView.get()
+    path('batch/', CartBatchView.as_view(), name='cart-batch'), # Пакет операций add / set / remove одним запросом
     path('', include(router_items.urls)), # Это добавит /api/cart/items/ (если основной urls.py path('api/cart/', include('cart.urls')) )
     # Если вам нужны URL-ы для CartItemViewSet (например, /api/cart/items/), их нужно будет добавить отдельно.
     # Например, если ваш основной urls.py такой: path('api/cart/', include('cart.urls'))
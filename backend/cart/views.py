@@ -1,11 +1,14 @@
+from django.db import IntegrityError
 from django.shortcuts import render
 from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
-from products.models import Product, PrintingService
+from .serializers import CartBatchSerializer, CartSerializer, CartItemSerializer
+from .services import (
+    CartOperationError, add_to_cart, apply_cart_operations, cart_lines, claim_anonymous_cart, priced_lines
+)
 import logging
 from django.conf import settings
 from rest_framework.views import APIView
@@ -40,42 +43,15 @@ class _CartLogicMixin:
         session_cart_id = self.request.session.get('cart_id')
 
         if user and user.is_authenticated:
-            cart_qs = self._get_user_cart_queryset(user)
-            if cart_qs.exists():
-                cart = cart_qs.first()
-                # logger.info(f"[_CartLogicMixin._get_or_create_cart_for_user] Existing cart found: ID {cart.id}") # DEBUG
-            else:
+            # Анонимная корзина из сессии становится корзиной пользователя или сливается с ней
+            if session_cart_id and Cart.objects.filter(id=session_cart_id, user__isnull=True).exists():
+                cart = claim_anonymous_cart(user, session_cart_id)
+            if cart is None:
+                cart = self._get_user_cart_queryset(user).first()
+            if cart is None:
                 cart = Cart.objects.create(user=user)
                 created = True
                 logger.info(f"[_CartLogicMixin._get_or_create_cart_for_user] Created new cart ID {cart.id} for authenticated user {user.id}") # INFO - Ключевое событие
-            
-            # Связываем сессионную корзину с пользователем, если она есть и еще не связана
-            if session_cart_id and Cart.objects.filter(id=session_cart_id, user__isnull=True).exists():
-                session_cart_to_link = Cart.objects.get(id=session_cart_id)
-                if cart.id != session_cart_to_link.id: # Предотвращаем слияние корзины самой с собой
-                    logger.info(f"[_CartLogicMixin._get_or_create_cart_for_user] Linking session cart ID {session_cart_id} items to user cart ID {cart.id}") # INFO - Ключевое событие
-                    for item in session_cart_to_link.items.all():
-                        existing_item, item_created = cart.items.get_or_create(
-                            product=item.product,
-                            printing_service=item.printing_service,
-                            defaults={
-                                'quantity': item.quantity,
-                                'weight': item.weight, 
-                                'printing_time': item.printing_time
-                            }
-                        )
-                        if not item_created:
-                            existing_item.quantity += item.quantity
-                            if item.weight is not None: existing_item.weight = item.weight
-                            if item.printing_time is not None: existing_item.printing_time = item.printing_time
-                            existing_item.save()
-                    session_cart_to_link.delete()
-                    logger.info(f"[_CartLogicMixin._get_or_create_cart_for_user] Session cart ID {session_cart_id} deleted after merging.") # INFO
-                elif cart.id == session_cart_to_link.id and session_cart_to_link.user is None: # Сессионная корзина стала корзиной пользователя
-                    session_cart_to_link.user = user
-                    session_cart_to_link.session_key = None # Очищаем session_key
-                    session_cart_to_link.save()
-                    logger.info(f"[_CartLogicMixin._get_or_create_cart_for_user] Session cart ID {session_cart_id} assigned to user {user.id} and session_key cleared.") # INFO
 
             if save_session and self.request.session.get('cart_id') != cart.id:
                 self.request.session['cart_id'] = cart.id
@@ -102,6 +78,28 @@ class _CartLogicMixin:
         # logger.info(f"[_CartLogicMixin._get_or_create_cart_for_user] Returning cart ID: {cart.id}, Created: {created}") # DEBUG
         return cart, created
 
+    def _get_cart_for_read(self, user):
+        """
+        Корзина для чтения без записей в БД и сессию ("ленивая" корзина): None, если
+        корзины еще нет - строка Cart и cart_id в сессии появляются только при первом
+        добавлении товара (CartItemViewSet.create). Исключение - вошедший пользователь
+        с анонимной корзиной в сессии: ее нужно привязать или слить (cart/services.py).
+        """
+        session_cart_id = self.request.session.get('cart_id')
+        if user and user.is_authenticated:
+            if session_cart_id and Cart.objects.filter(id=session_cart_id, user__isnull=True).exists():
+                cart = claim_anonymous_cart(user, session_cart_id)
+                if cart is not None:
+                    return cart
+            return Cart.objects.filter(user=user).first()
+        if session_cart_id:
+            return Cart.objects.filter(id=session_cart_id, user__isnull=True).first()
+        return None
+
+    def _items_queryset(self):
+        # Позиции с суммами из аннотаций и только нужными корзине колонками (cart/services.py)
+        return priced_lines(CartItem.objects.all())
+
 class MinimalCartView(APIView, _CartLogicMixin):
     permission_classes = [AllowAny] # AllowAny, так как нам нужно обрабатывать и анонимные, и аутентифицированные корзины
 
@@ -110,12 +108,15 @@ class MinimalCartView(APIView, _CartLogicMixin):
         # logger.info(f"[MinimalCartView.get] User: {request.user}, Authentication: {'authenticated' if request.user.is_authenticated else 'anonymous'}") # DEBUG
         # logger.info(f"[MinimalCartView.get] Session cart_id BEFORE getting/creating cart: {request.session.get('cart_id')}") # DEBUG
         
-        cart, _ = self._get_or_create_cart_for_user(request.user)
+        cart = self._get_cart_for_read(request.user)
+        if cart is None:
+            # Пустая виртуальная корзина: посетитель ничего не добавлял
+            return Response([])
         
         # logger.info(f"[MinimalCartView.get] Session cart_id AFTER getting/creating cart: {request.session.get('cart_id')}") # DEBUG
         # logger.info(f"[MinimalCartView.get] Cart object retrieved/created: ID {cart.id}, User on cart: {cart.user}") # DEBUG
 
-        cart_items = cart.items.all().select_related('product__category', 'printing_service')
+        cart_items = cart_lines(cart)
         # logger.info(f"[MinimalCartView.get] Cart ID {cart.id} has {cart_items.count()} items.") # DEBUG
         
         # for i, item in enumerate(cart_items):
@@ -125,6 +126,32 @@ class MinimalCartView(APIView, _CartLogicMixin):
         # logger.info(f"[MinimalCartView.get] Serialized {cart_items.count()} cart items. Data: {serializer.data}") # DEBUG
         return Response(serializer.data)
 
+class CartBatchView(APIView, _CartLogicMixin):
+    """
+    POST /api/cart/batch/ {"operations": [{"op": "add", "product": 1, "quantity": 2},
+    {"op": "set", "item": 5, "quantity": 3}, {"op": "remove", "printing_service": 2}, ...]}
+    Корзина определяется один раз, все операции применяются в одной транзакции
+    (cart/services.py); в ответе - итоговая корзина с суммой.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        cart, _ = self._get_or_create_cart_for_user(request.user)
+        try:
+            apply_cart_operations(cart, serializer.validated_data['operations'])
+        except CartOperationError as e:
+            logger.error(f"[CartBatchView.post] Cart ID {cart.id}: rejected operations {e.errors}")
+            raise serializers.ValidationError({'operations': e.errors})
+        except IntegrityError:
+            # Позиция добавлена параллельным запросом (CartItemViewSet) между чтением и записью пакета
+            logger.warning(f"[CartBatchView.post] Cart ID {cart.id} changed concurrently")
+            return Response(
+                {'detail': 'Корзина изменилась, повторите запрос.'}, status=status.HTTP_409_CONFLICT
+            )
+        return Response(CartSerializer(cart, context={'request': request}).data)
+
 class CartViewSet(viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
@@ -133,44 +160,15 @@ class CartViewSet(viewsets.ModelViewSet):
         # logger.debug(f"[CartViewSet.get_queryset] Called for user: {self.request.user}, auth: {self.request.user.is_authenticated}")
         if self.request.user.is_authenticated:
             # logger.info(f"DEBUG_GET_QUERYSET: Authenticated user: {self.request.user} (ID: {self.request.user.id if self.request.user else 'N/A'}, Username: {self.request.user.username if self.request.user else 'N/A'})")
-            try:
-                user_cart = Cart.objects.get(user=self.request.user)
-                # logger.info(f"DEBUG_GET_QUERYSET: Standard search found cart (ID: {user_cart.id}) for request.user {self.request.user.id}")
-                
-                session_key = self.request.session.session_key
-                if session_key:
-                    session_cart_for_merge = Cart.objects.filter(session_key=session_key, user__isnull=True).first()
-                    if session_cart_for_merge and session_cart_for_merge.items.exists():
-                        if not user_cart.items.exists(): 
-                            for item in session_cart_for_merge.items.all():
-                                item.cart = user_cart
-                                item.save()
-                            session_cart_for_merge.delete()
-                        else: 
-                            for s_item in session_cart_for_merge.items.all():
-                                u_item, created = user_cart.items.get_or_create(
-                                    product=s_item.product,
-                                    printing_service=s_item.printing_service,
-                                    defaults={'quantity': s_item.quantity, 'weight': s_item.weight, 'printing_time': s_item.printing_time}
-                                )
-                                if not created:
-                                    u_item.quantity += s_item.quantity
-                                    u_item.save()
-                            session_cart_for_merge.delete()
-
-                qs = Cart.objects.filter(user=self.request.user)
-                return qs
-            except Cart.DoesNotExist:
-                session_key = self.request.session.session_key
-                if session_key:
-                    session_cart_qs = Cart.objects.filter(session_key=session_key, user__isnull=True)
-                    if session_cart_qs.exists():
-                        s_cart = session_cart_qs.first()
-                        s_cart.user = self.request.user
-                        s_cart.session_key = None
-                        s_cart.save()
-                        return Cart.objects.filter(user=self.request.user)
-                return Cart.objects.none()
+            session_key = self.request.session.session_key
+            if session_key:
+                session_cart_id = (
+                    Cart.objects.filter(session_key=session_key, user__isnull=True)
+                    .values_list('pk', flat=True).first()
+                )
+                if session_cart_id:
+                    claim_anonymous_cart(self.request.user, session_cart_id)
+            return Cart.objects.filter(user=self.request.user)
         else: 
             logger.debug(f"[CartViewSet.get_queryset] Anonymous user. Session key: {self.request.session.session_key}")
             session_key = self.request.session.session_key
@@ -224,91 +222,54 @@ class CartItemViewSet(viewsets.ModelViewSet, _CartLogicMixin):
         # cart_view.request = self.request
         # cart_view.format_kwarg = None
         # cart = cart_view.get_or_create_cart()
-        cart, _ = self._get_or_create_cart_for_user(self.request.user)
+        cart = self._get_cart_for_read(self.request.user)
         logger.info(f"[CartItemViewSet.get_queryset] Got cart ID: {cart.id if cart else 'None'}. Returning items for this cart.")
-        return CartItem.objects.filter(cart=cart)
+        if cart is None:
+            return CartItem.objects.none()
+        return self._items_queryset().filter(cart=cart).order_by('pk')
 
     def perform_create(self, serializer):
         logger.info(f"[CartItemViewSet.perform_create] START for user {self.request.user}")
-        # cart_view = CartViewSet()
-        # cart_view.request = self.request
-        # cart_view.format_kwarg = None
-        # cart = cart_view.get_or_create_cart()
         cart, cart_created = self._get_or_create_cart_for_user(self.request.user)
-        logger.info(f"[CartItemViewSet.perform_create] Got cart ID: {cart.id}. Current items: {list(cart.items.all().values('id', 'product__name', 'quantity'))}")
-
-        product_id_from_request = self.request.data.get('product')
-        service_id_from_request = self.request.data.get('printing_service')
-        
-        # Логируем validated_data особенно quantity
-        logger.info(f"[CartItemViewSet.perform_create] Serializer validated_data: {serializer.validated_data}")
-        quantity_in_validated_data = serializer.validated_data.get('quantity')
-        logger.info(f"[CartItemViewSet.perform_create] Quantity from validated_data: {quantity_in_validated_data}")
 
-        product = serializer.validated_data.get('product') # Может быть None, если ID не найден или это service
-        service = serializer.validated_data.get('printing_service') # Может быть None
-
-        # Если product/service в validated_data нет (из-за read_only), 
-        # но ID были в request.data, то нам нужны объекты product/service для filter_kwargs
-        # Код ниже был для получения product/service объектов, он нужен.
-        # Мы их не передаем в serializer.save() если они в validated_data, но используем для existing_item
-
-        product_obj_for_check = None
-        service_obj_for_check = None
-
-        if product_id_from_request:
-            try:
-                product_obj_for_check = Product.objects.get(id=product_id_from_request)
-            except Product.DoesNotExist:
-                # Это уже должно было быть обработано serializer.is_valid(), но для лога оставим
-                logger.error(f"[CartItemViewSet.perform_create] Product with ID {product_id_from_request} not found, though serializer was valid.")
-                raise serializers.ValidationError({'product': 'Product not found during perform_create logic.'})
-        elif service_id_from_request:
-            try:
-                service_obj_for_check = PrintingService.objects.get(id=service_id_from_request)
-            except PrintingService.DoesNotExist:
-                logger.error(f"[CartItemViewSet.perform_create] Service with ID {service_id_from_request} not found, though serializer was valid.")
-                raise serializers.ValidationError({'printing_service': 'Service not found during perform_create logic.'})
-
-        filter_kwargs = {'cart': cart}
-        if product_obj_for_check:
-            filter_kwargs['product'] = product_obj_for_check
-            filter_kwargs['printing_service__isnull'] = True
-        elif service_obj_for_check:
-            filter_kwargs['printing_service'] = service_obj_for_check
-            filter_kwargs['product__isnull'] = True
-        else:
-            # Ни product_id, ни service_id не были предоставлены корректно - serializer должен был это поймать
-            logger.error("[CartItemViewSet.perform_create] Neither product nor service ID was valid for filtering.")
-            # Это состояние не должно достигаться, если is_valid прошел
+        product_id = self._request_object_id('product')
+        service_id = None if product_id is not None else self._request_object_id('printing_service')
+        if product_id is None and service_id is None:
+            # Ни product, ни printing_service не переданы
+            logger.error("[CartItemViewSet.perform_create] Neither product nor service ID was provided.")
             raise serializers.ValidationError("Either product or printing_service must be provided.")
 
-        existing_item = CartItem.objects.filter(**filter_kwargs).first()
-        logger.info(f"[CartItemViewSet.perform_create] Filter kwargs for existing_item: {filter_kwargs}")
-        logger.info(f"[CartItemViewSet.perform_create] Found existing_item: {existing_item.id if existing_item else 'None'}")
-
-        if existing_item:
-            # Если товар уже есть, УВЕЛИЧИВАЕМ его количество
-            requested_quantity_to_add = serializer.validated_data.get('quantity', 1)
-            existing_item.quantity += requested_quantity_to_add
-            existing_item.save(update_fields=['quantity'])
-            logger.info(f"[CartItemViewSet.perform_create] Item ID {existing_item.id} already in cart. Quantity INCREASED by {requested_quantity_to_add} to {existing_item.quantity}.")
-            serializer.instance = existing_item # Важно для корректного ответа
-            # Не вызываем serializer.save() здесь, так как мы напрямую обновили existing_item
-            # Возвращаемся, чтобы метод create мог сформировать ответ
-            return 
-        else:
-            # Создание нового элемента (этот блок кода у вас уже должен быть корректным)
-            logger.info(f"[CartItemViewSet.perform_create] Creating new item. Quantity to be set: {quantity_in_validated_data}")
-            save_kwargs = {'cart': cart}
-            if product_obj_for_check:
-                save_kwargs['product'] = product_obj_for_check
-            if service_obj_for_check:
-                save_kwargs['printing_service'] = service_obj_for_check
-            
-            logger.info(f"[CartItemViewSet.perform_create] Calling serializer.save() with explicit kwargs: { {k: (v.id if hasattr(v, 'id') else v) for k,v in save_kwargs.items()} } PLUS quantity from validated_data") 
-            instance = serializer.save(**save_kwargs) # quantity уже в validated_data
-            logger.info(f"[CartItemViewSet.perform_create] Created new item ID {instance.id}. Actual qty in DB: {instance.quantity}, Product: {instance.product}, Service: {instance.printing_service}")
+        # Один upsert: новая позиция или +quantity к уже добавленной (cart/services.py)
+        item_id = add_to_cart(
+            cart,
+            serializer.validated_data.get('quantity', 1),
+            product_id=product_id,
+            service_id=service_id,
+            weight=serializer.validated_data.get('weight'),
+            printing_time=serializer.validated_data.get('printing_time'),
+        )
+        if item_id is None:
+            if product_id is not None:
+                logger.error(f"[CartItemViewSet.perform_create] Product with ID {product_id} not found.")
+                raise serializers.ValidationError({'product': 'Product not found.'})
+            logger.error(f"[CartItemViewSet.perform_create] Service with ID {service_id} not found.")
+            raise serializers.ValidationError({'printing_service': 'Service not found.'})
+        serializer.instance = self._items_queryset().get(pk=item_id) # Важно для корректного ответа
+        logger.info(f"[CartItemViewSet.perform_create] Cart ID {cart.id}: item ID {item_id}, quantity {serializer.instance.quantity}")
+
+    def perform_update(self, serializer):
+        serializer.save()
+        # Суммы позиции в ответе - из аннотаций, поэтому позиция перечитывается
+        serializer.instance = self._items_queryset().get(pk=serializer.instance.pk)
+
+    def _request_object_id(self, field):
+        value = self.request.data.get(field)
+        if value in (None, ''):
+            return None
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({field: 'A valid integer is required.'})
 
     def create(self, request, *args, **kwargs):
         logger.info(f"[CartItemViewSet.create] START for user {request.user}. Request data: {request.data}")
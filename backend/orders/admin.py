@@ -1,16 +1,23 @@
 from django.contrib import admin
-from .models import Order, OrderItem
+from .models import Order, OrderItem, StockReservation
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     raw_id_fields = ['product', 'printing_service']
     extra = 0
 
+class StockReservationInline(admin.TabularInline):
+    model = StockReservation
+    fields = ['product', 'quantity', 'status', 'expires_at', 'created']
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'address', 'status', 'paid', 'paid_at', 'yookassa_payment_id', 'created', 'updated']
     list_filter = ['status', 'paid', 'created', 'updated']
-    inlines = [OrderItemInline]
+    inlines = [OrderItemInline, StockReservationInline]
     raw_id_fields = ['user']
     date_hierarchy = 'created'
     ordering = ['-created']
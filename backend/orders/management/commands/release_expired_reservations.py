@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from orders.reservations import SWEEP_BATCH_SIZE, release_expired_reservations
+from products.snapshot import batched_rebuild
+
+
+class Command(BaseCommand):
+    help = 'Возвращает на склад товары из истекших резервов неоплаченных заказов (запускать по расписанию, раз в несколько минут).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        # Остатки на витрине обновляются до завершения команды, одной пересборкой на запуск
+        with batched_rebuild():
+            released = release_expired_reservations(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Снято истекших резервов: {released}'))
@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from products.models import Product, PrintingService
 
@@ -58,6 +59,19 @@ class Order(models.Model):
     def get_total_cost(self):
         return sum(item.get_cost() for item in self.items.all())
 
+    def mark_paid(self, **fields):
+        """
+        Отмечает заказ оплаченным условным UPDATE (paid=False -> True) и дополнительно
+        записывает fields. Возвращает True, только если заказ отметил этот вызов:
+        повторный или параллельный вебхук получит False, поэтому действия после
+        оплаты (фиксация резерва, популярность) выполняются один раз на заказ.
+        """
+        fields = {'paid': True, 'paid_at': timezone.now(), **fields}
+        marked = Order.objects.filter(pk=self.pk, paid=False).update(updated=timezone.now(), **fields)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return marked == 1
+
 class OrderItem(models.Model):
     order = models.ForeignKey(
         Order,
@@ -116,3 +130,47 @@ class OrderItem(models.Model):
             time_cost = self.printing_service.price_per_hour * (self.printing_time or 0)
             return base_cost + weight_cost + time_cost
         return 0
+
+
+class StockReservation(models.Model):
+    """
+    Резерв остатка товара под заказ (orders.reservations). Остаток списывается
+    с Product.stock сразу при создании резерва; оплата фиксирует резерв,
+    отмена или истечение срока возвращает количество на склад.
+    """
+    STATUS_ACTIVE = 'active'
+    STATUS_COMMITTED = 'committed'
+    STATUS_RELEASED = 'released'
+    STATUS_CHOICES = [
+        (STATUS_ACTIVE, _('active')),
+        (STATUS_COMMITTED, _('committed')),
+        (STATUS_RELEASED, _('released')),
+    ]
+
+    order = models.ForeignKey(
+        Order,
+        related_name='reservations',
+        on_delete=models.CASCADE,
+        verbose_name=_('order')
+    )
+    product = models.ForeignKey(
+        Product,
+        related_name='reservations',
+        on_delete=models.CASCADE,
+        verbose_name=_('product')
+    )
+    quantity = models.PositiveIntegerField(_('quantity'))
+    status = models.CharField(_('status'), max_length=10, choices=STATUS_CHOICES, default=STATUS_ACTIVE)
+    expires_at = models.DateTimeField(_('expires at'))
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('stock reservation')
+        verbose_name_plural = _('stock reservations')
+        indexes = [
+            # Поиск истекших резервов сборщиком release_expired_reservations
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.order_id}: {self.product_id} x {self.quantity} ({self.status})'
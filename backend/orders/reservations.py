@@ -0,0 +1,156 @@
+"""
+Резервирование остатков товаров под заказы.
+
+Резерв создается при создании платежа: остаток списывается условным
+UPDATE ... SET stock = stock - n WHERE stock >= n, поэтому два покупателя не
+могут забрать последнюю единицу одновременно - второй UPDATE просто не найдет
+строку. Блокировок таблиц нет: каждый товар обновляется отдельной строкой,
+товары заказа - в порядке id, чтобы параллельные заказы не ждали друг друга по кругу.
+
+Успешная оплата фиксирует резерв (commit_order_reservations), отмена платежа
+или заказа возвращает остаток (release_order_reservations), а истекшие резервы
+собирает команда release_expired_reservations.
+
+Меняются только остатки, поэтому оповещение - легкий сигнал stock_changed
+(products/signals.py): журнал изменений и отложенная пересборка снимка каталога,
+без сброса кэша ответов и поискового индекса на каждое оформление заказа.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from products.models import Product
+from products.signals import send_stock_changed
+from .models import StockReservation
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_MINUTES = 30
+SWEEP_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f'Недостаточно товара {product_id} на складе (нужно {requested})')
+
+
+def _expires_at():
+    minutes = getattr(settings, 'STOCK_RESERVATION_TTL_MINUTES', DEFAULT_TTL_MINUTES)
+    return timezone.now() + timedelta(minutes=minutes)
+
+
+def _order_quantities(order):
+    rows = (
+        order.items.filter(product__isnull=False)
+        .values_list('product_id')
+        .annotate(total=Sum('quantity'))
+        .order_by('product_id')
+    )
+    return dict(rows)
+
+
+def reserve_order(order):
+    """
+    Резервирует товары заказа. Если активный резерв уже есть (повторная попытка
+    оплаты), продлевает его. InsufficientStock, если какого-то товара не хватает -
+    тогда ни один остаток не меняется.
+    """
+    with transaction.atomic():
+        active = StockReservation.objects.filter(order=order, status=StockReservation.STATUS_ACTIVE)
+        if active.update(expires_at=_expires_at()):
+            return
+        if StockReservation.objects.filter(order=order, status=StockReservation.STATUS_COMMITTED).exists():
+            return
+        quantities = _order_quantities(order)
+        if not quantities:
+            return
+        for product_id, quantity in quantities.items():
+            taken = Product.objects.filter(pk=product_id, stock__gte=quantity).update(stock=F('stock') - quantity)
+            if not taken:
+                raise InsufficientStock(product_id, quantity)
+        expires_at = _expires_at()
+        StockReservation.objects.bulk_create([
+            StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in quantities.items()
+        ])
+        send_stock_changed(list(quantities))
+    logger.info(f"[Reservations] Заказ {order.id}: зарезервировано {quantities}")
+
+
+def commit_order_reservations(order):
+    """
+    Фиксирует резерв оплаченного заказа. Если резерв успел истечь и остаток
+    вернулся на склад, товары списываются заново; если их уже нет - ошибка в лог
+    (заказ оплачен, нужна ручная обработка).
+    """
+    committed = (
+        StockReservation.objects
+        .filter(order=order, status=StockReservation.STATUS_ACTIVE)
+        .update(status=StockReservation.STATUS_COMMITTED)
+    )
+    if committed or StockReservation.objects.filter(order=order, status=StockReservation.STATUS_COMMITTED).exists():
+        return
+    try:
+        with transaction.atomic():
+            reserve_order(order)
+            StockReservation.objects.filter(
+                order=order, status=StockReservation.STATUS_ACTIVE
+            ).update(status=StockReservation.STATUS_COMMITTED)
+    except InsufficientStock as e:
+        logger.error(f"[Reservations] Заказ {order.id} оплачен, но резерв истек и товара больше нет: {e}")
+
+
+def _release(reservations):
+    """Возвращает на склад активные резервы из queryset. Возвращает число снятых резервов."""
+    with transaction.atomic():
+        # skip_locked: резерв, который сейчас фиксирует вебхук или снимает другой сборщик, пропускаем
+        rows = list(
+            reservations.filter(status=StockReservation.STATUS_ACTIVE)
+            .select_for_update(skip_locked=True)
+            .values_list('pk', 'product_id', 'quantity')
+        )
+        if not rows:
+            return 0
+        StockReservation.objects.filter(pk__in=[pk for pk, _, _ in rows]).update(status=StockReservation.STATUS_RELEASED)
+        quantities = defaultdict(int)
+        for _, product_id, quantity in rows:
+            quantities[product_id] += quantity
+        for product_id in sorted(quantities):
+            Product.objects.filter(pk=product_id).update(stock=F('stock') + quantities[product_id])
+        send_stock_changed(sorted(quantities))
+    return len(rows)
+
+
+def release_order_reservations(order):
+    released = _release(StockReservation.objects.filter(order=order))
+    if released:
+        logger.info(f"[Reservations] Заказ {order.id}: резерв снят ({released} поз.)")
+    return released
+
+
+def release_expired_reservations(now=None, batch_size=SWEEP_BATCH_SIZE):
+    """Снимает истекшие резервы пачками по batch_size. Возвращает число снятых резервов."""
+    now = now or timezone.now()
+    total = 0
+    while True:
+        batch_ids = list(
+            StockReservation.objects
+            .filter(status=StockReservation.STATUS_ACTIVE, expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch_ids:
+            break
+        released = _release(StockReservation.objects.filter(pk__in=batch_ids))
+        total += released
+        if released < len(batch_ids):
+            # Остальные заблокированы параллельной обработкой - вернемся к ним в следующий запуск
+            break
+    return total
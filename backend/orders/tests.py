@@ -1,3 +1,195 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db.models import Max
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from products.cache import get_catalog_version
+from products.models import CatalogChange, Category, Product, ProductPopularity
+from products.popularity import record_paid_order
+from products.signals import catalog_changed
+from products import snapshot
+from products.snapshot import write_snapshot
+from .models import Order, OrderItem, StockReservation
+from .reservations import (
+    InsufficientStock, commit_order_reservations, release_expired_reservations,
+    release_order_reservations, reserve_order,
+)
+
+User = get_user_model()
+
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='buyer123')
+        category = Category.objects.create(name='Stock', slug='stock')
+        self.figure = Product.objects.create(name='Figure', slug='figure', price=Decimal('10.00'), category=category, stock=3)
+        self.stand = Product.objects.create(name='Stand', slug='stand', price=Decimal('5.00'), category=category, stock=1)
+
+    def _order(self, *items):
+        order = Order.objects.create(user=self.user, address='Somewhere')
+        for product, quantity in items:
+            OrderItem.objects.create(order=order, product=product, price=product.price, quantity=quantity)
+        return order
+
+    def _stock(self):
+        self.figure.refresh_from_db()
+        self.stand.refresh_from_db()
+        return self.figure.stock, self.stand.stock
+
+    def test_reserve_is_all_or_nothing(self):
+        first = self._order((self.figure, 2), (self.stand, 1))
+        reserve_order(first)
+        self.assertEqual(self._stock(), (1, 0))
+        self.assertEqual(first.reservations.filter(status=StockReservation.STATUS_ACTIVE).count(), 2)
+
+        # Последний Stand уже в резерве - Figure второго заказа тоже не списывается
+        second = self._order((self.figure, 1), (self.stand, 1))
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_order(second)
+        self.assertEqual(raised.exception.product_id, self.stand.pk)
+        self.assertEqual(self._stock(), (1, 0))
+        self.assertFalse(second.reservations.exists())
+
+        # Повторная попытка оплаты первого заказа только продлевает резерв
+        reserve_order(first)
+        self.assertEqual(self._stock(), (1, 0))
+
+    def test_commit_and_release(self):
+        paid = self._order((self.figure, 1))
+        cancelled = self._order((self.figure, 2))
+        reserve_order(paid)
+        reserve_order(cancelled)
+        commit_order_reservations(paid)
+        self.assertEqual(release_order_reservations(cancelled), 1)
+        self.assertEqual(release_order_reservations(cancelled), 0)
+        self.assertEqual(release_order_reservations(paid), 0) # оплаченный резерв не возвращается
+        self.assertEqual(self._stock(), (2, 1))
+        self.assertEqual(paid.reservations.get().status, StockReservation.STATUS_COMMITTED)
+
+    def test_sweeper_releases_only_expired(self):
+        expired = self._order((self.figure, 2))
+        fresh = self._order((self.stand, 1))
+        reserve_order(expired)
+        reserve_order(fresh)
+        expired.reservations.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(release_expired_reservations(batch_size=1), 1)
+        self.assertEqual(self._stock(), (3, 0))
+        self.assertEqual(fresh.reservations.get().status, StockReservation.STATUS_ACTIVE)
+
+    def test_commit_after_expiry_takes_stock_again(self):
+        order = self._order((self.figure, 2))
+        reserve_order(order)
+        order.reservations.update(expires_at=timezone.now() - timedelta(minutes=1))
+        release_expired_reservations()
+        self.assertEqual(self._stock(), (3, 1))
+        commit_order_reservations(order)
+        self.assertEqual(self._stock(), (1, 1))
+        self.assertEqual(order.reservations.filter(status=StockReservation.STATUS_COMMITTED).count(), 1)
+
+    def test_admin_cancel_releases_reservation(self):
+        order = self._order((self.stand, 1))
+        reserve_order(order)
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_superuser(username='orders_admin', email='orders_admin@example.com', password='admin123'))
+        response = client.patch(reverse('management-order-detail', kwargs={'pk': order.pk}), {'status': 'cancelled'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self._stock(), (3, 1))
+
+
+class OrderMarkPaidTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='payer', email='payer@example.com', password='payer123')
+        category = Category.objects.create(name='Paid', slug='paid')
+        self.product = Product.objects.create(name='Paid', slug='paid', price=Decimal('10.00'), category=category, stock=5)
+        self.order = Order.objects.create(user=self.user, address='Somewhere', status='pending')
+        OrderItem.objects.create(order=self.order, product=self.product, price=self.product.price, quantity=2)
+
+    def test_only_one_of_concurrent_deliveries_marks_order_paid(self):
+        # Два вебхука прочитали заказ до оплаты
+        first, second = Order.objects.get(pk=self.order.pk), Order.objects.get(pk=self.order.pk)
+        self.assertTrue(first.mark_paid(status='processing'))
+        self.assertFalse(second.mark_paid(status='processing'))
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.paid)
+        self.assertIsNotNone(self.order.paid_at)
+        self.assertEqual(self.order.status, 'processing')
+
+    def test_popularity_is_counted_once_per_order(self):
+        for order in (Order.objects.get(pk=self.order.pk), Order.objects.get(pk=self.order.pk)):
+            if order.mark_paid(status='processing'):
+                record_paid_order(order)
+        self.assertEqual(ProductPopularity.objects.get(product=self.product).units_30d, 2)
+
+
+class StockChangeSignalTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='light', email='light@example.com', password='light123')
+        category = Category.objects.create(name='Light', slug='light')
+        self.product = Product.objects.create(name='Light', slug='light', price=Decimal('10.00'), category=category, stock=5)
+        self.order = Order.objects.create(user=self.user, address='Somewhere')
+        OrderItem.objects.create(order=self.order, product=self.product, price=self.product.price, quantity=2)
+        self.catalog_signals = []
+        receiver = lambda sender, **kwargs: self.catalog_signals.append(sender)
+        catalog_changed.connect(receiver)
+        self.addCleanup(catalog_changed.disconnect, receiver)
+
+    def test_reservation_skips_full_catalog_invalidation(self):
+        version = get_catalog_version()
+        head = CatalogChange.objects.aggregate(head=Max('id'))['head'] or 0
+        reserve_order(self.order)
+        release_order_reservations(self.order)
+        self.assertEqual(self.catalog_signals, [])
+        self.assertEqual(get_catalog_version(), version)
+        # Лента изменений получает остатки
+        self.assertEqual(
+            list(CatalogChange.objects.filter(id__gt=head).values_list('kind', 'object_id')),
+            [(CatalogChange.KIND_PRODUCT, self.product.pk)] * 2
+        )
+
+    def test_snapshot_is_rebuilt_in_place_after_commit(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'catalog.bin')
+            with override_settings(CATALOG_SNAPSHOT_PATH=path, CATALOG_SNAPSHOT_REBUILD_DELAY=0):
+                write_snapshot()
+                with self.captureOnCommitCallbacks(execute=True):
+                    reserve_order(self.order)
+                response = APIClient().get(reverse('product-detail', kwargs={'pk': self.product.pk}))
+        self.assertEqual(response.data['stock'], 3)
+
+
+class ReleaseExpiredCommandTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sweeper', email='sweeper@example.com', password='sweeper123')
+        category = Category.objects.create(name='Sweep', slug='sweep')
+        self.product = Product.objects.create(name='Sweep', slug='sweep', price=Decimal('10.00'), category=category, stock=5)
+        for _ in range(2):
+            order = Order.objects.create(user=self.user, address='Somewhere')
+            OrderItem.objects.create(order=order, product=self.product, price=self.product.price, quantity=1)
+            reserve_order(order)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+    def test_command_refreshes_snapshot_once(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'catalog.bin')
+            with override_settings(CATALOG_SNAPSHOT_PATH=path):
+                write_snapshot()
+                version = get_catalog_version()
+                with mock.patch.object(snapshot, '_refresh', wraps=snapshot._refresh) as refresh:
+                    call_command('release_expired_reservations', '--batch-size', '1', stdout=io.StringIO())
+                response = APIClient().get(reverse('product-detail', kwargs={'pk': self.product.pk}))
+        # Две пачки - одна пересборка
+        self.assertEqual(refresh.call_count, 1)
+        self.assertNotEqual(get_catalog_version(), version)
+        self.assertEqual(response.data['stock'], 5)
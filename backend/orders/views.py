@@ -5,6 +5,8 @@ from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from django.conf import settings
 import stripe
+from products.popularity import record_paid_order
+from .reservations import InsufficientStock, commit_order_reservations, release_order_reservations, reserve_order
 from .models import Order, OrderItem
 from .serializers import OrderSerializer, OrderItemSerializer
 
@@ -49,6 +51,10 @@ class OrderViewSet(viewsets.ModelViewSet):
     @action(detail=True, methods=['post'], url_path='payment')
     def create_payment(self, request, pk=None):
         order = self.get_object()
+        try:
+            reserve_order(order)
+        except InsufficientStock as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
         
         try:
             # Создаем платежную сессию Stripe
@@ -75,6 +81,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             })
             
         except Exception as e:
+            release_order_reservations(order)
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
@@ -89,10 +96,11 @@ class OrderViewSet(viewsets.ModelViewSet):
             session = stripe.checkout.Session.retrieve(session_id)
             
             if session.payment_status == 'paid':
-                order.paid = True
-                order.stripe_payment_id = session.payment_intent
-                order.status = 'processing'
-                order.save()
+                # Условный UPDATE: повторное подтверждение не считает заказ второй раз
+                newly_paid = order.mark_paid(stripe_payment_id=session.payment_intent, status='processing')
+                if newly_paid:
+                    commit_order_reservations(order)
+                    record_paid_order(order)
                 
                 return Response({'status': 'Payment confirmed'})
             
@@ -125,8 +133,8 @@ class OrderManagementViewSet(viewsets.ModelViewSet):
     # search_fields = ['id', 'user__email', 'address']
     # ordering_fields = ['created', 'status', 'total_cost']
 
-    # perform_update можно переопределить для кастомной логики, 
-    # например, отправки уведомлений при смене статуса
-    # def perform_update(self, serializer):
-    #     # ... ваша логика ...
-    #     super().perform_update(serializer)
+    def perform_update(self, serializer):
+        order = serializer.save()
+        # Отмененный заказ больше не держит товары
+        if order.status == 'cancelled' and not order.paid:
+            release_order_reservations(order)
@@ -18,7 +18,9 @@ from yookassa.domain.request.payment_request_builder import PaymentRequestBuilde
 from yookassa.domain.notification import WebhookNotification # Убедимся, что правильный класс импортирован
 from yookassa.domain.exceptions import ApiError, BadRequestError, ForbiddenError, NotFoundError, TooManyRequestsError, UnauthorizedError
 from orders.models import Order # <--- Добавленный импорт
+from orders.reservations import InsufficientStock, commit_order_reservations, release_order_reservations, reserve_order
 from cart.models import Cart # <--- Добавленный импорт
+from products.popularity import record_paid_order
 from .emails import send_payment_success_email_to_user, send_payment_cancelled_email_to_user # <--- Новый импорт
 
 # Импорты для DRF APIView
@@ -137,6 +139,13 @@ class CreateYookassaPaymentView(APIView):
             
             logger.info(f"[YooKassa] Return URL для заказа {order_id} будет: {return_url_for_yookassa}")
 
+            # Резервируем товары до оплаты: без резерва последнюю единицу могут оплатить двое
+            try:
+                reserve_order(order)
+            except InsufficientStock as e:
+                logger.warning(f"[YooKassa] Заказ ID: {order_id} не может быть оплачен: {e}")
+                return Response({"status": "error", "message": "Некоторых товаров из заказа уже нет в наличии в нужном количестве."}, status=drf_status.HTTP_409_CONFLICT)
+
             builder = PaymentRequestBuilder()
             builder.set_amount({"value": f"{order_amount:.2f}", "currency": Currency.RUB})
             builder.set_capture(True)
@@ -146,7 +155,11 @@ class CreateYookassaPaymentView(APIView):
             payment_request_payload = builder.build()
 
             logger.debug(f"[YooKassa] Payload для создания платежа (Order ID: {order_id}): {payment_request_payload}")
-            payment_response = Payment.create(payment_request_payload, idempotence_key)
+            try:
+                payment_response = Payment.create(payment_request_payload, idempotence_key)
+            except Exception:
+                release_order_reservations(order)
+                raise
             confirmation_url = payment_response.confirmation.confirmation_url
 
             order.yookassa_payment_id = payment_response.id
@@ -333,14 +346,19 @@ def yookassa_webhook_view(request: HttpRequest):
             # --- Логика обработки статусов платежа --- 
             if payment_data.status == 'succeeded':
                 if payment_data.paid:
-                    if order.paid:
+                    # Условный UPDATE: из параллельных повторов вебхука заказ отметит только один
+                    if order.paid or not order.mark_paid(status='processing', yookassa_payment_id=order.yookassa_payment_id):
                         logger.info(f"[YooKassa Webhook] Заказ {order.id} уже был отмечен как оплаченный. Повторный вебхук 'succeeded'.")
                     else:
-                        order.paid = True
-                        order.paid_at = timezone.now()
-                        order.status = 'processing'
-                        order.save(update_fields=['paid', 'paid_at', 'status', 'yookassa_payment_id'])
                         logger.info(f"[YooKassa Webhook] УСПЕХ: Заказ {order.id} (YK ID: {yk_payment_id}) обновлен: paid=True, status='processing', paid_at={order.paid_at}")
+                        try:
+                            commit_order_reservations(order)
+                        except Exception as reservation_exc:
+                            logger.error(f"[YooKassa Webhook] Ошибка фиксации резерва товаров для заказа {order.id}: {reservation_exc}")
+                        try:
+                            record_paid_order(order)
+                        except Exception as popularity_exc:
+                            logger.error(f"[YooKassa Webhook] Ошибка обновления популярности товаров для заказа {order.id}: {popularity_exc}")
                         try:
                             send_payment_success_email_to_user(order)
                         except Exception as email_exc:
@@ -384,6 +402,10 @@ def yookassa_webhook_view(request: HttpRequest):
                     # order.yookassa_payment_id = None # Опционально, если хотите разрешить новую попытку оплаты для ЭТОГО же заказа
                     order.save(update_fields=['status', 'yookassa_payment_id'])
                     logger.info(f"[YooKassa Webhook] Статус заказа {order.id} обновлен на '{order.status}' после отмены платежа ЮKassa.")
+                    try:
+                        release_order_reservations(order)
+                    except Exception as reservation_exc:
+                        logger.error(f"[YooKassa Webhook] Ошибка снятия резерва товаров для заказа {order.id}: {reservation_exc}")
                     # Отправляем email пользователю об отмене
                     cancellation_details = payment_data.cancellation_details
                     reason_for_email = cancellation_details.reason if cancellation_details else "не указана"
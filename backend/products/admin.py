@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Category, Product, PrintingService, PrintingMaterial
+from django import forms
+from .models import Category, Product, PrintingService, PrintingMaterial, MaterialProperty
 from django.utils.html import format_html
 
 @admin.register(Category)
@@ -20,16 +21,39 @@ class ProductAdmin(admin.ModelAdmin):
     date_hierarchy = 'created'
     ordering = ['name']
 
+@admin.register(MaterialProperty)
+class MaterialPropertyAdmin(admin.ModelAdmin):
+    list_display = ['name']
+    search_fields = ['name']
+    ordering = ['name']
+
 @admin.register(PrintingMaterial)
 class PrintingMaterialAdmin(admin.ModelAdmin):
     list_display = ['name', 'price_multiplier', 'color']
     list_filter = ['price_multiplier']
     list_editable = ['price_multiplier', 'color']
-    search_fields = ['name', 'description', 'properties']
+    search_fields = ['name', 'description', 'properties__name']
+    filter_horizontal = ['properties']
     ordering = ['name']
 
+class PrintingServiceAdminForm(forms.ModelForm):
+    # Особенности услуги редактируются одной строкой через запятую, как раньше
+    features = forms.CharField(label='Особенности', required=False, help_text='Через запятую')
+
+    class Meta:
+        model = PrintingService
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.initial['features'] = ', '.join(self.instance.get_features())
+
+    def clean_features(self):
+        return [feature.strip() for feature in self.cleaned_data['features'].split(',') if feature.strip()]
+
 @admin.register(PrintingService)
 class PrintingServiceAdmin(admin.ModelAdmin):
+    form = PrintingServiceAdminForm
     list_display = ['name', 'base_price', 'image_preview', 'available', 'estimated_delivery_days']
     list_filter = ['available', 'materials']
     list_editable = ['base_price', 'available', 'estimated_delivery_days']
@@ -0,0 +1,66 @@
+"""
+Массовое изменение цен и остатков товаров одним UPDATE.
+
+Все выражения считаются в БД (F() + Round/Greatest), строки блокируются
+select_for_update в той же транзакции, после обновления отправляется один
+сигнал catalog_changed со списком затронутых товаров.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, F, IntegerField, Value
+from django.db.models.functions import Cast, Greatest, Round
+from django.utils import timezone
+
+from .models import Product
+from .signals import send_catalog_changed
+
+PRICE_FIELD = Product._meta.get_field('price')
+
+
+def _price_expression(rules):
+    if 'price_set' in rules:
+        price = Value(rules['price_set'])
+    elif 'price_percent' in rules:
+        price = F('price') * Value(1 + rules['price_percent'] / Decimal(100))
+    elif 'price_delta' in rules:
+        price = F('price') + Value(rules['price_delta'])
+    else:
+        price = F('price')
+
+    step = rules.get('price_round')
+    if step:
+        price = Round(price / Value(step)) * Value(step)
+    else:
+        price = Round(price, 2)
+    output_field = DecimalField(max_digits=PRICE_FIELD.max_digits, decimal_places=PRICE_FIELD.decimal_places)
+    return Cast(Greatest(price, Value(Decimal('0'))), output_field=output_field)
+
+
+def _stock_expression(rules):
+    if 'stock_set' in rules:
+        return rules['stock_set']
+    # stock - PositiveIntegerField, уходить в минус нельзя
+    return Greatest(F('stock') + Value(rules['stock_delta']), Value(0), output_field=IntegerField())
+
+
+def bulk_update_products(queryset, rules, dry_run=False):
+    """
+    Применяет правила ProductBulkUpdateSerializer ко всем товарам queryset.
+    Возвращает количество затронутых товаров.
+    """
+    changes = {}
+    if any(name in rules for name in ('price_set', 'price_percent', 'price_delta', 'price_round')):
+        changes['price'] = _price_expression(rules)
+    if 'stock_set' in rules or 'stock_delta' in rules:
+        changes['stock'] = _stock_expression(rules)
+
+    with transaction.atomic():
+        product_ids = list(queryset.select_for_update().values_list('pk', flat=True))
+        if dry_run or not product_ids:
+            return len(product_ids)
+        # update() не выставляет auto_now
+        changes['updated'] = timezone.now()
+        Product.objects.filter(pk__in=product_ids).update(**changes)
+        send_catalog_changed(Product, product_ids)
+    return len(product_ids)
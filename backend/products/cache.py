@@ -0,0 +1,85 @@
+"""
+Версионный кэш ответов публичного каталога.
+
+Версия каталога - случайный токен в кэше Django, который меняется при любом
+изменении каталога (сигнал catalog_changed). Ключ ответа строится из версии,
+хоста и пути с отсортированными параметрами запроса, поэтому после изменения
+каталога старые записи просто перестают читаться и вытесняются по таймауту.
+Из того же ключа получается ETag: на If-None-Match с совпадающим ETag
+вьюха не выполняется и возвращается 304.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'products:catalog:version'
+DEFAULT_CACHE_TIMEOUT = 3600
+
+
+def get_catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # add() не перезапишет версию, если другой воркер успел ее создать
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def catalog_cache_key(prefix, request):
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+    )
+    signature = '|'.join([request.get_host(), request.path, repr(params)])
+    digest = hashlib.md5(signature.encode('utf-8')).hexdigest()
+    return f'products:{prefix}:{get_catalog_version()}:{digest}'
+
+
+class CatalogCacheMixin:
+    """
+    Кэширует ответы действий из catalog_cache_actions (по умолчанию list и retrieve)
+    и отдает ETag / 304 Not Modified. Подключается к публичным вьюсетам каталога.
+    """
+    catalog_cache_actions = ('list', 'retrieve')
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(super().retrieve, request, *args, **kwargs)
+
+    def _cached_response(self, handler, request, *args, **kwargs):
+        if self.action not in self.catalog_cache_actions:
+            return handler(request, *args, **kwargs)
+
+        key = catalog_cache_key(self.basename, request)
+        etag = '"%s"' % hashlib.md5(key.encode('utf-8')).hexdigest()
+        if etag in request.headers.get('If-None-Match', ''):
+            return self._finalize_cached(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+        data = cache.get(key)
+        if data is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT)
+            cache.set(key, response.data, timeout)
+        else:
+            response = Response(data)
+        return self._finalize_cached(response, etag)
+
+    def _finalize_cached(self, response, etag):
+        response['ETag'] = etag
+        # Браузер хранит ответ, но перепроверяет его по ETag при каждом запросе
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
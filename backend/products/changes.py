@@ -0,0 +1,164 @@
+"""
+Лента изменений каталога для инкрементальной синхронизации клиентов.
+
+Журнал CatalogChange пишется обработчиком catalog_changed (products/signals.py).
+Клиент хранит next_since из предыдущего ответа и запрашивает только новые
+изменения. Несколько изменений одного объекта в пределах страницы сворачиваются
+в одно; объект, которого больше нет в публичном каталоге (удален или снят
+с продажи), приходит как tombstone: action=delete, data=null.
+
+Номера изменений выдаются при вставке, а видны читателям при коммите: транзакция
+с меньшим номером может закоммититься позже, чем клиент прочитал больший номер,
+и он бы ее пропустил. Поэтому лента отдает только записи старше
+CATALOG_CHANGES_SAFETY_LAG секунд - к этому времени транзакции, писавшие в журнал,
+уже завершены (транзакции дольше запаса по-прежнему могут быть пропущены).
+
+Журнал хранится CATALOG_CHANGES_RETENTION_DAYS дней (manage.py prune_catalog_changes).
+Курсор старше хранимого диапазона получает ResyncRequired (410 в API): клиент
+перезагружает каталог целиком и продолжает с next_since из ответа.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import CatalogChange, Category, Product, PrintingService
+from .serializers import CategorySerializer, ProductSerializer, PrintingServiceSerializer
+
+
+def _public_categories(ids, request):
+    return Category.objects.filter(pk__in=ids)
+
+
+def _public_products(ids, request):
+    queryset = Product.objects.filter(pk__in=ids, available=True)
+    return ProductSerializer.optimize_queryset(queryset, request)
+
+
+def _public_services(ids, request):
+    queryset = PrintingService.objects.filter(pk__in=ids, available=True)
+    return PrintingServiceSerializer.optimize_queryset(queryset, request)
+
+
+DEFAULT_SAFETY_LAG = 5
+DEFAULT_RETENTION_DAYS = 30
+PRUNE_BATCH_SIZE = 10000
+
+
+class ResyncRequired(Exception):
+    """Часть изменений после курсора удалена из журнала; head - номер для продолжения после полной загрузки."""
+
+    def __init__(self, head):
+        self.head = head
+        super().__init__(head)
+
+
+def get_safety_lag():
+    return getattr(settings, 'CATALOG_CHANGES_SAFETY_LAG', DEFAULT_SAFETY_LAG)
+
+
+def get_retention_days():
+    return getattr(settings, 'CATALOG_CHANGES_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+
+
+def visible_changes():
+    """Записи журнала, которые можно отдавать клиентам (старше запаса на незавершенные транзакции)."""
+    queryset = CatalogChange.objects.all()
+    lag = get_safety_lag()
+    if lag > 0:
+        queryset = queryset.filter(created__lt=timezone.now() - timedelta(seconds=lag))
+    return queryset
+
+
+# kind -> (загрузка объектов публичного каталога, сериализатор)
+FEED_SOURCES = {
+    CatalogChange.KIND_CATEGORY: (_public_categories, CategorySerializer),
+    CatalogChange.KIND_PRODUCT: (_public_products, ProductSerializer),
+    CatalogChange.KIND_SERVICE: (_public_services, PrintingServiceSerializer),
+}
+
+
+def resolve_since(value):
+    """
+    Номер изменения, после которого отдавать ленту. Принимает номер (next_since
+    из прошлого ответа) или дату-время ISO 8601. ValueError при неверном значении.
+    """
+    value = (value or '0').strip()
+    if value.isdigit():
+        return int(value)
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValueError(value)
+    last_before = (
+        CatalogChange.objects.filter(created__lt=moment)
+        .order_by('-id').values_list('id', flat=True).first()
+    )
+    return last_before or 0
+
+
+def build_change_feed(since, limit, request, context):
+    # Самая старая запись не удаляется при очистке, поэтому разрыв перед ней - удаленные изменения
+    oldest = CatalogChange.objects.aggregate(oldest=Min('id'))['oldest']
+    if oldest is not None and since < oldest - 1:
+        raise ResyncRequired(visible_changes().aggregate(head=Max('id'))['head'] or since)
+
+    rows = list(visible_changes().filter(id__gt=since).order_by('id')[:limit])
+
+    latest = {}
+    for row in rows:
+        # Переставляем в конец: порядок ленты - по последнему изменению объекта
+        latest.pop((row.kind, row.object_id), None)
+        latest[(row.kind, row.object_id)] = row
+
+    data_by_key = {}
+    for kind, (load_objects, serializer_class) in FEED_SOURCES.items():
+        ids = [
+            object_id for (row_kind, object_id), row in latest.items()
+            if row_kind == kind and row.action == CatalogChange.ACTION_UPSERT
+        ]
+        if not ids:
+            continue
+        objects = list(load_objects(ids, request))
+        serialized = serializer_class(objects, many=True, context=context).data
+        for obj, data in zip(objects, serialized):
+            data_by_key[(kind, obj.pk)] = data
+
+    changes = []
+    for key, row in latest.items():
+        data = data_by_key.get(key)
+        changes.append({
+            'seq': row.id,
+            'kind': row.kind,
+            'id': row.object_id,
+            'action': CatalogChange.ACTION_UPSERT if data is not None else CatalogChange.ACTION_DELETE,
+            'data': data,
+        })
+    return {
+        'since': since,
+        'next_since': rows[-1].id if rows else since,
+        'has_more': len(rows) == limit,
+        'changes': changes,
+    }
+
+
+def prune_catalog_changes(retention_days=None, batch_size=PRUNE_BATCH_SIZE):
+    """
+    Удаляет записи журнала старше retention_days дней пачками по batch_size.
+    Последняя запись остается всегда - по ней видно, что курсор устарел.
+    Возвращает число удаленных записей.
+    """
+    retention_days = get_retention_days() if retention_days is None else retention_days
+    last = CatalogChange.objects.aggregate(last=Max('id'))['last']
+    if last is None:
+        return 0
+    expired = CatalogChange.objects.filter(
+        created__lt=timezone.now() - timedelta(days=retention_days), id__lt=last
+    ).order_by('id')
+    deleted = 0
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += CatalogChange.objects.filter(id__in=ids).delete()[0]
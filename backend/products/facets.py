@@ -0,0 +1,92 @@
+"""
+Фасеты каталога для фильтров на фронтенде: количество товаров по категориям,
+гистограмма цен, min/max цены и количество товаров в наличии.
+
+Все считается одним GROUP BY-запросом по (категория, корзина цены, наличие)
+поверх уже отфильтрованного ProductFilter queryset, сворачивание - в Python.
+Результат кэшируется по сигнатуре фильтра и версии каталога (products.cache),
+поэтому любое изменение каталога делает старые записи недоступными.
+"""
+import hashlib
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, F, IntegerField, Max, Min, Value, When
+from django.db.models.functions import Floor
+
+from .cache import DEFAULT_CACHE_TIMEOUT, get_catalog_version
+
+DEFAULT_PRICE_STEP = 500
+
+
+def cache_key(params):
+    """params - пары (параметр, значение), влияющие на результат."""
+    signature = '&'.join(f'{key}={value}' for key, value in sorted(params))
+    digest = hashlib.md5(signature.encode('utf-8')).hexdigest()
+    return f'products:facets:{get_catalog_version()}:{digest}'
+
+
+def compute_facets(queryset, price_step):
+    price_step = Decimal(price_step)
+    rows = (
+        queryset
+        .order_by()
+        .annotate(
+            price_bucket=Floor(F('price') / Value(price_step)),
+            in_stock=Case(When(stock__gt=0, then=Value(1)), default=Value(0), output_field=IntegerField()),
+        )
+        .values('category_id', 'category__slug', 'category__name', 'price_bucket', 'in_stock')
+        .annotate(count=Count('id'), min_price=Min('price'), max_price=Max('price'))
+    )
+
+    categories = {}
+    buckets = {}
+    total = in_stock = 0
+    min_price = max_price = None
+    for row in rows:
+        count = row['count']
+        total += count
+        if row['in_stock']:
+            in_stock += count
+
+        category = categories.setdefault(row['category_id'], {
+            'id': row['category_id'],
+            'slug': row['category__slug'],
+            'name': row['category__name'],
+            'count': 0,
+        })
+        category['count'] += count
+
+        bucket = int(row['price_bucket'])
+        buckets[bucket] = buckets.get(bucket, 0) + count
+
+        if min_price is None or row['min_price'] < min_price:
+            min_price = row['min_price']
+        if max_price is None or row['max_price'] > max_price:
+            max_price = row['max_price']
+
+    return {
+        'total': total,
+        'in_stock': in_stock,
+        'price': {
+            'min': min_price,
+            'max': max_price,
+            'step': price_step,
+            'histogram': [
+                {'from': bucket * price_step, 'to': (bucket + 1) * price_step, 'count': buckets[bucket]}
+                for bucket in sorted(buckets)
+            ],
+        },
+        'categories': sorted(categories.values(), key=lambda item: (-item['count'], item['name'])),
+    }
+
+
+def get_facets(queryset, params, price_step):
+    key = cache_key(list(params) + [('price_step', price_step)])
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset, price_step)
+        timeout = getattr(settings, 'CATALOG_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT)
+        cache.set(key, facets, timeout)
+    return facets
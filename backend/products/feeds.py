@@ -0,0 +1,263 @@
+"""
+Карта сайта (sitemap.xml) и товарный фид YML (Яндекс Маркет, его же принимает
+Google Merchant) для больших каталогов.
+
+Файлы пишутся потоково: товары читаются queryset.iterator(chunk_size=FEED_CHUNK_SIZE)
+и сразу уходят в gzip-файл во временном файле, который затем подменяется через
+os.replace - память не зависит от размера каталога.
+
+Карта сайта разбита на части (не больше 50 000 адресов в файле по протоколу):
+страницы сайта с услугами и блоки товаров по диапазонам id (SITEMAP_BLOCK_SIZE).
+У каждой части своя метка - для блока товаров это max(Product.updated) и число
+доступных товаров в блоке, все метки считаются одним GROUP BY. manage.py build_feeds
+(по расписанию) перестраивает только части, чья метка изменилась, а запросы
+краулеров отдают готовые файлы. Фид (цены и наличие) пишется целиком, но тоже
+только при изменении метки: к меткам товаров добавляется
+номер последней записи журнала CatalogChange, который ловит и изменения без
+updated (остатки из резервов, категории, удаления).
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from urllib.parse import urljoin
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.db.models import Count, F, IntegerField, Max, Value
+from django.utils import timezone
+
+from .models import CatalogChange, Category, Product, PrintingService
+
+logger = logging.getLogger(__name__)
+
+FEED_CHUNK_SIZE = 2000
+SITEMAP_BLOCK_SIZE = 40000
+SHOP_NAME = 'BAT3D'
+CURRENCY = 'RUR'
+
+# Публичные страницы фронтенда без параметров
+SITE_PAGES = ['/', '/shop', '/services', '/about', '/contacts']
+
+PART_PAGES = 'pages'
+PRODUCT_PART_PREFIX = 'products-'
+STATE_FILE = 'feeds.json'
+FEED_FILE = 'products.yml.gz'
+
+# Ключ кэша первой фоновой сборки: пока он есть, другие процессы ее не запускают
+BUILD_KEY = 'products:feeds-building'
+DEFAULT_BUILD_TIMEOUT = 600
+
+SITEMAP_HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+
+# Управляющие символы недопустимы в XML 1.0
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_lock = threading.Lock()
+
+
+def get_feeds_dir():
+    return getattr(settings, 'FEEDS_DIR', None)
+
+
+def sitemap_part_path(part):
+    return os.path.join(get_feeds_dir(), f'sitemap-{part}.xml.gz')
+
+
+def feed_path():
+    return os.path.join(get_feeds_dir(), FEED_FILE)
+
+
+def _text(value):
+    return escape(_INVALID_XML_CHARS.sub('', str(value)))
+
+
+def _site_url(path):
+    return urljoin(settings.SITE_URL.rstrip('/') + '/', path.lstrip('/'))
+
+
+def _write_gzip(path, chunks):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.feed-')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as out:
+            for chunk in chunks:
+                out.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def current_stamps():
+    """Метки частей карты сайта и фида по текущему состоянию БД (три запроса)."""
+    blocks = (
+        Product.objects.filter(available=True)
+        .order_by()
+        # Целочисленное деление: номер блока id
+        .annotate(block=F('id') / Value(SITEMAP_BLOCK_SIZE, output_field=IntegerField()))
+        .values('block')
+        .annotate(updated=Max('updated'), count=Count('id'))
+    )
+    parts = {
+        f'{PRODUCT_PART_PREFIX}{row["block"]}': f'{row["updated"].isoformat()}|{row["count"]}'
+        for row in blocks
+    }
+    last_service_change = (
+        CatalogChange.objects.filter(kind=CatalogChange.KIND_SERVICE).aggregate(last=Max('id'))['last']
+    )
+    parts[PART_PAGES] = str(last_service_change)
+    last_change = CatalogChange.objects.aggregate(last=Max('id'))['last']
+    signature = '|'.join([str(last_change)] + [f'{part}={parts[part]}' for part in sorted(parts)])
+    return parts, hashlib.md5(signature.encode('utf-8')).hexdigest()
+
+
+def iter_sitemap_part(part):
+    yield SITEMAP_HEADER
+    if part == PART_PAGES:
+        for page in SITE_PAGES:
+            yield f'<url><loc>{_text(_site_url(page))}</loc></url>\n'
+        services = PrintingService.objects.filter(available=True).order_by('pk').values_list('pk', flat=True)
+        for pk in services.iterator(chunk_size=FEED_CHUNK_SIZE):
+            yield f'<url><loc>{_text(_site_url(f"/service/{pk}"))}</loc></url>\n'
+    else:
+        block = int(part[len(PRODUCT_PART_PREFIX):])
+        products = (
+            Product.objects
+            .filter(available=True, id__gte=block * SITEMAP_BLOCK_SIZE, id__lt=(block + 1) * SITEMAP_BLOCK_SIZE)
+            .order_by('pk')
+            .values_list('pk', 'updated')
+        )
+        for pk, updated in products.iterator(chunk_size=FEED_CHUNK_SIZE):
+            yield (
+                f'<url><loc>{_text(_site_url(f"/product/{pk}"))}</loc>'
+                f'<lastmod>{updated.date().isoformat()}</lastmod></url>\n'
+            )
+    yield '</urlset>\n'
+
+
+def iter_product_feed(media_base_url):
+    """YML-фид доступных товаров. media_base_url - адрес бэкенда для ссылок на изображения."""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield f'<yml_catalog date={quoteattr(timezone.localtime().strftime("%Y-%m-%d %H:%M"))}>\n<shop>\n'
+    yield f'<name>{SHOP_NAME}</name>\n<company>{SHOP_NAME}</company>\n<url>{_text(_site_url("/"))}</url>\n'
+    yield f'<currencies><currency id="{CURRENCY}" rate="1"/></currencies>\n<categories>\n'
+    for pk, name in Category.objects.order_by('pk').values_list('pk', 'name').iterator(chunk_size=FEED_CHUNK_SIZE):
+        yield f'<category id="{pk}">{_text(name)}</category>\n'
+    yield '</categories>\n<offers>\n'
+    products = (
+        Product.objects.filter(available=True)
+        .order_by('pk')
+        .values_list('pk', 'category_id', 'name', 'description', 'price', 'stock', 'image')
+    )
+    for pk, category_id, name, description, price, stock, image in products.iterator(chunk_size=FEED_CHUNK_SIZE):
+        offer = [
+            f'<offer id="{pk}" available="{"true" if stock > 0 else "false"}">',
+            f'<url>{_text(_site_url(f"/product/{pk}"))}</url>',
+            f'<price>{price}</price><currencyId>{CURRENCY}</currencyId><categoryId>{category_id}</categoryId>',
+        ]
+        if image:
+            offer.append(f'<picture>{_text(urljoin(media_base_url, default_storage.url(image)))}</picture>')
+        offer.append(f'<name>{_text(name)}</name>')
+        if description:
+            offer.append(f'<description>{_text(description)}</description>')
+        offer.append('</offer>\n')
+        yield ''.join(offer)
+    yield '</offers>\n</shop>\n</yml_catalog>\n'
+
+
+def _read_state():
+    try:
+        with open(os.path.join(get_feeds_dir(), STATE_FILE), encoding='utf-8') as state_file:
+            return json.load(state_file)
+    except (OSError, ValueError):
+        return {'parts': {}, 'feed': None}
+
+
+def _write_state(state):
+    directory = get_feeds_dir()
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.feeds-state-')
+    with os.fdopen(fd, 'w', encoding='utf-8') as state_file:
+        json.dump(state, state_file)
+    os.replace(tmp_path, os.path.join(directory, STATE_FILE))
+
+
+def update_feeds(media_base_url, force=False):
+    """
+    Перестраивает устаревшие части карты сайта и фид. Возвращает состояние
+    {'parts': {часть: метка}, 'feed': метка} и список перестроенных файлов.
+    Параллельные воркеры могут перестроить один файл дважды - это безопасно,
+    файл всегда подменяется целиком.
+    """
+    with _lock:
+        old_state = _read_state()
+        parts, feed_stamp = current_stamps()
+        rebuilt = []
+        for part, stamp in parts.items():
+            if force or old_state['parts'].get(part) != stamp or not os.path.exists(sitemap_part_path(part)):
+                _write_gzip(sitemap_part_path(part), iter_sitemap_part(part))
+                rebuilt.append(f'sitemap-{part}')
+        for part in set(old_state['parts']) - set(parts):
+            # Блок товаров опустел
+            try:
+                os.unlink(sitemap_part_path(part))
+            except FileNotFoundError:
+                pass
+        if force or old_state.get('feed') != feed_stamp or not os.path.exists(feed_path()):
+            _write_gzip(feed_path(), iter_product_feed(media_base_url))
+            rebuilt.append('feed')
+        state = {'parts': parts, 'feed': feed_stamp}
+        if state != old_state:
+            _write_state(state)
+        if rebuilt:
+            logger.info(f"[Feeds] Перестроено: {', '.join(rebuilt)}")
+        return state, rebuilt
+
+
+def get_media_base_url():
+    """Адрес бэкенда для ссылок на изображения в фиде (FEEDS_MEDIA_BASE_URL)."""
+    return getattr(settings, 'FEEDS_MEDIA_BASE_URL', '') or None
+
+
+def _run_background_update(media_base_url):
+    try:
+        update_feeds(media_base_url)
+    except Exception as e:
+        logger.error(f"[Feeds] Ошибка первой сборки файлов: {e}", exc_info=True)
+    finally:
+        cache.delete(BUILD_KEY)
+        connection.close()
+
+
+def ensure_feeds(media_base_url):
+    """
+    Состояние файлов для ответа краулеру. Запрос отдает уже собранные файлы и
+    ничего не перестраивает - обновление по расписанию делает manage.py build_feeds.
+    Если файлов еще нет, запускается одна фоновая сборка на все процессы
+    (cache.add), а до ее завершения состояние пустое.
+    """
+    state = _read_state()
+    timeout = getattr(settings, 'FEEDS_BUILD_TIMEOUT', DEFAULT_BUILD_TIMEOUT)
+    if not state['parts'] and cache.add(BUILD_KEY, True, timeout):
+        base_url = get_media_base_url() or media_base_url
+        threading.Thread(target=_run_background_update, args=(base_url,), daemon=True).start()
+    return state
+
+
+def iter_gzip_file(path, chunk_size=64 * 1024):
+    """Распакованное содержимое gzip-файла кусками - для клиентов без Accept-Encoding: gzip."""
+    with gzip.open(path, 'rb') as source:
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
@@ -0,0 +1,229 @@
+"""
+Массовый импорт и экспорт товаров в CSV / JSONL.
+
+Импорт читает файл построчно и обрабатывает его пачками по IMPORT_CHUNK_SIZE строк:
+одна выборка существующих товаров по id/slug, одна выборка занятых slug'ов для новых
+товаров, bulk_create + bulk_update в транзакции и один сигнал catalog_changed на
+пачку. Ошибки валидации не прерывают импорт и возвращаются с номерами строк.
+
+Колонки: id, slug, name, category (slug категории), description, price, stock, available.
+Строка с id или slug существующего товара обновляет его, остальные создают новый товар.
+"""
+import csv
+import io
+import json
+import logging
+from itertools import islice
+
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Category, Product
+from .serializers import ProductImportRowSerializer
+from .signals import send_catalog_changed
+from .slugs import allocate_slugs
+
+logger = logging.getLogger(__name__)
+
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+FORMATS = (FORMAT_CSV, FORMAT_JSONL)
+CONTENT_TYPES = {FORMAT_CSV: 'text/csv', FORMAT_JSONL: 'application/x-ndjson'}
+
+EXPORT_FIELDS = ['id', 'slug', 'name', 'category', 'description', 'price', 'stock', 'available']
+REQUIRED_FOR_CREATE = ['name', 'category', 'price']
+IMPORT_CHUNK_SIZE = 500
+EXPORT_CHUNK_SIZE = 2000
+
+
+def detect_format(filename, explicit=None):
+    file_format = (explicit or filename.rsplit('.', 1)[-1]).lower()
+    if file_format == 'ndjson':
+        file_format = FORMAT_JSONL
+    if file_format not in FORMATS:
+        raise ValueError(f'Неподдерживаемый формат файла: {file_format}')
+    return file_format
+
+
+def read_rows(binary_file, file_format):
+    """Генератор (номер строки, данные или None, ошибка разбора или None)."""
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == FORMAT_CSV:
+            reader = csv.DictReader(text)
+            for row in reader:
+                # Пустые ячейки - поле не передано
+                data = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+                yield reader.line_num, data, None
+        else:
+            for line_number, line in enumerate(text, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    data = json.loads(line)
+                except ValueError as e:
+                    yield line_number, None, f'Некорректный JSON: {e}'
+                    continue
+                if not isinstance(data, dict):
+                    yield line_number, None, 'Ожидается JSON-объект'
+                    continue
+                yield line_number, data, None
+    finally:
+        # Не закрываем исходный файл вместе с оберткой
+        text.detach()
+
+
+class ProductImporter:
+    def __init__(self, chunk_size=IMPORT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.categories = dict(Category.objects.values_list('slug', 'pk'))
+
+    def run(self, rows):
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            self._import_chunk(chunk)
+        return {'created': self.created, 'updated': self.updated, 'errors': self.errors}
+
+    def _error(self, line, errors):
+        self.errors.append({'line': line, 'errors': errors})
+
+    def _validate(self, chunk):
+        valid = []
+        for line, data, parse_error in chunk:
+            if parse_error:
+                self._error(line, {'non_field_errors': [parse_error]})
+                continue
+            serializer = ProductImportRowSerializer(data=data)
+            if not serializer.is_valid():
+                self._error(line, serializer.errors)
+                continue
+            row = serializer.validated_data
+            if 'category' in row and row['category'] not in self.categories:
+                self._error(line, {'category': [f"Категория '{row['category']}' не найдена."]})
+                continue
+            valid.append((line, row))
+        return valid
+
+    def _import_chunk(self, chunk):
+        valid = self._validate(chunk)
+        if not valid:
+            return
+
+        ids = [row['id'] for _, row in valid if 'id' in row]
+        # Все slug'и пачки: для поиска по slug и для проверки переименований
+        slugs = [row['slug'] for _, row in valid if 'slug' in row]
+        existing = Product.objects.filter(Q(pk__in=ids) | Q(slug__in=slugs))
+        by_id = {product.pk: product for product in existing}
+        by_slug = {product.slug: product for product in by_id.values()}
+
+        now = timezone.now()
+        to_update = {}
+        to_create = []
+        # Slug'и, которые пачка присваивает новым и переименованным товарам
+        new_slugs = set()
+        saved_lines = []
+        for line, row in valid:
+            if 'id' in row:
+                product = by_id.get(row['id'])
+                if product is None:
+                    self._error(line, {'id': [f"Товар с id={row['id']} не найден."]})
+                    continue
+            else:
+                product = by_slug.get(row.get('slug'))
+
+            if product is None:
+                missing = [field for field in REQUIRED_FOR_CREATE if field not in row]
+                if missing:
+                    self._error(line, {field: ['Обязательное поле для нового товара.'] for field in missing})
+                    continue
+                if row.get('slug') in new_slugs:
+                    self._error(line, {'slug': [f"Slug '{row['slug']}' повторяется в файле."]})
+                    continue
+                product = Product(stock=0, available=True)
+                if 'slug' in row:
+                    new_slugs.add(row['slug'])
+                to_create.append(product)
+            else:
+                # Проверяем заранее, чтобы ошибка уникальности не отклонила всю пачку
+                if product.pk in to_update:
+                    self._error(line, {'non_field_errors': [f'Товар id={product.pk} повторяется в файле.']})
+                    continue
+                slug = row.get('slug', product.slug)
+                if slug != product.slug:
+                    owner = by_slug.get(slug)
+                    if slug in new_slugs or (owner is not None and owner.pk != product.pk):
+                        self._error(line, {'slug': [f"Slug '{slug}' уже занят."]})
+                        continue
+                    new_slugs.add(slug)
+                to_update[product.pk] = product
+            self._apply(product, row, now)
+            saved_lines.append(line)
+
+        # Slug'и для новых товаров без slug - одним запросом на пачку
+        unnamed = [product for product in to_create if not product.slug]
+        for product, slug in zip(unnamed, allocate_slugs(Product, [p.name for p in unnamed], reserved=new_slugs)):
+            product.slug = slug
+
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create(to_create, batch_size=self.chunk_size)
+                Product.objects.bulk_update(
+                    list(to_update.values()),
+                    ['slug', 'name', 'category', 'description', 'price', 'stock', 'available', 'updated'],
+                    batch_size=self.chunk_size
+                )
+                send_catalog_changed(Product, [product.pk for product in to_create] + list(to_update))
+        except DatabaseError as e:
+            logger.error(f"[Import] Ошибка сохранения пачки строк {chunk[0][0]}-{chunk[-1][0]}: {e}", exc_info=True)
+            for line in saved_lines:
+                self._error(line, {'non_field_errors': [f'Ошибка сохранения пачки: {e}']})
+            return
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    def _apply(self, product, row, now):
+        for field in ('slug', 'name', 'description', 'price', 'stock', 'available'):
+            if field in row:
+                setattr(product, field, row[field])
+        if 'category' in row:
+            product.category_id = self.categories[row['category']]
+        # bulk_update не обновляет auto_now
+        product.updated = now
+
+
+def import_products(rows, chunk_size=IMPORT_CHUNK_SIZE):
+    """Импортирует строки из read_rows(). Возвращает {'created', 'updated', 'errors'}."""
+    return ProductImporter(chunk_size).run(rows)
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: write() возвращает строку вместо записи."""
+    def write(self, value):
+        return value
+
+
+def iter_export(file_format):
+    """Построчный экспорт всех товаров (генератор строк) для StreamingHttpResponse / файла."""
+    rows = (
+        Product.objects.order_by('pk')
+        .values_list('id', 'slug', 'name', 'category__slug', 'description', 'price', 'stock', 'available')
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    if file_format == FORMAT_CSV:
+        writer = csv.writer(_Echo())
+        yield writer.writerow(EXPORT_FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            data = dict(zip(EXPORT_FIELDS, row))
+            data['price'] = str(data['price'])
+            yield json.dumps(data, ensure_ascii=False) + '\n'
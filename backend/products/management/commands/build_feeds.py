@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.feeds import get_media_base_url, update_feeds
+
+
+class Command(BaseCommand):
+    help = 'Обновление карты сайта и товарного фида YML (перестраиваются только изменившиеся части).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Перестроить все файлы')
+        parser.add_argument(
+            '--url', help='Адрес бэкенда для ссылок на изображения (по умолчанию FEEDS_MEDIA_BASE_URL)'
+        )
+
+    def handle(self, *args, **options):
+        # SITE_URL - адрес фронтенда, медиафайлы отдает бэкенд
+        media_base_url = options['url'] or get_media_base_url()
+        if not media_base_url:
+            raise CommandError('Укажите адрес бэкенда: --url или настройка FEEDS_MEDIA_BASE_URL.')
+        state, rebuilt = update_feeds(media_base_url, force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Частей карты сайта: {len(state['parts'])}, перестроено: {', '.join(rebuilt) or 'ничего'}"
+        ))
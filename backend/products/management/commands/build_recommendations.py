@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products.recommendations import TOP_K, build_recommendations
+
+
+class Command(BaseCommand):
+    help = 'Перестройка рекомендаций "часто покупают вместе" по оплаченным заказам (запускать раз в сутки).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=TOP_K, help='Сколько соседей хранить для каждого товара')
+
+    def handle(self, *args, **options):
+        count = build_recommendations(top_k=options['top_k'])
+        self.stdout.write(self.style.SUCCESS(f'Рекомендации перестроены: {count} записей'))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from products.importexport import FORMAT_CSV, FORMATS, iter_export
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка всех товаров в CSV или JSONL.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='file_format', choices=FORMATS, default=FORMAT_CSV)
+        parser.add_argument('--output', help='Файл для выгрузки (по умолчанию stdout)')
+
+    def handle(self, *args, **options):
+        lines = iter_export(options['file_format'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as target:
+                target.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
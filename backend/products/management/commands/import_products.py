@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from products.importexport import detect_format, import_products, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Массовый импорт товаров из CSV или JSONL (создание и обновление по id/slug).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу .csv или .jsonl')
+        parser.add_argument('--format', dest='file_format', choices=['csv', 'jsonl'], help='Формат, если не по расширению')
+
+    def handle(self, *args, **options):
+        try:
+            file_format = detect_format(options['path'], options['file_format'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        with open(options['path'], 'rb') as source:
+            result = import_products(read_rows(source, file_format))
+        for error in result['errors']:
+            self.stderr.write(f"Строка {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Создано: {result['created']}, обновлено: {result['updated']}, ошибок: {len(result['errors'])}"
+        ))
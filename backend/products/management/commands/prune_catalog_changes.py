@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from products.changes import PRUNE_BATCH_SIZE, get_retention_days, prune_catalog_changes
+
+
+class Command(BaseCommand):
+    help = 'Удаляет старые записи журнала изменений каталога (запускать по расписанию, раз в сутки).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Срок хранения, по умолчанию CATALOG_CHANGES_RETENTION_DAYS')
+        parser.add_argument('--batch-size', type=int, default=PRUNE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        days = get_retention_days() if options['days'] is None else options['days']
+        deleted = prune_catalog_changes(retention_days=days, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено записей журнала старше {days} дн.: {deleted}'))
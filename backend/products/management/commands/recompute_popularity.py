@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from products.popularity import recompute_popularity
+
+
+class Command(BaseCommand):
+    help = 'Полный пересчет популярности товаров и услуг по оплаченным заказам (запускать раз в сутки).'
+
+    def handle(self, *args, **options):
+        counts = recompute_popularity()
+        self.stdout.write(self.style.SUCCESS(
+            f"Популярность пересчитана: товаров {counts['product']}, услуг {counts['printing_service']}"
+        ))
@@ -0,0 +1,43 @@
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from products.snapshot import get_snapshot_path, rebuild_snapshot
+from products.warmup import DEFAULT_PAGES, get_warm_urls, warm_catalog
+
+
+class Command(BaseCommand):
+    help = 'Прогрев кэша публичных ответов каталога (запускать при деплое, после migrate).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', action='append', dest='urls',
+            help='Адрес API со схемой, например https://bat3d.ru (можно несколько; по умолчанию CATALOG_WARM_URLS)',
+        )
+        parser.add_argument('--pages', type=int, default=DEFAULT_PAGES, help='Сколько страниц списка товаров прогревать')
+
+    def handle(self, *args, **options):
+        if isinstance(cache, (LocMemCache, DummyCache)):
+            self.stdout.write(self.style.WARNING(
+                'Кэш в памяти процесса: прогретые ответы не увидят воркеры сервера (задайте REDIS_URL)'
+            ))
+
+        if get_snapshot_path():
+            started = time.perf_counter()
+            rebuild_snapshot()
+            self.stdout.write(f'snapshot  {(time.perf_counter() - started) * 1000:8.1f} ms')
+
+        warmed = failed = 0
+        total_started = time.perf_counter()
+        for base_url in options['urls'] or get_warm_urls():
+            for url, status, elapsed in warm_catalog(base_url, pages=options['pages']):
+                self.stdout.write(f'{status or "ERR":>8}  {elapsed * 1000:8.1f} ms  {url}')
+                if status == 200:
+                    warmed += 1
+                else:
+                    failed += 1
+
+        summary = f'Прогрето ответов: {warmed}, с ошибкой: {failed}, за {time.perf_counter() - total_started:.2f} с'
+        self.stdout.write(self.style.SUCCESS(summary) if not failed else self.style.WARNING(summary))
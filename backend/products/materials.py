@@ -0,0 +1,60 @@
+"""
+Справочник материалов печати в памяти процесса: id -> сериализованный материал.
+
+Материалов мало и меняются они редко, а вложены в каждую услугу (список услуг,
+корзина). Поэтому при сериализации услуги из БД читается только связь
+услуга-материал (prefetch с одними id, см. PrintingServiceSerializer),
+а данные материалов берутся отсюда. Справочник перестраивается при изменении
+материала в любом процессе: версия хранится в общем кэше и меняется
+обработчиком catalog_changed (products/signals.py).
+"""
+import threading
+import uuid
+
+from django.core.cache import cache
+
+VERSION_KEY = 'products:materials-version'
+
+_lock = threading.Lock()
+_materials = None
+_materials_version = None
+
+
+def get_materials_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # add() не перезапишет версию, если другой воркер успел ее создать
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_materials():
+    global _materials
+    _materials = None
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def _build():
+    from .models import PrintingMaterial
+    from .serializers import PrintingMaterialSerializer
+
+    materials = PrintingMaterial.objects.prefetch_related('properties')
+    return {material.pk: PrintingMaterialSerializer(material).data for material in materials}
+
+
+def get_material_dictionary(required_ids=()):
+    """
+    Справочник материалов. required_ids - id, которые должны в нем быть:
+    если какого-то нет (материал только что создан), справочник перечитывается.
+    """
+    global _materials, _materials_version
+    version = get_materials_version()
+    materials = _materials
+    if materials is not None and _materials_version == version and all(pk in materials for pk in required_ids):
+        return materials
+    with _lock:
+        if _materials is None or _materials_version != version or not all(pk in _materials for pk in required_ids):
+            _materials = _build()
+            _materials_version = version
+        return _materials
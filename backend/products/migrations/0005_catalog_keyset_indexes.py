@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_remove_printingservice_icon_printingservice_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='printingservice',
+            index=models.Index(fields=['name', 'id'], name='service_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='printingservice',
+            index=models.Index(fields=['base_price', 'id'], name='service_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+        ),
+    ]
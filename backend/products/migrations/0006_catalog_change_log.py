@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:43
+
+from django.db import migrations, models
+
+
+def seed_change_log(apps, schema_editor):
+    # Текущее состояние каталога - стартовая точка журнала для клиентов с since=0
+    CatalogChange = apps.get_model('products', 'CatalogChange')
+    sources = [
+        ('category', apps.get_model('products', 'Category')),
+        ('product', apps.get_model('products', 'Product')),
+        ('service', apps.get_model('products', 'PrintingService')),
+    ]
+    changes = [
+        CatalogChange(kind=kind, object_id=pk, action='upsert')
+        for kind, model in sources
+        for pk in model.objects.order_by('pk').values_list('pk', flat=True)
+    ]
+    CatalogChange.objects.bulk_create(changes, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_catalog_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('category', 'category'), ('product', 'product'), ('service', 'printing service')], max_length=20, verbose_name='kind')),
+                ('object_id', models.PositiveIntegerField(verbose_name='object id')),
+                ('action', models.CharField(choices=[('upsert', 'created or updated'), ('delete', 'deleted')], max_length=10, verbose_name='action')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created')),
+            ],
+            options={
+                'verbose_name': 'catalog change',
+                'verbose_name_plural': 'catalog changes',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(seed_change_log, migrations.RunPython.noop),
+    ]
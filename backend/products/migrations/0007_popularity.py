@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-17 20:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_catalog_change_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('units_7d', models.PositiveIntegerField(default=0, verbose_name='units sold, 7 days')),
+                ('units_30d', models.PositiveIntegerField(default=0, verbose_name='units sold, 30 days')),
+                ('units_90d', models.PositiveIntegerField(default=0, verbose_name='units sold, 90 days')),
+                ('revenue_7d', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='revenue, 7 days')),
+                ('revenue_30d', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='revenue, 30 days')),
+                ('revenue_90d', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='revenue, 90 days')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='updated')),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='products.product', verbose_name='product')),
+            ],
+            options={
+                'verbose_name': 'product popularity',
+                'verbose_name_plural': 'product popularity',
+                'indexes': [models.Index(fields=['-units_30d', 'product'], name='product_popularity_30d_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PrintingServicePopularity',
+            fields=[
+                ('units_7d', models.PositiveIntegerField(default=0, verbose_name='units sold, 7 days')),
+                ('units_30d', models.PositiveIntegerField(default=0, verbose_name='units sold, 30 days')),
+                ('units_90d', models.PositiveIntegerField(default=0, verbose_name='units sold, 90 days')),
+                ('revenue_7d', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='revenue, 7 days')),
+                ('revenue_30d', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='revenue, 30 days')),
+                ('revenue_90d', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='revenue, 90 days')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='updated')),
+                ('printing_service', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='products.printingservice', verbose_name='printing service')),
+            ],
+            options={
+                'verbose_name': 'printing service popularity',
+                'verbose_name_plural': 'printing service popularity',
+                'indexes': [models.Index(fields=['-units_30d', 'printing_service'], name='service_popularity_30d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,105 @@
+# Generated by Django 4.2.30 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+
+def _split(value):
+    return list(dict.fromkeys(item.strip() for item in (value or '').split(',') if item.strip()))
+
+
+def split_comma_separated(apps, schema_editor):
+    # Строки "a, b, c" -> список features и связи со справочником MaterialProperty
+    PrintingService = apps.get_model('products', 'PrintingService')
+    PrintingMaterial = apps.get_model('products', 'PrintingMaterial')
+    MaterialProperty = apps.get_model('products', 'MaterialProperty')
+
+    services = list(PrintingService.objects.only('pk', 'features'))
+    for service in services:
+        service.feature_list = _split(service.features)
+    PrintingService.objects.bulk_update(services, ['feature_list'], batch_size=500)
+
+    material_properties = {
+        material.pk: _split(material.properties)
+        for material in PrintingMaterial.objects.only('pk', 'properties')
+    }
+    names = {name for names in material_properties.values() for name in names}
+    MaterialProperty.objects.bulk_create([MaterialProperty(name=name) for name in sorted(names)])
+    property_ids = dict(MaterialProperty.objects.values_list('name', 'pk'))
+    Through = PrintingMaterial.property_list.through
+    Through.objects.bulk_create([
+        Through(printingmaterial_id=material_id, materialproperty_id=property_ids[name])
+        for material_id, names in material_properties.items()
+        for name in names
+    ], batch_size=500)
+
+
+def join_comma_separated(apps, schema_editor):
+    PrintingService = apps.get_model('products', 'PrintingService')
+    PrintingMaterial = apps.get_model('products', 'PrintingMaterial')
+
+    services = list(PrintingService.objects.only('pk', 'feature_list'))
+    for service in services:
+        service.features = ','.join(service.feature_list or [])
+    PrintingService.objects.bulk_update(services, ['features'], batch_size=500)
+
+    materials = list(PrintingMaterial.objects.prefetch_related('property_list'))
+    for material in materials:
+        material.properties = ','.join(prop.name for prop in material.property_list.all())
+    PrintingMaterial.objects.bulk_update(materials, ['properties'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_recommendation'),
+        # Заполнение поискового индекса читает features как строку
+        ('search', '0002_backend_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaterialProperty',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='name')),
+            ],
+            options={
+                'verbose_name': 'material property',
+                'verbose_name_plural': 'material properties',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='printingmaterial',
+            name='property_list',
+            field=models.ManyToManyField(blank=True, related_name='materials', to='products.materialproperty', verbose_name='properties'),
+        ),
+        migrations.AddField(
+            model_name='printingservice',
+            name='feature_list',
+            field=models.JSONField(blank=True, default=list, verbose_name='features'),
+        ),
+        migrations.RunPython(split_comma_separated, join_comma_separated),
+        migrations.RemoveField(
+            model_name='printingmaterial',
+            name='properties',
+        ),
+        migrations.RemoveField(
+            model_name='printingservice',
+            name='features',
+        ),
+        migrations.RenameField(
+            model_name='printingmaterial',
+            old_name='property_list',
+            new_name='properties',
+        ),
+        migrations.RenameField(
+            model_name='printingservice',
+            old_name='feature_list',
+            new_name='features',
+        ),
+        migrations.AddIndex(
+            model_name='printingservice',
+            index=models.Index(fields=['min_weight', 'max_weight'], name='service_weight_idx'),
+        ),
+    ]
@@ -35,16 +35,39 @@ class Product(models.Model):
         verbose_name = _('product')
         verbose_name_plural = _('products')
         ordering = ['name']
+        indexes = [
+            # Ключи keyset-пагинации каталога (см. products.pagination)
+            models.Index(fields=['name', 'id'], name='product_name_id_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+        ]
     
     def __str__(self):
         return self.name
 
+class MaterialProperty(models.Model):
+    """Свойство материала печати (прочный, гибкий, ...). Используется в фильтре услуг ?property=."""
+    name = models.CharField(_('name'), max_length=100, unique=True)
+
+    class Meta:
+        verbose_name = _('material property')
+        verbose_name_plural = _('material properties')
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
 class PrintingMaterial(models.Model):
     name = models.CharField(_('name'), max_length=100)
     description = models.TextField(_('description'))
     price_multiplier = models.DecimalField(_('price multiplier'), max_digits=4, decimal_places=2)
     color = models.CharField(_('color'), max_length=50)
-    properties = models.TextField(_('properties'), blank=True, default='')
+    properties = models.ManyToManyField(
+        MaterialProperty,
+        related_name='materials',
+        verbose_name=_('properties'),
+        blank=True
+    )
     
     class Meta:
         verbose_name = _('printing material')
@@ -52,10 +75,13 @@ class PrintingMaterial(models.Model):
         ordering = ['name']
     
     def get_properties(self):
-        return [p.strip() for p in self.properties.split(',') if p.strip()]
+        return [prop.name for prop in self.properties.all()]
     
     def set_properties(self, properties_list):
-        self.properties = ','.join(properties_list)
+        """Заменяет свойства сохраненного материала, недостающие MaterialProperty создаются."""
+        names = list(dict.fromkeys(name.strip() for name in properties_list if name.strip()))
+        MaterialProperty.objects.bulk_create([MaterialProperty(name=name) for name in names], ignore_conflicts=True)
+        self.properties.set(MaterialProperty.objects.filter(name__in=names))
     
     def __str__(self):
         return self.name
@@ -78,7 +104,8 @@ class PrintingService(models.Model):
     min_weight = models.DecimalField(_('minimum weight'), max_digits=10, decimal_places=2, default=10.00)
     max_weight = models.DecimalField(_('maximum weight'), max_digits=10, decimal_places=2, default=1000.00)
     available = models.BooleanField(_('available'), default=True)
-    features = models.TextField(_('features'), blank=True, default='')
+    # Список строк; в API по-прежнему передается строкой через запятую
+    features = models.JSONField(_('features'), blank=True, default=list)
     # icon = models.CharField(_('icon'), max_length=50, choices=ICON_CHOICES, default='speed') # Old icon field
     # icon = models.ImageField(_('icon'), upload_to='service_icons/', blank=True, null=True) # New icon field
     image = models.ImageField(_('image'), upload_to='service_images/', blank=True, null=True) # Changed from icon, removed redundant verbose_name
@@ -94,12 +121,147 @@ class PrintingService(models.Model):
         verbose_name = _('printing service')
         verbose_name_plural = _('printing services')
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name', 'id'], name='service_name_id_idx'),
+            models.Index(fields=['base_price', 'id'], name='service_price_id_idx'),
+            # Фильтры ?weight= / ?weight_min= / ?weight_max=
+            models.Index(fields=['min_weight', 'max_weight'], name='service_weight_idx'),
+        ]
     
     def get_features(self):
-        return [f.strip() for f in self.features.split(',') if f.strip()]
+        return list(self.features or [])
     
     def set_features(self, features_list):
-        self.features = ','.join(features_list)
+        self.features = [f.strip() for f in features_list if f.strip()]
     
     def __str__(self):
         return self.name
+
+
+class CatalogChange(models.Model):
+    """
+    Журнал изменений публичного каталога для инкрементальной синхронизации клиентов
+    (GET /api/products/changes/?since=<seq>). id - монотонный номер изменения.
+    """
+    KIND_CATEGORY = 'category'
+    KIND_PRODUCT = 'product'
+    KIND_SERVICE = 'service'
+    KIND_CHOICES = [
+        (KIND_CATEGORY, _('category')),
+        (KIND_PRODUCT, _('product')),
+        (KIND_SERVICE, _('printing service')),
+    ]
+    ACTION_UPSERT = 'upsert'
+    ACTION_DELETE = 'delete'
+    ACTION_CHOICES = [
+        (ACTION_UPSERT, _('created or updated')),
+        (ACTION_DELETE, _('deleted')),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(_('kind'), max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField(_('object id'))
+    action = models.CharField(_('action'), max_length=10, choices=ACTION_CHOICES)
+    created = models.DateTimeField(_('created'), auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = _('catalog change')
+        verbose_name_plural = _('catalog changes')
+        ordering = ['id']
+
+    def __str__(self):
+        return f'#{self.pk} {self.action} {self.kind} {self.object_id}'
+
+
+class PopularityStats(models.Model):
+    """
+    Материализованная популярность по оплаченным заказам за скользящие окна.
+    Пополняется при оплате заказа (products.popularity.record_paid_order)
+    и пересчитывается целиком командой recompute_popularity (раз в сутки),
+    которая в том числе убирает из окон устаревшие продажи.
+    """
+    units_7d = models.PositiveIntegerField(_('units sold, 7 days'), default=0)
+    units_30d = models.PositiveIntegerField(_('units sold, 30 days'), default=0)
+    units_90d = models.PositiveIntegerField(_('units sold, 90 days'), default=0)
+    revenue_7d = models.DecimalField(_('revenue, 7 days'), max_digits=12, decimal_places=2, default=0)
+    revenue_30d = models.DecimalField(_('revenue, 30 days'), max_digits=12, decimal_places=2, default=0)
+    revenue_90d = models.DecimalField(_('revenue, 90 days'), max_digits=12, decimal_places=2, default=0)
+    updated = models.DateTimeField(_('updated'), auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class ProductPopularity(PopularityStats):
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='popularity',
+        verbose_name=_('product')
+    )
+
+    class Meta:
+        verbose_name = _('product popularity')
+        verbose_name_plural = _('product popularity')
+        indexes = [
+            # ?ordering=popular в каталоге
+            models.Index(fields=['-units_30d', 'product'], name='product_popularity_30d_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}: {self.units_30d}'
+
+
+class PrintingServicePopularity(PopularityStats):
+    printing_service = models.OneToOneField(
+        PrintingService,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='popularity',
+        verbose_name=_('printing service')
+    )
+
+    class Meta:
+        verbose_name = _('printing service popularity')
+        verbose_name_plural = _('printing service popularity')
+        indexes = [
+            models.Index(fields=['-units_30d', 'printing_service'], name='service_popularity_30d_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.printing_service_id}: {self.units_30d}'
+
+
+class ProductRecommendation(models.Model):
+    """
+    "Часто покупают вместе": top-K соседей товара по совместным покупкам
+    в оплаченных заказах. Строится целиком командой build_recommendations
+    (products.recommendations), чтение - один запрос по индексу (product, rank).
+    """
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='recommendations',
+        verbose_name=_('product')
+    )
+    recommended = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='recommended_for',
+        verbose_name=_('recommended product')
+    )
+    rank = models.PositiveSmallIntegerField(_('rank'))
+    # Косинусная мера: совместные заказы / sqrt(заказы товара * заказы соседа)
+    score = models.FloatField(_('score'))
+
+    class Meta:
+        verbose_name = _('product recommendation')
+        verbose_name_plural = _('product recommendations')
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'rank'], name='product_recommendation_rank_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.recommended_id} ({self.score:.3f})'
@@ -0,0 +1,151 @@
+import base64
+import json
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CatalogPagination(PageNumberPagination):
+    """
+    Пагинация публичного каталога.
+
+    По умолчанию работает как обычная PageNumberPagination (page/count).
+    Если в запросе есть параметр ``cursor`` (в том числе пустой ``?cursor=``),
+    включается keyset-режим: страница выбирается условием по стабильному ключу
+    сортировки ``(поле, id)`` без COUNT(*) и без OFFSET.
+
+    Поля, по которым разрешена keyset-сортировка, берутся из атрибута вьюсета
+    ``cursor_ordering_fields`` (публичное имя -> поле модели). Направление
+    задается параметром ``?ordering=price`` / ``?ordering=-price``.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    default_cursor_ordering_fields = {'name': 'name'}
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.display_page_controls = False
+
+        self.field, self.descending = self._get_cursor_ordering(request, view)
+        cursor = self._decode_cursor(request, queryset.model)
+        reverse = bool(cursor and cursor.get('r'))
+
+        # При обратном проходе (ссылка previous) сортируем в противоположную сторону,
+        # а затем разворачиваем полученную страницу.
+        descending = self.descending != reverse
+        if cursor:
+            queryset = queryset.filter(self._keyset_condition(cursor, descending))
+        order_prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{order_prefix}{self.field}', f'{order_prefix}id')
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        if reverse:
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = cursor is not None
+        self.page_items = results
+        return results
+
+    def get_paginated_response(self, data):
+        if not getattr(self, 'cursor_mode', False):
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        if not getattr(self, 'cursor_mode', False):
+            return super().get_paginated_response_schema(schema)
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not getattr(self, 'cursor_mode', False):
+            return super().get_next_link()
+        if not self.has_next or not self.page_items:
+            return None
+        return self._encode_link(self.page_items[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not getattr(self, 'cursor_mode', False):
+            return super().get_previous_link()
+        if not self.has_previous or not self.page_items:
+            return None
+        return self._encode_link(self.page_items[0], reverse=True)
+
+    def _get_cursor_ordering(self, request, view):
+        fields = getattr(view, 'cursor_ordering_fields', None) or self.default_cursor_ordering_fields
+        default_key = next(iter(fields))
+        ordering = request.query_params.get(self.ordering_query_param) or default_key
+        descending = ordering.startswith('-')
+        key = ordering.lstrip('-')
+        if key not in fields:
+            # Неподдерживаемая для keyset сортировка - используем сортировку по умолчанию
+            return fields[default_key], False
+        return fields[key], descending
+
+    def _keyset_condition(self, cursor, descending):
+        value = cursor['v']
+        last_id = cursor['i']
+        op = 'lt' if descending else 'gt'
+        return (
+            Q(**{f'{self.field}__{op}': value}) |
+            Q(**{self.field: value, f'id__{op}': last_id})
+        )
+
+    def _decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+            cursor = {'v': payload['v'], 'i': int(payload['i']), 'r': bool(payload.get('r'))}
+            if payload.get('f') != self.field:
+                raise ValueError('cursor belongs to another ordering')
+            cursor['v'] = model._meta.get_field(self.field).to_python(cursor['v'])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def _encode_link(self, obj, reverse):
+        value = getattr(obj, self.field)
+        if isinstance(value, Decimal):
+            value = str(value)
+        payload = {'f': self.field, 'v': value, 'i': obj.pk}
+        if reverse:
+            payload['r'] = 1
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        ).decode('ascii').rstrip('=')
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
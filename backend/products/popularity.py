@@ -0,0 +1,110 @@
+"""
+Популярность товаров и услуг по оплаченным заказам (ProductPopularity,
+PrintingServicePopularity): проданные единицы и выручка за 7/30/90 дней.
+
+record_paid_order() прибавляет позиции только что оплаченного заказа ко всем
+окнам. Продажи, вышедшие за пределы окна, вычитает только полный пересчет
+recompute_popularity() - его запускает команда recompute_popularity раз в сутки.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from orders.models import OrderItem
+from .models import ProductPopularity, PrintingServicePopularity
+
+WINDOWS = (7, 30, 90)
+
+# поле OrderItem -> (модель популярности, ее поле-ссылка)
+POPULARITY_SOURCES = {
+    'product': (ProductPopularity, 'product'),
+    'printing_service': (PrintingServicePopularity, 'printing_service'),
+}
+
+
+def record_paid_order(order):
+    """Прибавляет позиции оплаченного заказа к популярности. Вызывать один раз на заказ."""
+    for item_field, (model, target_field) in POPULARITY_SOURCES.items():
+        totals = {}
+        for item in order.items.filter(**{f'{item_field}__isnull': False}):
+            units, revenue = totals.get(getattr(item, f'{item_field}_id'), (0, Decimal('0')))
+            totals[getattr(item, f'{item_field}_id')] = (units + item.quantity, revenue + item.price * item.quantity)
+        if not totals:
+            continue
+        with transaction.atomic():
+            model.objects.bulk_create(
+                [model(**{f'{target_field}_id': pk}) for pk in totals],
+                ignore_conflicts=True
+            )
+            for pk, (units, revenue) in totals.items():
+                changes = {}
+                for days in WINDOWS:
+                    changes[f'units_{days}d'] = F(f'units_{days}d') + units
+                    changes[f'revenue_{days}d'] = F(f'revenue_{days}d') + revenue
+                model.objects.filter(pk=pk).update(updated=timezone.now(), **changes)
+
+
+def _paid_since(moment):
+    # paid_at заполняется не во всех сценариях оплаты - тогда берем дату заказа
+    return Q(order__paid_at__gte=moment) | Q(order__paid_at__isnull=True, order__created__gte=moment)
+
+
+def _lock_for_recompute(model):
+    """
+    Не дает record_paid_order() менять таблицу между агрегатом и записью результата:
+    иначе прибавка заказа, оплаченного в этот момент, затиралась бы пересчетом.
+    Чтение таблицы (сортировка каталога) при этом не блокируется.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {connection.ops.quote_name(model._meta.db_table)} IN SHARE ROW EXCLUSIVE MODE')
+    else:
+        list(model.objects.select_for_update().values_list('pk', flat=True))
+
+
+def recompute_popularity(now=None):
+    """Полный пересчет обеих таблиц одним агрегирующим запросом на каждую. Возвращает число строк."""
+    now = now or timezone.now()
+    revenue = F('price') * F('quantity')
+    counts = {}
+    for item_field, (model, target_field) in POPULARITY_SOURCES.items():
+        annotations = {}
+        for days in WINDOWS:
+            since = _paid_since(now - timedelta(days=days))
+            annotations[f'units_{days}d'] = Coalesce(Sum('quantity', filter=since), 0)
+            annotations[f'revenue_{days}d'] = Coalesce(
+                Sum(revenue, filter=since, output_field=DecimalField(max_digits=12, decimal_places=2)),
+                Decimal('0'),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            )
+        rows = (
+            OrderItem.objects
+            .filter(**{f'{item_field}__isnull': False}, order__paid=True)
+            .exclude(order__status='cancelled')
+            .filter(_paid_since(now - timedelta(days=max(WINDOWS))))
+            .values(item_field)
+            .annotate(**annotations)
+            .order_by()
+        )
+        with transaction.atomic():
+            # Агрегат читается под блокировкой, в той же транзакции, что и запись
+            _lock_for_recompute(model)
+            objects = [
+                model(**{f'{target_field}_id': row.pop(item_field)}, **row)
+                for row in rows
+            ]
+            # Построчный upsert вместо delete() + bulk_create: читатели не видят пустую таблицу
+            model.objects.bulk_create(
+                objects,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=[model._meta.pk.name],
+                update_fields=[name for name in annotations] + ['updated']
+            )
+            model.objects.exclude(pk__in=[obj.pk for obj in objects]).delete()
+        counts[target_field] = len(objects)
+    return counts
@@ -0,0 +1,99 @@
+"""
+Рекомендации "часто покупают вместе" по оплаченным заказам.
+
+Матрица совместных покупок (A^T A для разреженной матрицы заказ x товар)
+считается в БД одним агрегирующим запросом: self-join позиций заказа и
+GROUP BY по паре товаров. Нормировка косинусной меры - число заказов
+с каждым товаром - берется вторым запросом. Пары читаются потоком,
+отсортированными по товару, поэтому в памяти держится только top-K
+текущего товара. Результат заменяет таблицу ProductRecommendation целиком.
+"""
+import heapq
+import math
+
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from orders.models import OrderItem
+from .cache import bump_catalog_version
+from .models import Product, ProductRecommendation
+
+TOP_K = 20
+PAIRS_CHUNK_SIZE = 5000
+WRITE_BATCH_SIZE = 1000
+
+
+def _paid_lines():
+    return (
+        OrderItem.objects
+        .filter(order__paid=True, product__isnull=False)
+        .exclude(order__status='cancelled')
+    )
+
+
+def _co_purchases():
+    """Поток (товар, сосед, число совместных заказов), отсортированный по товару."""
+    return (
+        _paid_lines()
+        .values_list('product_id', 'order__items__product_id')
+        .annotate(together=Count('order', distinct=True))
+        .order_by('product_id')
+        .iterator(chunk_size=PAIRS_CHUNK_SIZE)
+    )
+
+
+def _top_neighbours(product_id, neighbours, top_k):
+    ranked = heapq.nlargest(top_k, neighbours, key=lambda pair: (pair[1], -pair[0]))
+    return [
+        ProductRecommendation(product_id=product_id, recommended_id=other, rank=rank, score=score)
+        for rank, (other, score) in enumerate(ranked, start=1)
+    ]
+
+
+def build_recommendations(top_k=TOP_K):
+    """Полная перестройка таблицы рекомендаций. Возвращает число сохраненных строк."""
+    orders_with = dict(
+        _paid_lines().values_list('product_id').annotate(orders=Count('order', distinct=True)).order_by()
+    )
+
+    objects = []
+    current, neighbours = None, []
+    for product_id, other_id, together in _co_purchases():
+        if product_id != current:
+            if current is not None:
+                objects.extend(_top_neighbours(current, neighbours, top_k))
+            current, neighbours = product_id, []
+        # Диагональ (сам товар) и позиции-услуги без товара
+        if other_id is None or other_id == product_id:
+            continue
+        score = together / math.sqrt(orders_with[product_id] * orders_with[other_id])
+        neighbours.append((other_id, score))
+    if current is not None:
+        objects.extend(_top_neighbours(current, neighbours, top_k))
+
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        ProductRecommendation.objects.bulk_create(objects, batch_size=WRITE_BATCH_SIZE)
+        # Закэшированные ответы с рекомендациями устарели
+        transaction.on_commit(bump_catalog_version)
+    return len(objects)
+
+
+def recommendations_for(product_id):
+    """Рекомендации для карточки товара: один запрос по индексу (product, rank)."""
+    return Product.objects.filter(recommended_for__product_id=product_id, available=True).order_by('recommended_for__rank')
+
+
+def recommendations_for_many(product_ids):
+    """
+    Рекомендации для корзины: соседи всех товаров корзины, баллы суммируются,
+    сами товары корзины исключаются. Возвращает queryset пар (id товара, балл).
+    """
+    return (
+        ProductRecommendation.objects
+        .filter(product_id__in=product_ids, recommended__available=True)
+        .exclude(recommended_id__in=product_ids)
+        .values_list('recommended_id')
+        .annotate(total=Sum('score'))
+        .order_by('-total', 'recommended_id')
+    )
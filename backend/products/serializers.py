@@ -1,18 +1,153 @@
+from decimal import Decimal
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from django.db.models import Prefetch
+from .materials import get_material_dictionary
 from .models import Category, Product, PrintingService, PrintingMaterial
 
+
+class CommaSeparatedListField(serializers.Field):
+    """
+    Список строк, который в API передается строкой через запятую
+    (формат, в котором фронтенд работает с features / properties).
+    На вход принимает и строку, и JSON-список.
+    """
+    def to_representation(self, value):
+        return ','.join(value or [])
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = data.split(',')
+        elif not isinstance(data, (list, tuple)):
+            raise serializers.ValidationError('Ожидается строка через запятую или список строк.')
+        return [str(item).strip() for item in data if str(item).strip()]
+
+
+class DynamicFieldsMixin:
+    """
+    Выборочный набор полей для GET-запросов верхнего уровня:
+    ?fields=id,name,price - только перечисленные поля;
+    ?profile=card - именованный набор полей из profiles;
+    ?expand=category - вложенные объекты из expandable_fields при выборочном наборе
+    полей по умолчанию отдаются как id, а целиком - только если перечислены в expand.
+    Без fields/profile сериализатор работает как раньше.
+    """
+    profiles = {}
+    expandable_fields = {} # имя поля -> many
+    # имя поля -> prefetch-лукапы для вложенного списка (вместо самого поля)
+    relation_prefetches = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected, expand = self.get_field_selection(self.context.get('request'))
+        if selected is None:
+            return
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+            elif name in self.expandable_fields and name not in expand:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(
+                    read_only=True, many=self.expandable_fields[name]
+                )
+
+    @classmethod
+    def get_field_selection(cls, request):
+        """(набор полей или None, раскрываемые вложенные поля) для запроса."""
+        if request is None or request.method not in SAFE_METHODS:
+            return None, set()
+        params = request.query_params
+        if params.get('fields'):
+            selected = {name.strip() for name in params['fields'].split(',') if name.strip()}
+        elif params.get('profile') in cls.profiles:
+            selected = set(cls.profiles[params['profile']])
+        else:
+            return None, set()
+        expand = {name.strip() for name in params.get('expand', '').split(',')} & set(cls.expandable_fields)
+        return selected | expand, expand
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request, required_fields=()):
+        """
+        Загружает только колонки выбранных полей (.only()) и заранее подгружает
+        связанные объекты, которые попадут в ответ. required_fields - колонки,
+        которые нужны самой вьюхе помимо полей ответа.
+        """
+        selected, expand = cls.get_field_selection(request)
+        model = queryset.model
+        if selected is None:
+            selected = expand = set(cls.expandable_fields)
+            only_fields = None
+        else:
+            concrete = {field.name for field in model._meta.concrete_fields}
+            only_fields = [model._meta.pk.name, *required_fields] + sorted(name for name in selected if name in concrete)
+        for name, many in cls.expandable_fields.items():
+            if name not in selected:
+                continue
+            if many:
+                # Список id тоже читается из связи - без prefetch был бы запрос на каждый объект
+                queryset = queryset.prefetch_related(*cls.relation_prefetches.get(name, [name]))
+            elif name in expand:
+                queryset = queryset.select_related(name)
+        if only_fields is not None:
+            queryset = queryset.only(*only_fields)
+        return queryset
+
+
 class PrintingMaterialSerializer(serializers.ModelSerializer):
+    properties = CommaSeparatedListField(source='get_properties', read_only=True)
+
     class Meta:
         model = PrintingMaterial
         fields = ['id', 'name', 'description', 'price_multiplier', 'color', 'properties']
 
+def service_materials_prefetch(prefix=''):
+    """Связь услуга-материал одним запросом: из таблицы материалов читаются только id."""
+    return Prefetch(f'{prefix}materials', queryset=PrintingMaterial.objects.only('pk'))
+
+
+class MaterialDictionaryField(serializers.Field):
+    """
+    Материалы услуги: id берутся из связи (обычно уже подгруженной
+    service_materials_prefetch), данные - из справочника products.materials.
+    Справочник запрашивается один раз на корневой сериализатор (весь список),
+    а не на каждую услугу.
+    """
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_materials(self, ids):
+        root = self.root
+        materials = getattr(root, '_material_dictionary', None)
+        if materials is None or not all(pk in materials for pk in ids):
+            materials = root._material_dictionary = get_material_dictionary(required_ids=ids)
+        return materials
+
+    def to_representation(self, value):
+        ids = [material.pk for material in value.all()]
+        materials = self.get_materials(ids)
+        return [dict(materials[pk]) for pk in ids]
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'description']
         read_only_fields = []
 
-class ProductSerializer(serializers.ModelSerializer):
+class CategoryStatsSerializer(CategorySerializer):
+    """Категория для меню каталога: число доступных товаров и диапазон их цен (см. CategoryViewSet)."""
+    product_count = serializers.IntegerField(read_only=True)
+    min_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    max_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta(CategorySerializer.Meta):
+        fields = CategorySerializer.Meta.fields + ['product_count', 'min_price', 'max_price']
+
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    # Карточка товара в списке: ?profile=card
+    profiles = {'card': ['id', 'name', 'slug', 'price', 'image']}
+    expandable_fields = {'category': False}
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(),
@@ -30,8 +165,12 @@ class ProductSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created', 'updated', 'slug']
 
-class PrintingServiceSerializer(serializers.ModelSerializer):
-    materials = PrintingMaterialSerializer(many=True, read_only=True)
+class PrintingServiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    profiles = {'card': ['id', 'name', 'base_price', 'image', 'available']}
+    expandable_fields = {'materials': True}
+    relation_prefetches = {'materials': [service_materials_prefetch()]}
+    materials = MaterialDictionaryField()
+    features = CommaSeparatedListField(required=False)
     image = serializers.ImageField(required=False, allow_null=True, use_url=True)
     
     class Meta:
@@ -53,4 +192,46 @@ class PrintingServiceSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     f"{field} cannot be negative."
                 )
-        return data 
\ No newline at end of file
+        return data 
+
+class ProductImportRowSerializer(serializers.Serializer):
+    """
+    Строка импорта товаров (CSV/JSONL). Все поля необязательны: строка с id или
+    существующим slug обновляет только переданные поля, для нового товара
+    обязательность name/category/price проверяется в products.importexport.
+    """
+    id = serializers.IntegerField(required=False, min_value=1)
+    slug = serializers.SlugField(required=False, max_length=200)
+    name = serializers.CharField(required=False, max_length=200)
+    category = serializers.SlugField(required=False, max_length=200)
+    description = serializers.CharField(required=False, allow_blank=True)
+    price = serializers.DecimalField(required=False, max_digits=10, decimal_places=2, min_value=0)
+    stock = serializers.IntegerField(required=False, min_value=0)
+    available = serializers.BooleanField(required=False)
+
+
+class ProductBulkUpdateSerializer(serializers.Serializer):
+    """
+    Массовое изменение цен и остатков (products.bulk). filter - параметры ProductFilter.
+    Цена: не больше одного из price_percent / price_delta / price_set, затем
+    округление до шага price_round (например 1 или 10). Остаток: stock_delta или stock_set.
+    """
+    filter = serializers.DictField(required=False, default=dict)
+    price_percent = serializers.DecimalField(required=False, max_digits=6, decimal_places=2, min_value=-100)
+    price_delta = serializers.DecimalField(required=False, max_digits=10, decimal_places=2)
+    price_set = serializers.DecimalField(required=False, max_digits=10, decimal_places=2, min_value=0)
+    price_round = serializers.DecimalField(required=False, max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+    stock_delta = serializers.IntegerField(required=False)
+    stock_set = serializers.IntegerField(required=False, min_value=0)
+    dry_run = serializers.BooleanField(required=False, default=False)
+
+    PRICE_RULES = ['price_percent', 'price_delta', 'price_set']
+    STOCK_RULES = ['stock_delta', 'stock_set']
+
+    def validate(self, data):
+        for group in (self.PRICE_RULES, self.STOCK_RULES):
+            if len([name for name in group if name in data]) > 1:
+                raise serializers.ValidationError(f"Можно указать только одно из: {', '.join(group)}.")
+        if not any(name in data for name in self.PRICE_RULES + self.STOCK_RULES + ['price_round']):
+            raise serializers.ValidationError('Не указано ни одного изменения цены или остатка.')
+        return data
@@ -0,0 +1,143 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.db import transaction
+from django.dispatch import Signal, receiver
+from .models import CatalogChange, Category, Product, MaterialProperty, PrintingMaterial, PrintingService
+from .cache import bump_catalog_version
+from .materials import invalidate_materials
+from . import snapshot
+
+# Единая точка оповещения об изменениях каталога.
+# Отправляется с sender=<класс модели>, pks=<список id> и deleted=<bool>.
+# Поштучные изменения приходят сюда из post_save/post_delete ниже, массовые операции
+# (импорт, bulk update) вызывают send_catalog_changed() один раз на всю пачку.
+catalog_changed = Signal()
+
+
+def send_catalog_changed(model, pks, deleted=False):
+    pks = list(pks)
+    if pks:
+        catalog_changed.send(sender=model, pks=pks, deleted=deleted)
+
+
+# Изменились только остатки товаров (резервы заказов, sender=Product, pks=<список id>).
+# Легкий путь вместо catalog_changed: запись в журнал и отложенная пересборка снимка
+# без немедленного сброса кэша ответов, поискового индекса и подсказок.
+stock_changed = Signal()
+
+
+def send_stock_changed(pks):
+    pks = list(pks)
+    if pks:
+        stock_changed.send(sender=Product, pks=pks)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=PrintingMaterial)
+@receiver(post_save, sender=PrintingService)
+def catalog_object_saved(sender, instance, raw=False, **kwargs):
+    if raw: # loaddata
+        return
+    send_catalog_changed(sender, [instance.pk])
+
+
+@receiver(pre_delete, sender=PrintingMaterial)
+def material_deleting(sender, instance, **kwargs):
+    # После удаления связей с услугами уже нет - запоминаем затронутые услуги
+    instance._service_ids = list(instance.services.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=PrintingMaterial)
+@receiver(post_delete, sender=PrintingService)
+def catalog_object_deleted(sender, instance, **kwargs):
+    send_catalog_changed(sender, [instance.pk], deleted=True)
+    if sender is PrintingMaterial:
+        # Материал вложен в представление услуги: меняются только услуги с ним
+        send_catalog_changed(PrintingService, getattr(instance, '_service_ids', []))
+
+
+@receiver(m2m_changed, sender=PrintingService.materials.through)
+def service_materials_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance - материал. При clear список услуг известен только до очистки.
+        if action == 'pre_clear':
+            send_catalog_changed(PrintingService, instance.services.values_list('pk', flat=True))
+        elif action in ('post_add', 'post_remove'):
+            send_catalog_changed(PrintingService, pk_set or [])
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        send_catalog_changed(PrintingService, [instance.pk])
+
+
+@receiver(m2m_changed, sender=PrintingMaterial.properties.through)
+def material_properties_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # instance - свойство
+        if action == 'pre_clear':
+            send_catalog_changed(PrintingMaterial, instance.materials.values_list('pk', flat=True))
+        elif action in ('post_add', 'post_remove'):
+            send_catalog_changed(PrintingMaterial, pk_set or [])
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        send_catalog_changed(PrintingMaterial, [instance.pk])
+
+
+@receiver(post_save, sender=MaterialProperty)
+def material_property_saved(sender, instance, created=False, raw=False, **kwargs):
+    # Переименование свойства меняет представление материалов (и услуг с ними)
+    if not created and not raw:
+        send_catalog_changed(PrintingMaterial, instance.materials.values_list('pk', flat=True))
+
+
+@receiver(catalog_changed)
+def catalog_version_changed(sender, **kwargs):
+    # Сбрасывает кэш ответов каталога, фасетов и подсказок. Повторно - после коммита
+    # (snapshot.schedule_rebuild), когда старый снимок уже удален, чтобы не осталось
+    # ответов, закэшированных другим воркером до коммита по старым данным.
+    bump_catalog_version()
+    snapshot.mark_stale()
+    transaction.on_commit(snapshot.schedule_rebuild)
+
+
+@receiver(catalog_changed, sender=PrintingMaterial)
+def material_dictionary_changed(sender, **kwargs):
+    invalidate_materials()
+    transaction.on_commit(invalidate_materials)
+
+
+@receiver(stock_changed)
+def stock_snapshot_changed(sender, **kwargs):
+    transaction.on_commit(lambda: snapshot.schedule_rebuild(invalidate=False))
+
+
+CHANGE_KINDS = {
+    Category: CatalogChange.KIND_CATEGORY,
+    Product: CatalogChange.KIND_PRODUCT,
+    PrintingService: CatalogChange.KIND_SERVICE,
+}
+
+
+@receiver(catalog_changed)
+@receiver(stock_changed)
+def record_catalog_changes(sender, pks, deleted=False, **kwargs):
+    """Пишет изменения в журнал CatalogChange для ленты /api/products/changes/."""
+    changes = []
+    if sender in CHANGE_KINDS:
+        action = CatalogChange.ACTION_DELETE if deleted else CatalogChange.ACTION_UPSERT
+        changes += [CatalogChange(kind=CHANGE_KINDS[sender], object_id=pk, action=action) for pk in pks]
+    if sender is Category and not deleted:
+        # Категория вложена в представление товара
+        product_ids = Product.objects.filter(category_id__in=pks).values_list('pk', flat=True)
+        changes += [
+            CatalogChange(kind=CatalogChange.KIND_PRODUCT, object_id=pk, action=CatalogChange.ACTION_UPSERT)
+            for pk in product_ids
+        ]
+    elif sender is PrintingMaterial and not deleted:
+        # Материалы вложены в представление услуги. Услуги удаленного материала
+        # приходят отдельным сигналом (catalog_object_deleted).
+        services = PrintingService.objects.filter(materials__in=pks).distinct()
+        changes += [
+            CatalogChange(kind=CatalogChange.KIND_SERVICE, object_id=pk, action=CatalogChange.ACTION_UPSERT)
+            for pk in services.values_list('pk', flat=True)
+        ]
+    CatalogChange.objects.bulk_create(changes)
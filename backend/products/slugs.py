@@ -0,0 +1,77 @@
+"""
+Выделение уникальных slug'ов для моделей каталога.
+
+Вместо цикла "slugify + exists()" на каждый объект занятые slug'и с нужными
+префиксами читаются одним запросом (на пачку имен), а суффиксы -1, -2, ...
+подбираются в памяти. Поиск по префиксу идет по индексу уникального slug.
+Между выбором slug'а и INSERT его может занять параллельный запрос -
+create_with_unique_slug() повторяет сохранение в savepoint со следующим slug'ом.
+"""
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+PREFIX_QUERY_CHUNK = 500
+SLUG_RETRY_ATTEMPTS = 3
+
+
+def base_slug(model, name, max_length=None):
+    max_length = max_length or model._meta.get_field('slug').max_length
+    # slugify() без allow_unicode отбрасывает кириллицу - тогда используем имя модели
+    return (slugify(name) or model._meta.model_name)[:max_length]
+
+
+def _taken_slugs(model, bases):
+    taken = set()
+    bases = sorted(set(bases))
+    for start in range(0, len(bases), PREFIX_QUERY_CHUNK):
+        chunk = bases[start:start + PREFIX_QUERY_CHUNK]
+        # Только сам base и base-<суффикс>, а не все slug'и, начинающиеся с base
+        condition = reduce(or_, (Q(slug=base) | Q(slug__startswith=f'{base}-') for base in chunk))
+        taken.update(model.objects.filter(condition).values_list('slug', flat=True))
+    return taken
+
+
+def allocate_slugs(model, names, reserved=()):
+    """
+    Уникальные slug'и для списка имен (в том же порядке). reserved - slug'и,
+    которые уже заняты, но еще не сохранены в БД (например, предыдущими пачками импорта).
+    """
+    max_length = model._meta.get_field('slug').max_length
+    bases = [base_slug(model, name, max_length) for name in names]
+    taken = _taken_slugs(model, bases) | set(reserved)
+    counters = {} # base -> следующий суффикс для проверки
+    slugs = []
+    for base in bases:
+        slug = base
+        counter = counters.get(base, 1)
+        while slug in taken:
+            suffix = f'-{counter}'
+            slug = base[:max_length - len(suffix)] + suffix
+            counter += 1
+        counters[base] = counter
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def create_with_unique_slug(model, name, save, attempts=SLUG_RETRY_ATTEMPTS):
+    """
+    Сохраняет новый объект с уникальным slug'ом по имени: save(slug) создает объект
+    и возвращает его. Если slug успели занять между проверкой и INSERT
+    (IntegrityError на уникальном индексе), сохранение повторяется со следующим.
+    """
+    reserved = set()
+    for attempt in range(1, attempts + 1):
+        slug = allocate_slugs(model, [name], reserved=reserved)[0]
+        try:
+            with transaction.atomic():
+                return save(slug)
+        except IntegrityError:
+            # Другие нарушения целостности (не slug) повтором не исправить
+            if attempt == attempts or not model.objects.filter(slug=slug).exists():
+                raise
+            reserved.add(slug)
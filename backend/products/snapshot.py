@@ -0,0 +1,411 @@
+"""
+Снимок публичного каталога в файле, общий для всех воркеров gunicorn.
+
+Все доступные товары (с категориями) и услуги (с материалами) сериализуются
+в один файл:
+
+    MAGIC | длина заголовка (4 байта) | заголовок JSON | записи JSON подряд
+
+Заголовок содержит метку версии, имя БД и индекс записей: для товаров
+(id, slug категории, цена, смещение, длина), для услуг (id, смещение, длина).
+Файл пишется во временный и подменяется через os.replace, поэтому читатели
+видят либо старую, либо новую версию целиком. Воркеры держат файл в mmap и
+перечитывают заголовок только когда меняется (inode, mtime, size) файла;
+для ответа декодируются лишь записи нужной страницы.
+
+Параметры, которые снимок не умеет обрабатывать, отправляют запрос в БД.
+
+После изменения каталога (catalog_changed, после коммита) файл удаляется - все
+воркеры переходят на БД, - а пересборка откладывается на
+CATALOG_SNAPSHOT_REBUILD_DELAY секунд в фоновом потоке воркера: серия изменений
+(например, остатки при оформлении заказов) сливается в одну пересборку вне
+запроса. В командах manage.py (нет долгоживущего воркера) снимок пересобирается
+сразу после коммита, а команды, коммитящие пачками, сливают пересборки
+в одну через batched_rebuild(). Версия каталога (products.cache) меняется после удаления
+файла и еще раз после подмены файла новым, поэтому ответ, собранный по старому
+файлу, не остается в кэше под новой версией. Изменения одних остатков (резервы заказов)
+файл не удаляют и версию сразу не меняют - только планируют пересборку.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .cache import bump_catalog_version, get_catalog_version
+from .models import Product, PrintingService
+from .serializers import ProductSerializer, PrintingServiceSerializer, service_materials_prefetch
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'BAT3DSNAP1'
+HEADER_LENGTH = struct.Struct('>I')
+
+KIND_PRODUCT = 'products'
+KIND_SERVICE = 'services'
+
+# Параметры запроса, которые снимок обрабатывает сам, по типам объектов
+SUPPORTED_PARAMS = {
+    KIND_PRODUCT: {'page', 'format', 'category', 'min_price', 'max_price'},
+    KIND_SERVICE: {'page', 'format'},
+}
+IMAGE_FIELDS = {KIND_PRODUCT: 'image', KIND_SERVICE: 'image'}
+
+DEFAULT_REBUILD_DELAY = 10
+
+
+def get_snapshot_path():
+    return getattr(settings, 'CATALOG_SNAPSHOT_PATH', None)
+
+
+def _encode(data):
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def get_rebuild_delay():
+    return getattr(settings, 'CATALOG_SNAPSHOT_REBUILD_DELAY', DEFAULT_REBUILD_DELAY)
+
+
+def write_snapshot(path=None, expected_version=None):
+    """
+    Собирает снимок каталога и атомарно записывает его в path. Если задана
+    expected_version, а версия каталога за время сборки сменилась, файл не
+    подменяется (его перезапишет пересборка, запланированная этим изменением).
+    """
+    path = path or get_snapshot_path()
+    if not path:
+        return None
+
+    blobs = []
+    offset = 0
+    index = {KIND_PRODUCT: [], KIND_SERVICE: []}
+
+    def add_record(data):
+        nonlocal offset
+        blob = _encode(data)
+        blobs.append(blob)
+        entry = (offset, len(blob))
+        offset += len(blob)
+        return entry
+
+    products = Product.objects.filter(available=True).select_related('category')
+    for product in products:
+        data = ProductSerializer(product).data
+        index[KIND_PRODUCT].append([product.pk, product.category.slug, str(product.price), *add_record(data)])
+
+    services = PrintingService.objects.filter(available=True).prefetch_related(service_materials_prefetch())
+    for service in services:
+        data = PrintingServiceSerializer(service).data
+        index[KIND_SERVICE].append([service.pk, *add_record(data)])
+
+    header = _encode({
+        'stamp': uuid.uuid4().hex,
+        'database': str(connection.settings_dict['NAME']),
+        'index': index,
+    })
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.catalog-snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as snapshot_file:
+            snapshot_file.write(MAGIC)
+            snapshot_file.write(HEADER_LENGTH.pack(len(header)))
+            snapshot_file.write(header)
+            for blob in blobs:
+                snapshot_file.write(blob)
+        if expected_version is not None and get_catalog_version() != expected_version:
+            os.unlink(tmp_path)
+            logger.info("[Snapshot] Каталог изменился во время сборки, снимок отброшен")
+            return None
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    logger.info(
+        f"[Snapshot] Снимок каталога записан: {len(index[KIND_PRODUCT])} товаров, "
+        f"{len(index[KIND_SERVICE])} услуг, {offset} байт"
+    )
+    return path
+
+
+class CatalogSnapshot:
+    def __init__(self, snapshot_file):
+        self._mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError('Неизвестный формат снимка каталога')
+        start = len(MAGIC) + HEADER_LENGTH.size
+        (header_length,) = HEADER_LENGTH.unpack(self._mmap[len(MAGIC):start])
+        header = json.loads(self._mmap[start:start + header_length])
+        self.data_start = start + header_length
+        self.stamp = header['stamp']
+        self.database = header['database']
+
+        self.products = [
+            (pk, category, Decimal(price), offset, length)
+            for pk, category, price, offset, length in header['index'][KIND_PRODUCT]
+        ]
+        self.services = [tuple(entry) for entry in header['index'][KIND_SERVICE]]
+        self.positions = {
+            KIND_PRODUCT: {entry[0]: position for position, entry in enumerate(self.products)},
+            KIND_SERVICE: {entry[0]: position for position, entry in enumerate(self.services)},
+        }
+
+    def _entries(self, kind):
+        return self.products if kind == KIND_PRODUCT else self.services
+
+    def filter(self, kind, params):
+        """
+        Позиции записей, подходящих под параметры запроса, в порядке каталога,
+        или None, если параметры снимком не поддерживаются.
+        """
+        if not set(params) <= SUPPORTED_PARAMS[kind]:
+            return None
+        entries = self._entries(kind)
+        if kind == KIND_SERVICE:
+            return list(range(len(entries)))
+
+        category = params.get('category')
+        try:
+            min_price = Decimal(params['min_price']) if params.get('min_price') else None
+            max_price = Decimal(params['max_price']) if params.get('max_price') else None
+        except InvalidOperation:
+            # Ошибку валидации вернет обычный ProductFilter
+            return None
+        if any(value is not None and not value.is_finite() for value in (min_price, max_price)):
+            # nan / inf: сравнение с ними бросает InvalidOperation, ответ 400 вернет ProductFilter
+            return None
+        return [
+            position for position, (_, category_slug, price, _, _) in enumerate(entries)
+            if (not category or category_slug == category)
+            and (min_price is None or price >= min_price)
+            and (max_price is None or price <= max_price)
+        ]
+
+    def position(self, kind, pk):
+        return self.positions[kind].get(pk)
+
+    def record(self, kind, position, request=None):
+        entry = self._entries(kind)[position]
+        offset, length = entry[-2], entry[-1]
+        start = self.data_start + offset
+        data = json.loads(self._mmap[start:start + length])
+        image = data.get(IMAGE_FIELDS[kind])
+        if request is not None and image and image.startswith('/'):
+            # Как ImageField с request в контексте - абсолютный URL
+            data[IMAGE_FIELDS[kind]] = request.build_absolute_uri(image)
+        return data
+
+
+_lock = threading.Lock()
+_snapshot = None
+_snapshot_key = None
+# Файл, который поток не читает до конца своей транзакции (mark_stale)
+_local = threading.local()
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def get_snapshot():
+    """Текущий снимок или None, если его нет, он устарел или относится к другой БД."""
+    global _snapshot, _snapshot_key
+    path = get_snapshot_path()
+    if not path:
+        return None
+    try:
+        key = _file_key(path)
+    except FileNotFoundError:
+        return None
+    if _is_ignored(key):
+        return None
+    if key == _snapshot_key:
+        return _snapshot
+
+    with _lock:
+        if key != _snapshot_key:
+            try:
+                with open(path, 'rb') as snapshot_file:
+                    snapshot = CatalogSnapshot(snapshot_file)
+            except (OSError, ValueError) as e:
+                logger.error(f"[Snapshot] Не удалось загрузить снимок каталога {path}: {e}")
+                return None
+            if snapshot.database != str(connection.settings_dict['NAME']):
+                return None
+            # Старый mmap закроется сборщиком мусора, когда его перестанут читать
+            _snapshot, _snapshot_key = snapshot, key
+    return _snapshot
+
+
+def mark_stale():
+    """
+    Каталог изменен в транзакции этого потока: пока она открыта, поток не читает
+    текущий файл (в нем нет его изменений). После коммита файл удаляет
+    schedule_rebuild, после отката снимок снова годится.
+    """
+    path = get_snapshot_path()
+    if not path or not connection.in_atomic_block:
+        # Вне транзакции изменение уже закоммичено, on_commit выполнится сразу
+        return
+    try:
+        _local.ignored = (_file_key(path), connection.atomic_blocks[0])
+    except FileNotFoundError:
+        pass
+
+
+def _is_ignored(key):
+    ignored = getattr(_local, 'ignored', None)
+    if ignored is None:
+        return False
+    ignored_key, transaction_block = ignored
+    if not connection.atomic_blocks or connection.atomic_blocks[0] is not transaction_block:
+        # Транзакция завершилась (коммит или откат)
+        _local.ignored = None
+        return False
+    return key == ignored_key
+
+
+def rebuild_snapshot():
+    """Пересобирает снимок; после подмены файла меняет версию каталога."""
+    if not get_snapshot_path():
+        return None
+    try:
+        path = write_snapshot(expected_version=get_catalog_version())
+    except Exception as e:
+        logger.error(f"[Snapshot] Ошибка записи снимка каталога: {e}", exc_info=True)
+        return None
+    if path:
+        bump_catalog_version()
+    return path
+
+
+_timer = None
+_background = False
+
+
+def enable_background_rebuild():
+    """
+    Вызывается из bat3d/wsgi.py и asgi.py: в долгоживущем воркере пересборка
+    откладывается в фоновый поток. В командах и скриптах процесс может завершиться
+    раньше таймера, поэтому там пересборка идет сразу после коммита.
+    """
+    global _background
+    _background = True
+
+
+def _refresh():
+    # Пересборка сама меняет версию после подмены файла; без снимка меняется только версия
+    if get_snapshot_path():
+        rebuild_snapshot()
+    else:
+        bump_catalog_version()
+
+
+@contextmanager
+def batched_rebuild():
+    """
+    Для команд manage.py, которые коммитят изменения пачками (снятие истекших
+    резервов): пересборки пачек сливаются в одну синхронную при выходе из блока,
+    без фонового таймера, который короткоживущий процесс может не дождаться.
+    """
+    if getattr(_local, 'batch', None) is not None:
+        yield
+        return
+    _local.batch = False
+    try:
+        yield
+    finally:
+        pending, _local.batch = _local.batch, None
+        if pending:
+            _refresh()
+
+
+def _run_scheduled_rebuild():
+    global _timer
+    with _lock:
+        # Изменения во время сборки запланируют следующую пересборку
+        _timer = None
+    try:
+        _refresh()
+    finally:
+        connection.close()
+
+
+def schedule_rebuild(invalidate=True):
+    """
+    Вызывается после коммита изменения каталога и планирует пересборку (одну на
+    серию изменений в процессе). invalidate=True: текущий файл удаляется и версия
+    каталога меняется сразу. invalidate=False (только остатки, signals.stock_changed):
+    файл и кэш ответов работают до пересборки - остатки на витрине отстают не больше
+    чем на CATALOG_SNAPSHOT_REBUILD_DELAY секунд.
+    """
+    global _timer
+    path = get_snapshot_path()
+    if invalidate:
+        if path:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        bump_catalog_version()
+        if not path:
+            return
+    if getattr(_local, 'batch', None) is not None:
+        # Внутри batched_rebuild() - пересоберется при выходе из блока
+        _local.batch = True
+        return
+    delay = get_rebuild_delay()
+    if delay <= 0 or not _background:
+        _refresh()
+        return
+    with _lock:
+        if _timer is None:
+            _timer = threading.Timer(delay, _run_scheduled_rebuild)
+            _timer.daemon = True
+            _timer.start()
+
+
+class CatalogSnapshotMixin:
+    """
+    Отдает list/retrieve публичного вьюсета из снимка каталога.
+    Если снимка нет или параметры не поддерживаются - обычный путь через БД.
+    """
+    snapshot_kind = None
+
+    def list(self, request, *args, **kwargs):
+        snapshot = get_snapshot()
+        positions = snapshot.filter(self.snapshot_kind, request.query_params) if snapshot else None
+        if positions is None:
+            return super().list(request, *args, **kwargs)
+        page = self.paginate_queryset(positions)
+        if page is None:
+            return Response([snapshot.record(self.snapshot_kind, position, request) for position in positions])
+        return self.get_paginated_response(
+            [snapshot.record(self.snapshot_kind, position, request) for position in page]
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        snapshot = get_snapshot()
+        position = None
+        # ?fields= / ?expand= / ?profile= и прочие параметры снимок не обрабатывает
+        if snapshot is not None and set(request.query_params) <= SUPPORTED_PARAMS[self.snapshot_kind]:
+            try:
+                position = snapshot.position(self.snapshot_kind, int(kwargs.get(self.lookup_url_kwarg or self.lookup_field, '')))
+            except ValueError:
+                position = None
+        if position is None:
+            # Недоступные товары в снимок не попадают, их карточку отдает БД
+            return super().retrieve(request, *args, **kwargs)
+        return Response(snapshot.record(self.snapshot_kind, position, request))
@@ -1,15 +1,42 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from products.models import Category, Product, PrintingService
+from products.models import CatalogChange, Category, Product, PrintingService, PrintingMaterial, ProductPopularity, PrintingServicePopularity, ProductRecommendation
+from datetime import timedelta
 from decimal import Decimal
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from django.utils.text import slugify
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+from django.core.files.uploadedfile import SimpleUploadedFile
+from products.cache import get_catalog_version
+from products.feeds import feed_path, update_feeds
+from products.importexport import import_products, read_rows
+from products.materials import get_material_dictionary
+from products.popularity import record_paid_order, recompute_popularity
+from products.recommendations import build_recommendations
+from products.signals import catalog_changed
+from products import slugs as slug_allocation
+from products.slugs import allocate_slugs, create_with_unique_slug
+from products import snapshot as snapshot_module
+from products.snapshot import get_snapshot, write_snapshot
 
 # Импорты для очистки данных из других приложений, если необходимо
 from orders.models import Order, OrderItem # Предполагаем, что могут быть созданы
 from cart.models import Cart, CartItem     # Предполагаем, что могут быть созданы
+from reviews.models import Review
 
 User = get_user_model()
 
@@ -466,4 +493,1060 @@ class CategoryViewSetTest(TestCase):
         url = reverse('category-detail', kwargs={'slug': self.category.slug})
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
-        self.assertFalse(Category.objects.filter(slug=self.category.slug).exists()) 
\ No newline at end of file
+        self.assertFalse(Category.objects.filter(slug=self.category.slug).exists()) 
+
+class ProductCursorPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Cursor Category', slug='cursor-category')
+        self.other_category = Category.objects.create(name='Other Category', slug='other-category')
+        # 15 товаров с повторяющимися ценами, чтобы проверить стабильность ключа (price, id)
+        for i in range(15):
+            Product.objects.create(
+                name=f'Cursor Product {i:02d}',
+                slug=f'cursor-product-{i:02d}',
+                price=Decimal('100.00') + (i % 3),
+                category=self.category,
+                stock=1,
+                available=True
+            )
+        Product.objects.create(
+            name='Foreign Product', slug='foreign-product', price=Decimal('1.00'),
+            category=self.other_category, stock=1, available=True
+        )
+
+    def _walk(self, params):
+        url = reverse('product-list')
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        pages = [response.data]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            pages.append(response.data)
+        return pages
+
+    def test_cursor_mode_has_no_count_and_walks_all_items(self):
+        pages = self._walk({'cursor': '', 'category': self.category.slug})
+        self.assertEqual(len(pages), 2)
+        self.assertNotIn('count', pages[0])
+        self.assertIsNone(pages[0]['previous'])
+        names = [item['name'] for page in pages for item in page['results']]
+        self.assertEqual(names, [f'Cursor Product {i:02d}' for i in range(15)])
+
+    def test_cursor_ordering_by_price_is_stable(self):
+        pages = self._walk({'cursor': '', 'ordering': '-price', 'category': self.category.slug})
+        items = [item for page in pages for item in page['results']]
+        self.assertEqual(len(items), 15)
+        self.assertEqual(len({item['id'] for item in items}), 15)
+        keys = [(-Decimal(item['price']), -item['id']) for item in items]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_previous_link_returns_first_page(self):
+        url = reverse('product-list')
+        first = self.client.get(url, {'cursor': '', 'category': self.category.slug}).data
+        second = self.client.get(first['next']).data
+        self.assertIsNotNone(second['previous'])
+        back = self.client.get(second['previous']).data
+        self.assertEqual(
+            [item['id'] for item in back['results']],
+            [item['id'] for item in first['results']]
+        )
+        self.assertIsNone(back['previous'])
+
+    def test_cursor_respects_product_filter(self):
+        pages = self._walk({'cursor': '', 'min_price': '101.00', 'max_price': '101.00'})
+        items = [item for page in pages for item in page['results']]
+        self.assertEqual(len(items), 5)
+        self.assertTrue(all(Decimal(item['price']) == Decimal('101.00') for item in items))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('product-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 16)
+
+
+class ProductFacetsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('product-facets')
+        self.figures = Category.objects.create(name='Figures', slug='figures')
+        self.vases = Category.objects.create(name='Vases', slug='vases')
+        for name, price, stock, category in [
+            ('Dragon', '120.00', 3, self.figures),
+            ('Knight', '480.00', 0, self.figures),
+            ('Wizard', '650.00', 2, self.figures),
+            ('Tall vase', '1100.00', 1, self.vases),
+        ]:
+            Product.objects.create(
+                name=name, slug=slugify(name), price=Decimal(price),
+                category=category, stock=stock, available=True
+            )
+        Product.objects.create(
+            name='Hidden', slug='hidden', price=Decimal('50.00'),
+            category=self.vases, stock=5, available=False
+        )
+
+    def test_facets_for_public_catalog(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertEqual(data['total'], 4)
+        self.assertEqual(data['in_stock'], 3)
+        self.assertEqual(data['price']['min'], Decimal('120.00'))
+        self.assertEqual(data['price']['max'], Decimal('1100.00'))
+        self.assertEqual(
+            [(bucket['from'], bucket['count']) for bucket in data['price']['histogram']],
+            [(0, 2), (500, 1), (1000, 1)]
+        )
+        self.assertEqual(
+            [(item['slug'], item['count']) for item in data['categories']],
+            [('figures', 3), ('vases', 1)]
+        )
+
+    def test_facets_apply_product_filter(self):
+        response = self.client.get(self.url, {'category': 'figures', 'max_price': '500', 'price_step': '100'})
+        data = response.data
+        self.assertEqual(data['total'], 2)
+        self.assertEqual(data['in_stock'], 1)
+        self.assertEqual([bucket['from'] for bucket in data['price']['histogram']], [100, 400])
+
+    def test_facets_are_cached_until_product_saved(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+        Product.objects.filter(slug='hidden').update(available=True)
+        # update() не шлет сигналов - в кэше старое значение
+        self.assertEqual(self.client.get(self.url).data['total'], 4)
+        Product.objects.get(slug='hidden').save()
+        self.assertEqual(self.client.get(self.url).data['total'], 5)
+
+
+class CatalogResponseCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Cache Category', slug='cache-category')
+        self.product = Product.objects.create(
+            name='Cached Product', slug='cached-product', price=Decimal('10.00'),
+            category=self.category, stock=1, available=True
+        )
+
+    def test_list_is_served_from_cache_with_etag(self):
+        url = reverse('product-list')
+        first = self.client.get(url, {'category': 'cache-category'})
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', first)
+        with self.assertNumQueries(0):
+            second = self.client.get(url, {'category': 'cache-category'})
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+        # Другие параметры - другой ключ
+        self.assertNotEqual(self.client.get(url, {'category': 'other'})['ETag'], first['ETag'])
+
+    def test_if_none_match_returns_304_without_running_view(self):
+        url = reverse('product-detail', kwargs={'pk': self.product.pk})
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_catalog_change_invalidates_cache(self):
+        url = reverse('category-list')
+        etag = self.client.get(url)['ETag']
+        self.category.name = 'Renamed Category'
+        self.category.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data['results'][0]['name'], 'Renamed Category')
+
+
+class CatalogSnapshotTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, 'catalog.bin')
+        settings_override = override_settings(CATALOG_SNAPSHOT_PATH=self.path, CATALOG_SNAPSHOT_REBUILD_DELAY=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.figures = Category.objects.create(name='Figures', slug='figures')
+        self.tools = Category.objects.create(name='Tools', slug='tools')
+        self.dragon = Product.objects.create(
+            name='Dragon', slug='dragon', price=Decimal('120.00'), category=self.figures, stock=1, available=True
+        )
+        self.knight = Product.objects.create(
+            name='Knight', slug='knight', price=Decimal('480.00'), category=self.figures, stock=1, available=True
+        )
+        self.wrench = Product.objects.create(
+            name='Wrench', slug='wrench', price=Decimal('90.00'), category=self.tools, stock=1, available=True
+        )
+        self.hidden = Product.objects.create(
+            name='Hidden', slug='hidden', price=Decimal('10.00'), category=self.tools, stock=1, available=False
+        )
+        self.service = PrintingService.objects.create(name='FDM', description='', base_price=Decimal('300.00'))
+        write_snapshot()
+
+    def test_list_and_detail_are_served_without_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('product-list'), {'category': 'figures', 'max_price': '200'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['results'][0]['name'], 'Dragon')
+        self.assertEqual(response.data['results'][0]['category']['slug'], 'figures')
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('printingservice-detail', kwargs={'pk': self.service.pk}))
+        self.assertEqual(response.data['name'], 'FDM')
+
+    def test_snapshot_matches_database_response(self):
+        from_snapshot = self.client.get(reverse('product-list')).data
+        cache.clear()
+        # Неподдерживаемый параметр отправляет запрос в БД
+        from_db = self.client.get(reverse('product-list'), {'available': 'true'}).data
+        self.assertEqual(from_snapshot['results'], from_db['results'])
+
+    def test_non_finite_price_falls_back_to_database_validation(self):
+        for params in ({'min_price': 'nan'}, {'max_price': 'NaN'}, {'min_price': 'Infinity'}, {'min_price': 'abc'}):
+            response = self.client.get(reverse('product-list'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_detail_with_field_selection_falls_back_to_database(self):
+        url = reverse('product-detail', kwargs={'pk': self.dragon.pk})
+        self.assertEqual(set(self.client.get(url, {'fields': 'id,name'}).data), {'id', 'name'})
+        self.assertEqual(
+            set(self.client.get(url, {'profile': 'card'}).data), {'id', 'name', 'slug', 'price', 'image'}
+        )
+        with self.assertNumQueries(0):
+            self.assertIn('description', self.client.get(url).data)
+
+    def test_unavailable_product_detail_falls_back_to_database(self):
+        response = self.client.get(reverse('product-detail', kwargs={'pk': self.hidden.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Hidden')
+
+    def test_catalog_change_rewrites_snapshot_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wrench.name = 'Spanner'
+            self.wrench.save()
+        cache.clear()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('product-detail', kwargs={'pk': self.wrench.pk}))
+        self.assertEqual(response.data['name'], 'Spanner')
+
+    def test_local_change_ignores_old_snapshot_until_rewritten(self):
+        self.wrench.name = 'Spanner'
+        self.wrench.save()
+        response = self.client.get(reverse('product-detail', kwargs={'pk': self.wrench.pk}))
+        self.assertEqual(response.data['name'], 'Spanner')
+
+    @override_settings(CATALOG_SNAPSHOT_REBUILD_DELAY=60)
+    @mock.patch.object(snapshot_module, '_background', True)
+    def test_commit_removes_snapshot_and_defers_rebuild(self):
+        self.addCleanup(self._cancel_scheduled_rebuild)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wrench.name = 'Spanner'
+            self.wrench.save()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertIsNotNone(snapshot_module._timer)
+        # Пока снимок не пересобран, ответы идут из БД
+        response = self.client.get(reverse('product-detail', kwargs={'pk': self.wrench.pk}))
+        self.assertEqual(response.data['name'], 'Spanner')
+
+        version = get_catalog_version()
+        snapshot_module.rebuild_snapshot()
+        # Версия меняется только после подмены файла
+        self.assertNotEqual(get_catalog_version(), version)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('product-detail', kwargs={'pk': self.wrench.pk}))
+        self.assertEqual(response.data['name'], 'Spanner')
+
+    @override_settings(CATALOG_SNAPSHOT_REBUILD_DELAY=60)
+    def test_rebuild_is_inline_outside_worker(self):
+        # manage.py: таймер не переживет команду, снимок пересобирается после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wrench.name = 'Spanner'
+            self.wrench.save()
+        self.assertIsNone(snapshot_module._timer)
+        cache.clear()
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('product-detail', kwargs={'pk': self.wrench.pk}))
+        self.assertEqual(response.data['name'], 'Spanner')
+
+    def test_snapshot_built_under_old_version_is_discarded(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        self.assertIsNone(write_snapshot(expected_version='outdated'))
+        self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+        self.assertEqual([name for name in os.listdir(self.tmp_dir.name)], ['catalog.bin'])
+
+    def _cancel_scheduled_rebuild(self):
+        with snapshot_module._lock:
+            if snapshot_module._timer is not None:
+                snapshot_module._timer.cancel()
+                snapshot_module._timer = None
+
+
+class CatalogSnapshotRollbackTest(TransactionTestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        settings_override = override_settings(CATALOG_SNAPSHOT_PATH=os.path.join(self.tmp_dir.name, 'catalog.bin'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        category = Category.objects.create(name='Rollback', slug='rollback')
+        self.product = Product.objects.create(
+            name='Rollback', slug='rollback', price=Decimal('10.00'), category=category, stock=1
+        )
+        write_snapshot()
+
+    def test_rolled_back_change_does_not_disable_snapshot(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.product.name = 'Discarded'
+            self.product.save()
+            # Внутри транзакции поток видит свое изменение, а не снимок
+            self.assertIsNone(get_snapshot())
+            raise RuntimeError
+        self.assertIsNotNone(get_snapshot())
+
+
+class ProductBatchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('product-batch')
+        self.category = Category.objects.create(name='Batch Category', slug='batch-category')
+        self.products = [
+            Product.objects.create(
+                name=f'Batch {i}', slug=f'batch-{i}', price=Decimal('10.00'),
+                category=self.category, stock=1, available=i != 2
+            )
+            for i in range(4)
+        ]
+
+    def test_batch_preserves_order_and_reports_missing(self):
+        first, second, hidden, last = self.products
+        ids = f'{last.pk},batch-0,999999,{hidden.pk},no-such-slug,{first.pk}'
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'ids': ids})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['results']], [last.pk, first.pk, hidden.pk])
+        self.assertEqual(response.data['missing'], ['999999', 'no-such-slug'])
+        self.assertEqual(response.data['results'][0]['category']['slug'], 'batch-category')
+
+    def test_batch_uses_catalog_cache(self):
+        params = {'ids': f'{self.products[0].pk},{self.products[1].pk}'}
+        first = self.client.get(self.url, params)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_batch_validates_ids(self):
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_400_BAD_REQUEST)
+        too_many = ','.join(str(i) for i in range(1, 300))
+        self.assertEqual(self.client.get(self.url, {'ids': too_many}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductSparseFieldsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Cards', slug='cards')
+        for i in range(3):
+            Product.objects.create(
+                name=f'Card {i}', slug=f'card-{i}', description='Long description ' * 20,
+                price=Decimal('10.00') + i, category=self.category, stock=1, available=True
+            )
+        self.service = PrintingService.objects.create(name='SLA', description='', base_price=Decimal('100.00'))
+        self.material = PrintingMaterial.objects.create(
+            name='Resin', description='', price_multiplier=Decimal('1.50'), color='grey'
+        )
+        self.service.materials.add(self.material)
+
+    def test_card_profile(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('product-list'), {'profile': 'card'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        item = response.data['results'][0]
+        self.assertEqual(set(item), {'id', 'name', 'slug', 'price', 'image'})
+        # Описание не читается из БД
+        self.assertNotIn('description', queries[-1]['sql'])
+
+    def test_fields_and_expand(self):
+        url = reverse('product-list')
+        item = self.client.get(url, {'fields': 'id,name,category'}).data['results'][0]
+        self.assertEqual(item, {'id': item['id'], 'name': 'Card 0', 'category': self.category.pk})
+        with self.assertNumQueries(2): # COUNT + страница с JOIN категории
+            response = self.client.get(url, {'fields': 'id,name', 'expand': 'category'})
+        item = response.data['results'][0]
+        self.assertEqual(set(item), {'id', 'name', 'category'})
+        self.assertEqual(item['category']['slug'], 'cards')
+
+    def test_default_representation_is_unchanged(self):
+        item = self.client.get(reverse('product-list')).data['results'][0]
+        self.assertEqual(item['category']['slug'], 'cards')
+        self.assertIn('description', item)
+
+    def test_service_materials_as_ids(self):
+        response = self.client.get(reverse('printingservice-list'), {'fields': 'id,name,materials'})
+        self.assertEqual(response.data['results'][0]['materials'], [self.material.pk])
+        response = self.client.get(reverse('printingservice-list'), {'fields': 'id,materials', 'expand': 'materials'})
+        self.assertEqual(response.data['results'][0]['materials'][0]['name'], 'Resin')
+
+
+@override_settings(CATALOG_CHANGES_SAFETY_LAG=0)
+class CatalogChangeFeedTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.url = reverse('product-changes')
+        self.category = Category.objects.create(name='Feed', slug='feed')
+        self.product = Product.objects.create(
+            name='Feed Product', slug='feed-product', price=Decimal('10.00'),
+            category=self.category, stock=1, available=True
+        )
+        self.head = self.client.get(self.url).data['next_since']
+
+    def test_full_sync_from_zero(self):
+        data = self.client.get(self.url, {'since': 0}).data
+        keys = [(change['kind'], change['id'], change['action']) for change in data['changes']]
+        self.assertIn(('category', self.category.pk, 'upsert'), keys)
+        self.assertIn(('product', self.product.pk, 'upsert'), keys)
+        self.assertFalse(data['has_more'])
+
+    def test_incremental_changes_and_tombstones(self):
+        self.product.price = Decimal('12.00')
+        self.product.save()
+        other = Product.objects.create(
+            name='Other', slug='other', price=Decimal('5.00'), category=self.category, stock=1, available=True
+        )
+        other_pk = other.pk
+        other.delete()
+        data = self.client.get(self.url, {'since': self.head}).data
+        changes = {(change['kind'], change['id']): change for change in data['changes']}
+        self.assertEqual(len(data['changes']), 2)
+        self.assertEqual(changes[('product', self.product.pk)]['data']['price'], '12.00')
+        self.assertEqual(changes[('product', other_pk)]['action'], 'delete')
+        self.assertIsNone(changes[('product', other_pk)]['data'])
+        # Следующий запрос с next_since пуст
+        self.assertEqual(self.client.get(self.url, {'since': data['next_since']}).data['changes'], [])
+
+    def test_unavailable_product_is_tombstone_and_category_rename_touches_products(self):
+        self.product.available = False
+        self.product.save()
+        data = self.client.get(self.url, {'since': self.head}).data
+        self.assertEqual(data['changes'][0]['action'], 'delete')
+
+        self.product.available = True
+        self.product.save()
+        head = self.client.get(self.url, {'since': data['next_since']}).data['next_since']
+        self.category.name = 'Renamed'
+        self.category.save()
+        kinds = [change['kind'] for change in self.client.get(self.url, {'since': head}).data['changes']]
+        self.assertEqual(sorted(kinds), ['category', 'product'])
+
+    def test_limit_and_timestamp(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, status.HTTP_400_BAD_REQUEST)
+        data = self.client.get(self.url, {'since': '2000-01-01T00:00:00Z', 'limit': 1}).data
+        self.assertTrue(data['has_more'])
+        self.assertEqual(len(data['changes']), 1)
+
+    def test_material_delete_touches_only_its_services(self):
+        material = PrintingMaterial.objects.create(name='PLA', description='', price_multiplier=Decimal('1.00'), color='white')
+        with_material = PrintingService.objects.create(name='With', description='', base_price=Decimal('10.00'))
+        with_material.materials.add(material)
+        PrintingService.objects.create(name='Without', description='', base_price=Decimal('10.00'))
+        head = CatalogChange.objects.aggregate(head=Max('id'))['head']
+        material.delete()
+        self.assertEqual(
+            list(CatalogChange.objects.filter(id__gt=head).values_list('kind', 'object_id')),
+            [(CatalogChange.KIND_SERVICE, with_material.pk)]
+        )
+
+    @override_settings(CATALOG_CHANGES_SAFETY_LAG=60)
+    def test_recent_changes_wait_for_safety_lag(self):
+        self.product.price = Decimal('15.00')
+        self.product.save()
+        self.assertEqual(self.client.get(self.url, {'since': self.head}).data['changes'], [])
+        CatalogChange.objects.filter(id__gt=self.head).update(created=timezone.now() - timedelta(minutes=2))
+        data = self.client.get(self.url, {'since': self.head}).data
+        self.assertEqual([change['id'] for change in data['changes']], [self.product.pk])
+
+    def test_pruned_cursor_requires_resync(self):
+        self.product.price = Decimal('15.00')
+        self.product.save()
+        head = CatalogChange.objects.aggregate(head=Max('id'))['head']
+        CatalogChange.objects.update(created=timezone.now() - timedelta(days=90))
+        call_command('prune_catalog_changes', days=30, stdout=io.StringIO())
+        self.assertEqual(list(CatalogChange.objects.values_list('id', flat=True)), [head])
+
+        response = self.client.get(self.url, {'since': self.head - 1})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+        self.assertTrue(response.data['resync_required'])
+        self.assertEqual(response.data['next_since'], head)
+        # Курсор на границе хранимого диапазона продолжает работать
+        self.assertEqual(self.client.get(self.url, {'since': head}).data['changes'], [])
+
+
+class ProductImportExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(username='import_admin', email='import_admin@example.com', password='admin123')
+        self.client.force_authenticate(user=self.admin)
+        self.category = Category.objects.create(name='Import', slug='import')
+        self.existing = Product.objects.create(
+            name='Existing', slug='existing', price=Decimal('10.00'), category=self.category, stock=1
+        )
+        Product.objects.create(name='Dup', slug='dup', price=Decimal('1.00'), category=self.category, stock=1)
+
+    def _upload(self, name, content):
+        upload = SimpleUploadedFile(name, content.encode('utf-8'))
+        return self.client.post(reverse('management-product-import-catalog'), {'file': upload}, format='multipart')
+
+    def test_csv_import_creates_updates_and_reports_errors(self):
+        lines = ['name,category,price,stock,slug']
+        lines += [f'Dup,import,{i}.50,{i},' for i in range(50)]
+        lines += [
+            ',import,5.00,1,existing', # обновление по slug, только цена и остаток
+            'Broken,import,-1,1,',
+            'Orphan,no-such-category,1,1,',
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self._upload('products.csv', '\n'.join(lines) + '\n')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['created'], 50)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']], [53, 54])
+        # Количество запросов не зависит от числа строк
+        self.assertLess(len(queries), 30)
+
+        slugs = set(Product.objects.filter(name='Dup').values_list('slug', flat=True))
+        self.assertEqual(len(slugs), 51)
+        self.assertIn('dup-50', slugs)
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.name, self.existing.price, self.existing.stock), ('Existing', Decimal('5.00'), 1))
+
+    def test_jsonl_import_in_chunks(self):
+        content = '\n'.join([
+            json.dumps({'name': 'First', 'category': 'import', 'price': '3.00'}),
+            'not json',
+            json.dumps({'id': self.existing.pk, 'available': False}),
+            json.dumps({'id': 999999, 'price': '1.00'}),
+            json.dumps({'name': 'Second', 'category': 'import', 'price': '4.00', 'slug': 'second'}),
+        ])
+        result = import_products(read_rows(io.BytesIO(content.encode('utf-8')), 'jsonl'), chunk_size=2)
+        self.assertEqual((result['created'], result['updated']), (2, 1))
+        self.assertEqual([error['line'] for error in result['errors']], [2, 4])
+        self.assertFalse(Product.objects.get(pk=self.existing.pk).available)
+        self.assertTrue(Product.objects.filter(slug='second', price=Decimal('4.00')).exists())
+
+    def test_conflicting_rows_do_not_fail_the_chunk(self):
+        content = '\n'.join([
+            json.dumps({'id': self.existing.pk, 'slug': 'dup'}),
+            json.dumps({'id': self.existing.pk, 'slug': 'renamed'}),
+            json.dumps({'id': self.existing.pk, 'price': '7.00'}),
+            json.dumps({'name': 'Clash', 'category': 'import', 'price': '1.00', 'slug': 'renamed'}),
+            json.dumps({'name': 'Fine', 'category': 'import', 'price': '2.00'}),
+        ])
+        result = import_products(read_rows(io.BytesIO(content.encode('utf-8')), 'jsonl'))
+        self.assertEqual((result['created'], result['updated']), (1, 1))
+        self.assertEqual([error['line'] for error in result['errors']], [1, 3, 4])
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.slug, self.existing.price), ('renamed', Decimal('10.00')))
+        self.assertTrue(Product.objects.filter(name='Fine').exists())
+
+    def test_streaming_export_roundtrip(self):
+        response = self.client.get(reverse('management-product-export-catalog'), {'file_format': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row['slug'] for row in rows], ['existing', 'dup'])
+        self.assertEqual(rows[0]['category'], 'import')
+
+        response = self.client.get(reverse('management-product-export-catalog'), {'file_format': 'jsonl'})
+        lines = b''.join(response.streaming_content).decode('utf-8').splitlines()
+        self.assertEqual(json.loads(lines[0])['price'], '10.00')
+
+
+class ProductBulkUpdateTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(username='bulk_admin', email='bulk_admin@example.com', password='admin123')
+        self.client.force_authenticate(user=self.admin)
+        self.url = reverse('management-product-bulk-update')
+        self.figures = Category.objects.create(name='Фигурки', slug='figurki')
+        self.other = Category.objects.create(name='Other', slug='other')
+        self.cheap = Product.objects.create(name='Cheap', slug='cheap', price=Decimal('99.00'), category=self.figures, stock=2)
+        self.pricey = Product.objects.create(name='Pricey', slug='pricey', price=Decimal('1234.00'), category=self.figures, stock=0)
+        self.foreign = Product.objects.create(name='Foreign', slug='foreign', price=Decimal('50.00'), category=self.other, stock=5)
+
+    def _post(self, data):
+        return self.client.post(self.url, data, format='json')
+
+    def test_percent_with_rounding_for_category(self):
+        calls = []
+        catalog_changed.connect(lambda sender, pks, **kwargs: calls.append(sorted(pks)), weak=False, dispatch_uid='bulk-test')
+        self.addCleanup(catalog_changed.disconnect, dispatch_uid='bulk-test')
+        response = self._post({'filter': {'category': 'figurki'}, 'price_percent': '7', 'price_round': '10'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.cheap.refresh_from_db()
+        self.pricey.refresh_from_db()
+        self.foreign.refresh_from_db()
+        self.assertEqual(self.cheap.price, Decimal('110.00')) # 105.93 -> 110
+        self.assertEqual(self.pricey.price, Decimal('1320.00')) # 1320.38 -> 1320
+        self.assertEqual(self.foreign.price, Decimal('50.00'))
+        # Один сигнал на всю операцию
+        self.assertEqual(calls, [sorted([self.cheap.pk, self.pricey.pk])])
+
+    def test_delta_and_stock_never_negative(self):
+        response = self._post({'filter': {'max_price': '100'}, 'price_delta': '-60.555', 'stock_delta': -3})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST) # 3 знака после запятой
+        response = self._post({'filter': {'max_price': '100'}, 'price_delta': '-60.50', 'stock_delta': -3})
+        self.assertEqual(response.data['count'], 2)
+        self.cheap.refresh_from_db()
+        self.foreign.refresh_from_db()
+        self.assertEqual((self.cheap.price, self.cheap.stock), (Decimal('38.50'), 0))
+        self.assertEqual((self.foreign.price, self.foreign.stock), (Decimal('0.00'), 2))
+
+    def test_validation_and_dry_run(self):
+        self.assertEqual(self._post({'price_percent': '5', 'price_set': '1'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._post({'filter': {}}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self._post({'filter': {'min_price': 'abc'}, 'stock_set': 1}).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self._post({'filter': {}, 'stock_set': 7, 'dry_run': True})
+        self.assertEqual(response.data, {'count': 3, 'dry_run': True})
+        self.assertFalse(Product.objects.filter(stock=7).exists())
+
+    def test_requires_admin(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self._post({'stock_set': 1}).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PopularityTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='buyer', email='buyer@example.com', password='buyer123')
+        self.category = Category.objects.create(name='Popular', slug='popular')
+        self.rare = Product.objects.create(name='A Rare', slug='a-rare', price=Decimal('10.00'), category=self.category, stock=5)
+        self.hit = Product.objects.create(name='B Hit', slug='b-hit', price=Decimal('20.00'), category=self.category, stock=5)
+        self.unsold = Product.objects.create(name='C Unsold', slug='c-unsold', price=Decimal('30.00'), category=self.category, stock=5)
+        self.service = PrintingService.objects.create(name='FDM', description='FDM', base_price=Decimal('100.00'))
+
+    def _paid_order(self, items, days_ago=0):
+        order = Order.objects.create(user=self.user, address='Somewhere', paid=True, status='processing')
+        for target, quantity in items:
+            field = 'product' if isinstance(target, Product) else 'printing_service'
+            price = target.price if isinstance(target, Product) else target.base_price
+            OrderItem.objects.create(order=order, price=price, quantity=quantity, **{field: target})
+        Order.objects.filter(pk=order.pk).update(paid_at=timezone.now() - timedelta(days=days_ago))
+        order.refresh_from_db()
+        return order
+
+    def test_record_paid_order_increments_all_windows(self):
+        record_paid_order(self._paid_order([(self.hit, 2), (self.service, 1)]))
+        record_paid_order(self._paid_order([(self.hit, 1)]))
+        stats = ProductPopularity.objects.get(product=self.hit)
+        self.assertEqual((stats.units_7d, stats.units_30d, stats.units_90d), (3, 3, 3))
+        self.assertEqual(stats.revenue_30d, Decimal('60.00'))
+        self.assertEqual(PrintingServicePopularity.objects.get(printing_service=self.service).units_90d, 1)
+        self.assertFalse(ProductPopularity.objects.filter(product=self.unsold).exists())
+
+    def test_recompute_respects_windows_and_skips_unpaid(self):
+        self._paid_order([(self.hit, 1)], days_ago=1)
+        self._paid_order([(self.hit, 4)], days_ago=20)
+        self._paid_order([(self.rare, 5)], days_ago=60)
+        self._paid_order([(self.rare, 7)], days_ago=120)
+        unpaid = Order.objects.create(user=self.user, address='Somewhere')
+        OrderItem.objects.create(order=unpaid, product=self.unsold, price=Decimal('30.00'), quantity=9)
+
+        self.assertEqual(recompute_popularity(), {'product': 2, 'printing_service': 0})
+        hit = ProductPopularity.objects.get(product=self.hit)
+        rare = ProductPopularity.objects.get(product=self.rare)
+        self.assertEqual((hit.units_7d, hit.units_30d, hit.units_90d), (1, 5, 5))
+        self.assertEqual(hit.revenue_30d, Decimal('100.00'))
+        self.assertEqual((rare.units_7d, rare.units_30d, rare.units_90d), (0, 0, 5))
+
+    def test_recompute_upserts_and_drops_stale_rows(self):
+        record_paid_order(self._paid_order([(self.hit, 2)]))
+        ProductPopularity.objects.create(product=self.unsold, units_90d=4)
+        # Продажа старше всех окон
+        Order.objects.filter(items__product=self.hit).update(paid_at=timezone.now() - timedelta(days=120))
+        record_paid_order(self._paid_order([(self.rare, 3)], days_ago=10))
+
+        self.assertEqual(recompute_popularity(), {'product': 1, 'printing_service': 0})
+        self.assertEqual(
+            list(ProductPopularity.objects.values_list('product', 'units_7d', 'units_30d')),
+            [(self.rare.pk, 0, 3)]
+        )
+
+    def test_ordering_popular(self):
+        record_paid_order(self._paid_order([(self.rare, 1), (self.hit, 3)]))
+        response = self.client.get(reverse('product-list'), {'ordering': 'popular'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        names = [item['name'] for item in response.data['results']]
+        # Без продаж - в конце списка
+        self.assertEqual(names, ['B Hit', 'A Rare', 'C Unsold'])
+
+
+class ProductRecommendationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='reco', email='reco@example.com', password='reco123')
+        category = Category.objects.create(name='Reco', slug='reco')
+        self.printer, self.filament, self.nozzle, self.glue, self.hidden = [
+            Product.objects.create(name=name, slug=name.lower(), price=Decimal('10.00'), category=category, stock=5)
+            for name in ('Printer', 'Filament', 'Nozzle', 'Glue', 'Hidden')
+        ]
+        self.service = PrintingService.objects.create(name='FDM', description='FDM', base_price=Decimal('100.00'))
+        self._order([self.printer, self.filament, self.service])
+        self._order([self.printer, self.filament, self.hidden])
+        self._order([self.printer, self.nozzle])
+        self._order([self.filament, self.glue])
+        # Не оплачен - не учитывается
+        self._order([self.printer, self.glue], paid=False)
+        self.hidden.available = False
+        self.hidden.save()
+
+    def _order(self, targets, paid=True):
+        order = Order.objects.create(user=self.user, address='Somewhere', paid=paid)
+        for target in targets:
+            field = 'product' if isinstance(target, Product) else 'printing_service'
+            OrderItem.objects.create(order=order, price=Decimal('10.00'), quantity=1, **{field: target})
+
+    def test_build_scores_and_ranks(self):
+        self.assertEqual(build_recommendations(top_k=2), 8)
+        rows = list(ProductRecommendation.objects.filter(product=self.printer).values_list('recommended', 'rank', 'score'))
+        # Filament: 2 / sqrt(3 * 3); Hidden и Nozzle: 1 / sqrt(3 * 1), при равенстве - меньший id
+        self.assertEqual([(pk, rank) for pk, rank, _ in rows], [(self.filament.pk, 1), (self.nozzle.pk, 2)])
+        self.assertAlmostEqual(rows[0][2], 2 / 3)
+        self.assertFalse(ProductRecommendation.objects.filter(product=self.printer, recommended=self.glue).exists())
+
+    def test_product_recommendations_single_query(self):
+        build_recommendations()
+        url = reverse('product-recommendations', kwargs={'pk': self.printer.pk})
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Снятый с продажи товар не рекомендуется
+        self.assertEqual([item['name'] for item in response.data['results']], ['Filament', 'Nozzle'])
+        self.assertEqual(len(self.client.get(url, {'limit': 1}).data['results']), 1)
+
+    def test_cart_recommendations(self):
+        build_recommendations()
+        url = reverse('product-cart-recommendations')
+        response = self.client.get(url, {'ids': f'{self.printer.pk},{self.filament.pk}'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['name'] for item in response.data['results']], ['Nozzle', 'Glue'])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PrintingServiceFilterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.url = reverse('printingservice-list')
+        self.pla = PrintingMaterial.objects.create(name='PLA', description='', price_multiplier=Decimal('1.00'), color='white')
+        self.tpu = PrintingMaterial.objects.create(name='TPU', description='', price_multiplier=Decimal('1.40'), color='black')
+        self.pla.set_properties(['Прочный', 'Биоразлагаемый'])
+        self.tpu.set_properties(['Гибкий'])
+        self.small = PrintingService.objects.create(
+            name='Small', description='', base_price=Decimal('100.00'),
+            min_weight=Decimal('1.00'), max_weight=Decimal('100.00'), features=['Быстро', 'Дешево']
+        )
+        self.large = PrintingService.objects.create(
+            name='Large', description='', base_price=Decimal('500.00'),
+            min_weight=Decimal('50.00'), max_weight=Decimal('5000.00')
+        )
+        self.small.materials.add(self.pla, self.tpu)
+        self.large.materials.add(self.pla)
+
+    def _names(self, params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(item['name'] for item in response.data['results'])
+
+    def test_material_and_property_apply_to_same_material(self):
+        self.assertEqual(self._names({'material': self.pla.pk}), ['Large', 'Small'])
+        self.assertEqual(self._names({'property': 'Гибкий'}), ['Small'])
+        self.assertEqual(self._names({'material': self.tpu.pk, 'property': 'Гибкий'}), ['Small'])
+        # У PLA нет свойства "Гибкий", хотя у Small оно есть у другого материала
+        self.assertEqual(self._names({'material': self.pla.pk, 'property': 'Гибкий'}), [])
+
+    def test_weight_filters(self):
+        self.assertEqual(self._names({'weight': '75'}), ['Large', 'Small'])
+        self.assertEqual(self._names({'weight': '2000'}), ['Large'])
+        self.assertEqual(self._names({'weight_min': '10', 'weight_max': '90'}), ['Small'])
+
+    def test_comma_separated_api_format(self):
+        response = self.client.get(self.url, {'ordering': 'name'})
+        small = next(item for item in response.data['results'] if item['name'] == 'Small')
+        self.assertEqual(small['features'], 'Быстро,Дешево')
+        self.assertEqual(
+            {material['name']: material['properties'] for material in small['materials']},
+            {'PLA': 'Биоразлагаемый,Прочный', 'TPU': 'Гибкий'}
+        )
+
+        admin = User.objects.create_superuser(username='svc_admin', email='svc_admin@example.com', password='admin123')
+        self.client.force_authenticate(user=admin)
+        response = self.client.patch(
+            reverse('management-printing-service-detail', kwargs={'pk': self.large.pk}),
+            {'features': ' Крупно , ,Надежно'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.large.refresh_from_db()
+        self.assertEqual(self.large.features, ['Крупно', 'Надежно'])
+        self.assertEqual(response.data['features'], 'Крупно,Надежно')
+
+
+class PrintingServiceQueryCountTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.pla = PrintingMaterial.objects.create(name='PLA', description='', price_multiplier=Decimal('1.00'), color='white')
+        self.abs = PrintingMaterial.objects.create(name='ABS', description='', price_multiplier=Decimal('1.20'), color='black')
+        self.pla.set_properties(['Прочный'])
+        self.services = []
+        for i in range(4):
+            service = PrintingService.objects.create(name=f'Service {i}', description='', base_price=Decimal('100.00') + i)
+            service.materials.add(self.pla, self.abs)
+            self.services.append(service)
+
+    def test_list_and_retrieve_query_count(self):
+        get_material_dictionary()
+        # count для пагинации + услуги + связь услуга-материал
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('printingservice-list'))
+        self.assertEqual(len(response.data['results']), 4)
+        materials = response.data['results'][0]['materials']
+        self.assertEqual([material['name'] for material in materials], ['ABS', 'PLA'])
+        self.assertEqual(materials[1]['properties'], 'Прочный')
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('printingservice-detail', kwargs={'pk': self.services[0].pk}))
+        self.assertEqual(len(response.data['materials']), 2)
+
+    def test_material_dictionary_is_resolved_once_per_list(self):
+        with mock.patch('products.serializers.get_material_dictionary', wraps=get_material_dictionary) as dictionary:
+            response = self.client.get(reverse('printingservice-list'))
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertEqual(dictionary.call_count, 1)
+
+    def test_material_dictionary_is_reused_and_invalidated(self):
+        get_material_dictionary()
+        with self.assertNumQueries(0):
+            get_material_dictionary()
+        self.abs.name = 'ABS+'
+        self.abs.save()
+        response = self.client.get(reverse('printingservice-detail', kwargs={'pk': self.services[0].pk}))
+        self.assertEqual([material['name'] for material in response.data['materials']], ['ABS+', 'PLA'])
+
+
+class SlugAllocationTest(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Slugs', slug='slugs')
+        for slug in ('dragon', 'dragon-1', 'dragon-3', 'dragonfly'):
+            Product.objects.create(name=slug, slug=slug, price=Decimal('1.00'), category=self.category, stock=1)
+
+    def test_allocates_free_suffixes_with_one_query(self):
+        with self.assertNumQueries(1):
+            slugs = allocate_slugs(Product, ['Dragon', 'Dragon', 'Dragonfly', 'Unique'])
+        self.assertEqual(slugs, ['dragon-2', 'dragon-4', 'dragonfly-1', 'unique'])
+
+    def test_retries_when_slug_taken_concurrently(self):
+        # Первая проверка не видит slug'и, занятые параллельным запросом
+        real_taken_slugs = slug_allocation._taken_slugs
+        reads = iter([lambda model, bases: set(), real_taken_slugs])
+        attempts = []
+
+        def save(slug):
+            attempts.append(slug)
+            return Product.objects.create(name='Dragon', slug=slug, price=Decimal('1.00'), category=self.category, stock=1)
+
+        with mock.patch('products.slugs._taken_slugs', side_effect=lambda *args: next(reads)(*args)):
+            product = create_with_unique_slug(Product, 'Dragon', save)
+        self.assertEqual(attempts, ['dragon', 'dragon-2'])
+        self.assertEqual(product.slug, 'dragon-2')
+
+    def test_management_create_uses_allocator(self):
+        client = APIClient()
+        client.force_authenticate(user=User.objects.create_superuser(username='slug_admin', email='slug_admin@example.com', password='admin123'))
+        response = client.post(reverse('management-product-list'), {
+            'name': 'Dragon', 'price': '10.00', 'category_id': self.category.pk, 'stock': 1,
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['slug'], 'dragon-2')
+
+
+class WarmCatalogTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        settings_override = override_settings(CATALOG_SNAPSHOT_PATH=os.path.join(self.tmp_dir.name, 'catalog.bin'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.category = Category.objects.create(name='Warm', slug='warm')
+        for index in range(15):
+            Product.objects.create(
+                name=f'Warm {index}', slug=f'warm-{index}', price=Decimal('10.00'), category=self.category, stock=1
+            )
+        PrintingService.objects.create(name='FDM', description='', base_price=Decimal('300.00'))
+        Review.objects.create(author_name='Anna', review_text='Great')
+
+    def test_warms_hot_responses_under_given_host(self):
+        out = io.StringIO()
+        call_command('warm_catalog', '--url', 'http://testserver', stdout=out)
+        output = out.getvalue()
+        self.assertIn('http://testserver/api/products/?page=2', output)
+        self.assertNotIn('page=3', output) # страниц всего две
+        self.assertIn('Прогрето ответов: 7, с ошибкой: 0', output)
+
+        with self.assertNumQueries(0):
+            for url, params in (
+                (reverse('product-list'), {}),
+                (reverse('product-list'), {'page': 2}),
+                (reverse('product-list'), {'category': 'warm'}),
+                (reverse('category-list'), {}),
+                (reverse('printingservice-list'), {}),
+                (reverse('homepage-settings'), {}),
+                (reverse('review-list'), {}),
+            ):
+                self.assertEqual(self.client.get(url, params).status_code, status.HTTP_200_OK)
+
+    def test_review_change_invalidates_cached_reviews(self):
+        call_command('warm_catalog', '--url', 'http://testserver', stdout=io.StringIO())
+        Review.objects.create(author_name='Boris', review_text='Fast', is_visible=True)
+        response = self.client.get(reverse('review-list'))
+        self.assertEqual(response.data['count'], 2)
+
+
+class CategoryStatsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.figures = Category.objects.create(name='Figures', slug='figures')
+        self.empty = Category.objects.create(name='Empty', slug='empty')
+        for price, available in (('350.00', True), ('900.00', True), ('10.00', False)):
+            Product.objects.create(
+                name=f'Figure {price}', slug=f'figure-{price}', price=Decimal(price),
+                category=self.figures, stock=1, available=available
+            )
+
+    def test_list_is_annotated_with_one_query(self):
+        with self.assertNumQueries(2): # COUNT пагинации + категории с агрегатами
+            response = self.client.get(reverse('category-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stats = {category['slug']: category for category in response.data['results']}
+        self.assertEqual(stats['figures']['product_count'], 2)
+        self.assertEqual(stats['figures']['min_price'], '350.00')
+        self.assertEqual(stats['figures']['max_price'], '900.00')
+        self.assertEqual(stats['empty']['product_count'], 0)
+        self.assertIsNone(stats['empty']['min_price'])
+
+    def test_product_change_refreshes_cached_stats(self):
+        self.client.get(reverse('category-list'))
+        Product.objects.create(
+            name='Cheap', slug='cheap', price=Decimal('100.00'), category=self.empty, stock=1, available=True
+        )
+        response = self.client.get(reverse('category-detail', kwargs={'slug': 'empty'}))
+        self.assertEqual(response.data['product_count'], 1)
+        self.assertEqual(response.data['min_price'], '100.00')
+
+
+@override_settings(SITE_URL='https://bat3d.ru')
+class FeedsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        settings_override = override_settings(FEEDS_DIR=self.tmp_dir.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.category = Category.objects.create(name='Фигурки & Co', slug='figures')
+        self.dragon = Product.objects.create(
+            name='Dragon <XL>', slug='dragon', price=Decimal('350.00'), category=self.category, stock=2, available=True
+        )
+        self.hidden = Product.objects.create(
+            name='Hidden', slug='hidden', price=Decimal('10.00'), category=self.category, stock=1, available=False
+        )
+        self.service = PrintingService.objects.create(name='FDM', description='', base_price=Decimal('300.00'))
+
+    def test_sitemap_index_and_parts(self):
+        update_feeds('http://testserver/')
+        response = self.client.get(reverse('sitemap'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('http://testserver/sitemap-pages.xml.gz', response.content.decode())
+        self.assertIn('http://testserver/sitemap-products-0.xml.gz', response.content.decode())
+
+        response = self.client.get(reverse('sitemap-part', kwargs={'part': 'products-0'}))
+        sitemap = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn(f'<loc>https://bat3d.ru/product/{self.dragon.pk}</loc>', sitemap)
+        self.assertNotIn(f'/product/{self.hidden.pk}<', sitemap)
+
+        response = self.client.get(reverse('sitemap-part', kwargs={'part': 'pages'}))
+        sitemap = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn(f'<loc>https://bat3d.ru/service/{self.service.pk}</loc>', sitemap)
+        self.assertEqual(self.client.get('/sitemap-products-9.xml.gz').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_only_changed_parts_are_rebuilt(self):
+        _, rebuilt = update_feeds('http://testserver/')
+        self.assertEqual(sorted(rebuilt), ['feed', 'sitemap-pages', 'sitemap-products-0'])
+        _, rebuilt = update_feeds('http://testserver/')
+        self.assertEqual(rebuilt, [])
+
+        self.dragon.price = Decimal('400.00')
+        self.dragon.save()
+        _, rebuilt = update_feeds('http://testserver/')
+        self.assertEqual(sorted(rebuilt), ['feed', 'sitemap-products-0'])
+
+    def test_product_feed_is_escaped_and_served_gzipped_or_plain(self):
+        update_feeds('http://testserver/')
+        response = self.client.get(reverse('product-feed'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        feed = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn(f'<category id="{self.category.pk}">Фигурки &amp; Co</category>', feed)
+        self.assertIn(f'<offer id="{self.dragon.pk}" available="true">', feed)
+        self.assertIn('<price>350.00</price>', feed)
+        self.assertIn('<name>Dragon &lt;XL&gt;</name>', feed)
+        self.assertNotIn('Hidden', feed)
+
+        response = self.client.get(reverse('product-feed'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content).decode(), feed)
+
+    def test_requests_serve_files_without_rebuilding(self):
+        update_feeds('http://testserver/')
+        self.dragon.price = Decimal('400.00')
+        self.dragon.save()
+        with mock.patch('products.feeds.update_feeds') as update, mock.patch('products.feeds.threading.Thread') as thread:
+            response = self.client.get(reverse('product-feed'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertIn('<price>350.00</price>', gzip.decompress(b''.join(response.streaming_content)).decode())
+        update.assert_not_called()
+        thread.assert_not_called()
+
+    def test_first_request_starts_one_background_build(self):
+        with mock.patch('products.feeds.threading.Thread') as thread:
+            response = self.client.get(reverse('sitemap'))
+            self.assertEqual(self.client.get(reverse('product-feed')).status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(thread.return_value.start.call_count, 1)
+
+    def test_build_feeds_requires_backend_url(self):
+        with self.assertRaises(CommandError):
+            call_command('build_feeds', stdout=io.StringIO())
+        with override_settings(FEEDS_MEDIA_BASE_URL='https://api.bat3d.ru/'):
+            call_command('build_feeds', stdout=io.StringIO())
+        self.assertTrue(os.path.exists(feed_path()))
@@ -1,21 +1,93 @@
+import os
+
 from django.shortcuts import render
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
 from rest_framework import viewsets, permissions, status
 from django_filters import rest_framework as filters
-from django.utils.text import slugify
-from rest_framework.parsers import MultiPartParser, FormParser
-from .models import Category, Product, PrintingService
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
+from .models import Category, Product, PrintingService, PrintingMaterial
+from .bulk import bulk_update_products
+from .cache import CatalogCacheMixin
+from .changes import ResyncRequired, build_change_feed, resolve_since
+from .facets import DEFAULT_PRICE_STEP, get_facets
+from .feeds import ensure_feeds, feed_path, iter_gzip_file, sitemap_part_path
+from .importexport import CONTENT_TYPES, FORMAT_CSV, FORMATS, detect_format, import_products, iter_export, read_rows
+from .pagination import CatalogPagination
+from .recommendations import TOP_K, recommendations_for, recommendations_for_many
+from .slugs import create_with_unique_slug
+from .snapshot import KIND_PRODUCT, KIND_SERVICE, CatalogSnapshotMixin
 from .serializers import (
     CategorySerializer,
+    CategoryStatsSerializer,
     ProductSerializer,
-    PrintingServiceSerializer
+    PrintingServiceSerializer,
+    ProductBulkUpdateSerializer
 )
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.response import Response
+from rest_framework.decorators import action
+from search.filters import FullTextSearchFilter
+from search.indexing import search_object_ids
+from search.suggest import suggest
+from search.models import SearchDocument
+
+SEARCH_RESULTS_DEFAULT_LIMIT = 20
+SEARCH_RESULTS_MAX_LIMIT = 100
+SUGGEST_DEFAULT_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+BATCH_MAX_IDS = 200
+POPULAR_ORDERING = 'popular'
+CHANGES_DEFAULT_LIMIT = 500
+CHANGES_MAX_LIMIT = 1000
+RECOMMENDATIONS_DEFAULT_LIMIT = 10
+
+
+def _get_limit(request, default, maximum):
+    try:
+        limit = int(request.query_params.get('limit', default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def order_by_popularity(queryset, request):
+    """
+    ?ordering=popular - по продажам за 30 дней (таблицы *Popularity, products.popularity).
+    В keyset-режиме (?cursor=) сортировку задает пагинация.
+    """
+    params = request.query_params
+    if params.get('ordering') != POPULAR_ORDERING or 'cursor' in params:
+        return queryset
+    return queryset.order_by(F('popularity__units_30d').desc(nulls_last=True), 'name', 'id')
+
+
+class RankedSearchMixin:
+    """
+    Публичный полнотекстовый поиск: GET <prefix>/search/?q=...&limit=...
+    Возвращает объекты из get_queryset() вьюсета в порядке релевантности.
+    """
+    search_document_kind = None
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({'detail': "Параметр 'q' обязателен."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = _get_limit(request, SEARCH_RESULTS_DEFAULT_LIMIT, SEARCH_RESULTS_MAX_LIMIT)
+
+        ranked_ids = search_object_ids(query, self.search_document_kind)
+        objects = self.filter_queryset(self.get_queryset()).in_bulk(ranked_ids)
+        results = [objects[pk] for pk in ranked_ids if pk in objects][:limit]
+        serializer = self.get_serializer(results, many=True)
+        return Response({'query': query, 'results': serializer.data})
 
 # Create your views here.
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAdminUser]
@@ -26,6 +98,24 @@ class CategoryViewSet(viewsets.ModelViewSet):
             return [permissions.AllowAny()]
         return super().get_permissions()
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            # Число доступных товаров и диапазон цен - одним GROUP BY вместе с категориями.
+            # Ответ кэшируется по версии каталога, которая меняется при любом изменении товара.
+            available = Q(products__available=True)
+            queryset = queryset.annotate(
+                product_count=Count('products', filter=available),
+                min_price=Min('products__price', filter=available),
+                max_price=Max('products__price', filter=available),
+            )
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action in ['list', 'retrieve']:
+            return CategoryStatsSerializer
+        return super().get_serializer_class()
+
 class ProductFilter(filters.FilterSet):
     min_price = filters.NumberFilter(field_name='price', lookup_expr='gte')
     max_price = filters.NumberFilter(field_name='price', lookup_expr='lte')
@@ -36,38 +126,231 @@ class ProductFilter(filters.FilterSet):
         model = Product
         fields = ['category', 'available', 'min_price', 'max_price']
 
-class ProductViewSet(viewsets.ModelViewSet):
+class PrintingServiceFilter(filters.FilterSet):
+    """
+    ?material=<id>&property=<название> - услуги с материалом, у которого есть свойство
+    (оба условия проверяются для одного и того же материала);
+    ?weight= - модель такого веса принимается (min_weight <= weight <= max_weight);
+    ?weight_min= / ?weight_max= - услуга принимает весь диапазон.
+    """
+    material = filters.NumberFilter(method='filter_material')
+    property = filters.CharFilter(method='filter_material')
+    weight = filters.NumberFilter(method='filter_weight')
+    weight_min = filters.NumberFilter(field_name='min_weight', lookup_expr='lte')
+    weight_max = filters.NumberFilter(field_name='max_weight', lookup_expr='gte')
+
+    class Meta:
+        model = PrintingService
+        fields = ['material', 'property', 'weight', 'weight_min', 'weight_max']
+
+    def filter_material(self, queryset, name, value):
+        # Применяется в filter_queryset одним подзапросом по материалам
+        return queryset
+
+    def filter_weight(self, queryset, name, value):
+        return queryset.filter(min_weight__lte=value, max_weight__gte=value)
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        conditions = {}
+        if self.form.cleaned_data.get('material') is not None:
+            conditions['pk'] = self.form.cleaned_data['material']
+        if self.form.cleaned_data.get('property'):
+            conditions['properties__name__iexact'] = self.form.cleaned_data['property']
+        if conditions:
+            materials = PrintingMaterial.objects.filter(services=OuterRef('pk'), **conditions)
+            queryset = queryset.filter(Exists(materials))
+        return queryset
+
+class ProductViewSet(CatalogCacheMixin, CatalogSnapshotMixin, RankedSearchMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAdminUser]
     filterset_class = ProductFilter
+    pagination_class = CatalogPagination
+    # Ключи keyset-пагинации (?cursor=): публичное имя сортировки -> поле модели
+    cursor_ordering_fields = {'name': 'name', 'price': 'price'}
+    search_document_kind = SearchDocument.KIND_PRODUCT
+    snapshot_kind = KIND_PRODUCT
+    catalog_cache_actions = ('list', 'retrieve', 'batch', 'recommendations', 'cart_recommendations')
     lookup_field = 'pk'
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in [
+            'list', 'retrieve', 'search', 'suggest', 'facets', 'batch', 'changes',
+            'recommendations', 'cart_recommendations'
+        ]:
             return [permissions.AllowAny()]
         return super().get_permissions()
     
     def get_queryset(self):
         queryset = super().get_queryset()
-        if self.action == 'list' and 'available' not in self.request.query_params:
+        if self.action in ['list', 'search', 'facets'] and 'available' not in self.request.query_params:
             queryset = queryset.filter(available=True)
+        if self.action in ['list', 'retrieve', 'search']:
+            queryset = self.get_serializer_class().optimize_queryset(queryset, self.request)
+        if self.action == 'list':
+            queryset = order_by_popularity(queryset, self.request)
         return queryset
 
-class PrintingServiceViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """Подсказки по названиям товаров, категорий и услуг: GET /api/products/suggest/?q="""
+        query = request.query_params.get('q', '')
+        limit = _get_limit(request, SUGGEST_DEFAULT_LIMIT, SUGGEST_MAX_LIMIT)
+        return Response({'query': query, 'results': suggest(query, limit)})
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Фасеты для фильтров каталога: GET /api/products/facets/?category=&min_price=&max_price=&price_step=
+        Принимает те же параметры, что и список товаров (ProductFilter).
+        """
+        try:
+            price_step = int(request.query_params.get('price_step', DEFAULT_PRICE_STEP))
+        except ValueError:
+            price_step = DEFAULT_PRICE_STEP
+        price_step = max(1, price_step)
+        params = [
+            (key, value)
+            for key, value in request.query_params.items()
+            if key in ProductFilter.base_filters
+        ]
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(get_facets(queryset, params, price_step))
+
+    @action(detail=False, methods=['get'])
+    def batch(self, request):
+        """
+        Несколько товаров одним запросом: GET /api/products/batch/?ids=12,7,dragon-figure
+        Принимает id и slug вперемешку (как retrieve - без фильтра по available).
+        Товары возвращаются в порядке запроса, ненайденные идентификаторы - в missing.
+        """
+        return self._cached_response(self._batch, request)
+
+    def _batch(self, request):
+        raw_identifiers = (identifier.strip() for identifier in request.query_params.get('ids', '').split(','))
+        identifiers = list(dict.fromkeys(filter(None, raw_identifiers)))
+        if not identifiers:
+            return Response({'detail': "Параметр 'ids' обязателен."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(identifiers) > BATCH_MAX_IDS:
+            return Response(
+                {'detail': f'Не больше {BATCH_MAX_IDS} идентификаторов за запрос.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        pks = [int(identifier) for identifier in identifiers if identifier.isdigit()]
+        slugs = [identifier for identifier in identifiers if not identifier.isdigit()]
+        products = self.get_serializer_class().optimize_queryset(
+            Product.objects.filter(Q(pk__in=pks) | Q(slug__in=slugs)), request, required_fields=['slug']
+        )
+        by_identifier = {}
+        for product in products:
+            by_identifier[str(product.pk)] = product
+            by_identifier[product.slug] = product
+
+        results, missing, seen = [], [], set()
+        for identifier in identifiers:
+            product = by_identifier.get(identifier)
+            if product is None:
+                missing.append(identifier)
+            elif product.pk not in seen:
+                # id и slug одного товара в запросе - один результат
+                seen.add(product.pk)
+                results.append(product)
+        serializer = self.get_serializer(results, many=True)
+        return Response({'results': serializer.data, 'missing': missing})
+
+    @action(detail=True, methods=['get'])
+    def recommendations(self, request, pk=None):
+        """
+        "Часто покупают вместе" для карточки товара: GET /api/products/12/recommendations/?limit=
+        Таблица строится командой build_recommendations, здесь - одно чтение по индексу.
+        """
+        return self._cached_response(self._recommendations, request, pk)
+
+    def _recommendations(self, request, pk):
+        if not str(pk).isdigit():
+            return Response({'results': []})
+        limit = _get_limit(request, RECOMMENDATIONS_DEFAULT_LIMIT, TOP_K)
+        products = self.get_serializer_class().optimize_queryset(recommendations_for(int(pk)), request)[:limit]
+        serializer = self.get_serializer(products, many=True)
+        return Response({'results': serializer.data})
+
+    @action(detail=False, methods=['get'], url_path='recommendations', url_name='cart-recommendations')
+    def cart_recommendations(self, request):
+        """
+        Рекомендации для корзины: GET /api/products/recommendations/?ids=12,7&limit=
+        Соседи всех переданных товаров с суммарным баллом, без самих товаров.
+        """
+        return self._cached_response(self._cart_recommendations, request)
+
+    def _cart_recommendations(self, request):
+        raw_ids = (identifier.strip() for identifier in request.query_params.get('ids', '').split(','))
+        product_ids = list(dict.fromkeys(int(identifier) for identifier in raw_ids if identifier.isdigit()))
+        if not product_ids:
+            return Response({'detail': "Параметр 'ids' обязателен."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(product_ids) > BATCH_MAX_IDS:
+            return Response(
+                {'detail': f'Не больше {BATCH_MAX_IDS} идентификаторов за запрос.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        limit = _get_limit(request, RECOMMENDATIONS_DEFAULT_LIMIT, TOP_K)
+        ranked_ids = [product_id for product_id, _ in recommendations_for_many(product_ids)[:limit]]
+        products = self.get_serializer_class().optimize_queryset(Product.objects.filter(pk__in=ranked_ids), request)
+        by_id = {product.pk: product for product in products}
+        serializer = self.get_serializer([by_id[pk] for pk in ranked_ids if pk in by_id], many=True)
+        return Response({'results': serializer.data})
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Лента изменений каталога (товары, услуги, категории):
+        GET /api/products/changes/?since=<next_since из прошлого ответа или дата ISO 8601>&limit=
+        """
+        try:
+            since = resolve_since(request.query_params.get('since'))
+        except ValueError:
+            return Response(
+                {'detail': "Параметр 'since' - номер изменения или дата в формате ISO 8601."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        limit = _get_limit(request, CHANGES_DEFAULT_LIMIT, CHANGES_MAX_LIMIT)
+        try:
+            return Response(build_change_feed(since, limit, request, self.get_serializer_context()))
+        except ResyncRequired as e:
+            return Response(
+                {
+                    'detail': 'Изменения после since уже удалены из журнала: загрузите каталог заново.',
+                    'resync_required': True,
+                    'next_since': e.head,
+                },
+                status=status.HTTP_410_GONE
+            )
+
+class PrintingServiceViewSet(CatalogCacheMixin, CatalogSnapshotMixin, RankedSearchMixin, viewsets.ModelViewSet):
     queryset = PrintingService.objects.filter(available=True)
     serializer_class = PrintingServiceSerializer
     permission_classes = [permissions.IsAdminUser]
+    filterset_class = PrintingServiceFilter
+    pagination_class = CatalogPagination
+    cursor_ordering_fields = {'name': 'name', 'price': 'base_price'}
+    search_document_kind = SearchDocument.KIND_SERVICE
+    snapshot_kind = KIND_SERVICE
     
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'search']:
             return [permissions.AllowAny()]
         return super().get_permissions()
     
     def get_queryset(self):
         queryset = super().get_queryset()
-        if self.action in ['list', 'retrieve']:
-            return queryset.filter(available=True)
+        if self.action in ['list', 'retrieve', 'search']:
+            queryset = queryset.filter(available=True)
+            queryset = self.get_serializer_class().optimize_queryset(queryset, self.request)
+        if self.action == 'list':
+            queryset = order_by_popularity(queryset, self.request)
         return queryset
 
 class ProductManagementViewSet(viewsets.ModelViewSet):
@@ -75,9 +358,10 @@ class ProductManagementViewSet(viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [permissions.IsAdminUser] # Только администраторы могут управлять продуктами
     parser_classes = [MultiPartParser, FormParser]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
     filterset_class = ProductFilter # Можно использовать тот же фильтр, если он подходит
-    search_fields = ['name', 'description', 'category__name'] # Поля для поиска
+    search_fields = ['name', 'description', 'category__name'] # Поля для поиска (по индексу, см. search_document_kind)
+    search_document_kind = SearchDocument.KIND_PRODUCT
     ordering_fields = ['name', 'price', 'stock', 'created_at'] # Поля для сортировки
     # lookup_field = 'id' # По умолчанию pk, что соответствует id
 
@@ -113,14 +397,48 @@ class ProductManagementViewSet(viewsets.ModelViewSet):
             super().perform_create(serializer) # Позволяем стандартному методу обработать (возможно, с ошибкой)
             return
 
-        original_slug = slugify(name)
-        slug = original_slug
-        counter = 1
-        # Product._meta.model это Product class (self.queryset.model)
-        while self.queryset.model.objects.filter(slug=slug).exists():
-            slug = f'{original_slug}-{counter}'
-            counter += 1
-        serializer.save(slug=slug)
+        create_with_unique_slug(self.queryset.model, name, lambda slug: serializer.save(slug=slug))
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_catalog(self, request):
+        """
+        Массовый импорт товаров: POST multipart с полем file (.csv или .jsonl).
+        Формат определяется по расширению или параметру ?file_format=.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'detail': "Файл не передан (поле 'file')."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            file_format = detect_format(upload.name, request.query_params.get('file_format'))
+        except ValueError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(import_products(read_rows(upload, file_format)))
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export_catalog(self, request):
+        """Потоковая выгрузка всех товаров: GET ?file_format=csv|jsonl"""
+        file_format = request.query_params.get('file_format', FORMAT_CSV)
+        if file_format not in FORMATS:
+            return Response({'detail': f'Неподдерживаемый формат файла: {file_format}'}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(iter_export(file_format), content_type=CONTENT_TYPES[file_format])
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
+
+    @action(detail=False, methods=['post'], url_path='bulk-update', parser_classes=[JSONParser])
+    def bulk_update(self, request):
+        """
+        Массовое изменение цен/остатков одним UPDATE, например +7% на категорию:
+        {"filter": {"category": "figurki"}, "price_percent": "7", "price_round": "1"}
+        """
+        serializer = ProductBulkUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        rules = dict(serializer.validated_data)
+        filterset = ProductFilter(data=rules.pop('filter'), queryset=Product.objects.all())
+        if not filterset.is_valid():
+            return Response({'filter': filterset.errors}, status=status.HTTP_400_BAD_REQUEST)
+        dry_run = rules.pop('dry_run')
+        count = bulk_update_products(filterset.qs, rules, dry_run=dry_run)
+        return Response({'count': count, 'dry_run': dry_run})
 
 class CategoryManagementViewSet(viewsets.ModelViewSet):
     queryset = Category.objects.all()
@@ -141,13 +459,7 @@ class CategoryManagementViewSet(viewsets.ModelViewSet):
             super().perform_create(serializer)
             return
 
-        original_slug = slugify(name)
-        slug = original_slug
-        counter = 1
-        while self.queryset.model.objects.filter(slug=slug).exists():
-            slug = f'{original_slug}-{counter}'
-            counter += 1
-        serializer.save(slug=slug)
+        create_with_unique_slug(self.queryset.model, name, lambda slug: serializer.save(slug=slug))
 
 class PrintingServiceManagementViewSet(viewsets.ModelViewSet):
     queryset = PrintingService.objects.all() # Показываем все услуги для админки
@@ -157,10 +469,63 @@ class PrintingServiceManagementViewSet(viewsets.ModelViewSet):
     # lookup_field = 'id' # PK по умолчанию
 
     # Можно добавить фильтрацию, поиск, сортировку, если необходимо
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, OrderingFilter]
+    filterset_class = PrintingServiceFilter
     # filterset_fields = ['available'] # Пример фильтрации по доступности
     search_fields = ['name', 'description']
+    search_document_kind = SearchDocument.KIND_SERVICE
     ordering_fields = ['name', 'base_price', 'available']
 
     # Если для услуг нужна своя логика при создании/обновлении (например, обработка materials),
     # можно переопределить perform_create, perform_update
+
+
+def _feed_response(request, path, content_type):
+    """Готовый gzip-файл как есть, если клиент принимает gzip, иначе - потоковая распаковка."""
+    if not os.path.exists(path):
+        raise Http404
+    if 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Encoding'] = 'gzip'
+    else:
+        response = StreamingHttpResponse(iter_gzip_file(path), content_type=content_type)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def _feeds_not_ready():
+    # Файлы собираются в первый раз (feeds.ensure_feeds) - краулер повторит запрос
+    response = HttpResponse('Карта сайта и фид еще собираются.', status=503, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = '60'
+    return response
+
+
+def sitemap_index(request):
+    """GET /sitemap.xml - индекс частей карты сайта (см. products/feeds.py)."""
+    state = ensure_feeds(request.build_absolute_uri('/'))
+    if not state['parts']:
+        return _feeds_not_ready()
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for part in sorted(state['parts']):
+        location = request.build_absolute_uri(reverse('sitemap-part', kwargs={'part': part}))
+        lines.append(f'<sitemap><loc>{location}</loc></sitemap>\n')
+    lines.append('</sitemapindex>\n')
+    return HttpResponse(''.join(lines), content_type='application/xml; charset=utf-8')
+
+
+def sitemap_part(request, part):
+    """GET /sitemap-<часть>.xml.gz - часть карты сайта, сжатый файл по протоколу sitemaps."""
+    state = ensure_feeds(request.build_absolute_uri('/'))
+    if part not in state['parts']:
+        raise Http404
+    try:
+        return FileResponse(open(sitemap_part_path(part), 'rb'), content_type='application/gzip')
+    except FileNotFoundError:
+        raise Http404
+
+
+def product_feed(request):
+    """GET /feeds/products.yml - товарный фид YML."""
+    if not ensure_feeds(request.build_absolute_uri('/'))['parts']:
+        return _feeds_not_ready()
+    return _feed_response(request, feed_path(), 'application/xml; charset=utf-8')
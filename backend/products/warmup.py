@@ -0,0 +1,72 @@
+"""
+Прогрев кэша публичных ответов после деплоя (manage.py warm_catalog).
+
+Горячие ответы - страницы списка товаров, первые страницы категорий, категории,
+услуги, настройки главной и отзывы - выполняются через те же вьюхи, что и
+обычные запросы, поэтому попадают в кэш (CatalogCacheMixin) под теми же
+ключами. Ключ включает хост, а ссылки на изображения в ответе - схему, так что
+запросы строятся от боевого адреса API (CATALOG_WARM_URLS).
+
+Прогревать имеет смысл только общий кэш (REDIS_URL): кэш в памяти процесса
+команды воркерам gunicorn не виден.
+"""
+import logging
+import time
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from .models import Category
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGES = 3
+
+# Небольшие ответы, которые запрашивает каждая страница сайта
+SHARED_VIEWS = ('category-list', 'printingservice-list', 'homepage-settings', 'review-list')
+
+
+def get_warm_urls():
+    return list(getattr(settings, 'CATALOG_WARM_URLS', None) or [settings.SITE_URL])
+
+
+def _warm_one(factory, base_url, path, params):
+    base = urlsplit(base_url)
+    request = factory.get(path, params, HTTP_HOST=base.netloc, secure=base.scheme == 'https')
+    url = f'{base.scheme}://{base.netloc}{path}' + (f'?{urlencode(params)}' if params else '')
+    started = time.perf_counter()
+    try:
+        match = resolve(path)
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        status, data = response.status_code, getattr(response, 'data', None)
+    except Exception as e:
+        logger.error(f"[Warmup] Ошибка прогрева {url}: {e}", exc_info=True)
+        status, data = None, None
+    return url, status, time.perf_counter() - started, data
+
+
+def warm_catalog(base_url, pages=DEFAULT_PAGES):
+    """
+    Прогревает ответы для одного адреса API. Генератор: по мере прогрева
+    отдает (url, код ответа или None при ошибке, время в секундах).
+    """
+    factory = RequestFactory()
+    for name in SHARED_VIEWS:
+        url, status, elapsed, _ = _warm_one(factory, base_url, reverse(name), {})
+        yield url, status, elapsed
+
+    product_list = reverse('product-list')
+    for page in range(1, pages + 1):
+        # Первая страница - без ?page=1, как ее запрашивает фронтенд
+        url, status, elapsed, data = _warm_one(factory, base_url, product_list, {'page': page} if page > 1 else {})
+        yield url, status, elapsed
+        if status != 200 or not (isinstance(data, dict) and data.get('next')):
+            break
+
+    for slug in Category.objects.order_by('slug').values_list('slug', flat=True):
+        url, status, elapsed, _ = _warm_one(factory, base_url, product_list, {'category': slug})
+        yield url, status, elapsed
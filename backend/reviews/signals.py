@@ -0,0 +1,13 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from products.cache import bump_catalog_version
+from .models import Review
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_changed(sender, **kwargs):
+    # Публичный список отзывов кэшируется вместе с каталогом (CatalogCacheMixin)
+    bump_catalog_version()
+    transaction.on_commit(bump_catalog_version)
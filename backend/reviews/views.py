@@ -1,10 +1,12 @@
 from rest_framework import viewsets, permissions
+from products.cache import CatalogCacheMixin
 from .models import Review
 from .serializers import ReviewSerializer
 
-class ReviewViewSet(viewsets.ReadOnlyModelViewSet):
+class ReviewViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     A viewset for viewing published reviews.
+    Responses are cached until a review or the catalog changes (see reviews/signals.py).
     """
     queryset = Review.objects.filter(is_visible=True)
     serializer_class = ReviewSerializer
@@ -0,0 +1,133 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Q
+from django.utils.module_loading import import_string
+
+from .models import SearchDocument
+
+FTS_TABLE = 'search_fts'
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class BaseSearchBackend:
+    """Интерфейс поискового бэкенда. Документы SearchDocument уже сохранены в БД."""
+
+    def index(self, document_ids):
+        """Обновить индекс для документов с указанными id."""
+        raise NotImplementedError
+
+    def remove(self, document_ids):
+        """Удалить документы из индекса (строки SearchDocument удаляются отдельно)."""
+        raise NotImplementedError
+
+    def search(self, query, kind, limit):
+        """Вернуть список object_id, отсортированный по релевантности."""
+        raise NotImplementedError
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """tsvector + GIN индекс, русская морфология (config='russian')."""
+    config = 'russian'
+
+    def index(self, document_ids):
+        SearchDocument.objects.filter(pk__in=document_ids).update(
+            search_vector=(
+                SearchVector('title', weight='A', config=self.config) +
+                SearchVector('body', weight='B', config=self.config)
+            )
+        )
+
+    def remove(self, document_ids):
+        # Вектор хранится в самой строке документа
+        pass
+
+    def search(self, query, kind, limit):
+        search_query = SearchQuery(query, config=self.config, search_type='websearch')
+        return list(
+            SearchDocument.objects
+            .filter(kind=kind, search_vector=search_query)
+            .annotate(rank=SearchRank(F('search_vector'), search_query))
+            .order_by('-rank', 'object_id')
+            .values_list('object_id', flat=True)[:limit]
+        )
+
+
+class SQLiteFTSBackend(BaseSearchBackend):
+    """
+    FTS5 для локальной БД db.sqlite3. Стемминга для русского языка в FTS5 нет,
+    поэтому каждое слово запроса ищется как префикс ("печат*").
+    """
+
+    def index(self, document_ids):
+        document_ids = list(document_ids)
+        rows = SearchDocument.objects.filter(pk__in=document_ids).values_list('pk', 'title', 'body')
+        with connection.cursor() as cursor:
+            self._delete(cursor, document_ids)
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, body) VALUES (%s, %s, %s)',
+                list(rows)
+            )
+
+    def remove(self, document_ids):
+        with connection.cursor() as cursor:
+            self._delete(cursor, list(document_ids))
+
+    def search(self, query, kind, limit):
+        tokens = TOKEN_RE.findall(query.lower())
+        if not tokens:
+            return []
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT d.object_id FROM {FTS_TABLE} f '
+                f'JOIN {SearchDocument._meta.db_table} d ON d.id = f.rowid '
+                f'WHERE {FTS_TABLE} MATCH %s AND d.kind = %s '
+                f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0), d.object_id LIMIT %s',
+                [match, kind, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def _delete(self, cursor, document_ids):
+        if document_ids:
+            placeholders = ', '.join(['%s'] * len(document_ids))
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', document_ids)
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Запасной вариант для прочих СУБД: icontains по документам без отдельного индекса."""
+
+    def index(self, document_ids):
+        pass
+
+    def remove(self, document_ids):
+        pass
+
+    def search(self, query, kind, limit):
+        tokens = TOKEN_RE.findall(query)
+        if not tokens:
+            return []
+        condition = Q()
+        for token in tokens:
+            condition &= Q(title__icontains=token) | Q(body__icontains=token)
+        return list(
+            SearchDocument.objects.filter(condition, kind=kind)
+            .order_by('title', 'object_id')
+            .values_list('object_id', flat=True)[:limit]
+        )
+
+
+BACKENDS_BY_VENDOR = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteFTSBackend,
+}
+
+
+def get_search_backend():
+    """Бэкенд из settings.SEARCH_BACKEND или, по умолчанию, по типу текущей БД."""
+    backend_path = getattr(settings, 'SEARCH_BACKEND', None)
+    if backend_path:
+        return import_string(backend_path)()
+    return BACKENDS_BY_VENDOR.get(connection.vendor, SimpleSearchBackend)()
@@ -0,0 +1,23 @@
+from rest_framework.filters import SearchFilter
+from .indexing import search_object_ids
+
+# Сколько совпадений максимум учитывать при фильтрации списков в админ-панели
+MANAGEMENT_SEARCH_LIMIT = 1000
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    SearchFilter, который ищет по поисковому индексу вместо icontains-сканирования.
+
+    Вьюсет указывает тип документов в атрибуте ``search_document_kind``.
+    Если атрибут не задан, используется стандартное поведение SearchFilter
+    по ``search_fields``.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        kind = getattr(view, 'search_document_kind', None)
+        query = request.query_params.get(self.search_param, '').strip()
+        if kind is None or not query:
+            return super().filter_queryset(request, queryset, view)
+        object_ids = search_object_ids(query, kind, limit=MANAGEMENT_SEARCH_LIMIT)
+        return queryset.filter(pk__in=object_ids)
@@ -0,0 +1,119 @@
+from django.db import transaction
+
+from products.models import Product, PrintingService
+from .backends import get_search_backend
+from .models import SearchDocument
+
+DEFAULT_SEARCH_LIMIT = 200
+INDEX_CHUNK_SIZE = 500
+
+
+def _product_document(product):
+    body = ' '.join(filter(None, [product.description, product.category.name]))
+    return product.name, body
+
+
+def _service_document(service):
+    materials = ' '.join(material.name for material in service.materials.all())
+    body = ' '.join(filter(None, [service.description, ' '.join(service.get_features()), materials]))
+    return service.name, body
+
+
+# kind -> (модель, функция загрузки объектов, функция построения документа)
+DOCUMENT_SOURCES = {
+    SearchDocument.KIND_PRODUCT: (
+        Product,
+        lambda ids: Product.objects.filter(pk__in=ids).select_related('category'),
+        _product_document,
+    ),
+    SearchDocument.KIND_SERVICE: (
+        PrintingService,
+        lambda ids: PrintingService.objects.filter(pk__in=ids).prefetch_related('materials'),
+        _service_document,
+    ),
+}
+
+KIND_BY_MODEL = {model: kind for kind, (model, _, _) in DOCUMENT_SOURCES.items()}
+
+
+def index_objects(kind, object_ids, force=False):
+    """
+    Пересобирает поисковые документы для объектов каталога и обновляет индекс.
+    Объекты, которых уже нет в БД, удаляются из индекса. Без force неизмененные
+    документы в бэкенде не переиндексируются.
+    """
+    object_ids = list(object_ids)
+    if not object_ids:
+        return
+    _, load_objects, build_document = DOCUMENT_SOURCES[kind]
+    backend = get_search_backend()
+
+    with transaction.atomic():
+        existing = {
+            doc.object_id: doc
+            for doc in SearchDocument.objects.filter(kind=kind, object_id__in=object_ids)
+        }
+        to_create, to_update, unchanged_ids = [], [], []
+        for obj in load_objects(object_ids):
+            title, body = build_document(obj)
+            title = title[:255]
+            doc = existing.pop(obj.pk, None)
+            if doc is None:
+                to_create.append(SearchDocument(kind=kind, object_id=obj.pk, title=title, body=body))
+            elif doc.title != title or doc.body != body:
+                doc.title, doc.body = title, body
+                to_update.append(doc)
+            else:
+                unchanged_ids.append(doc.pk)
+
+        SearchDocument.objects.bulk_create(to_create, batch_size=INDEX_CHUNK_SIZE)
+        SearchDocument.objects.bulk_update(to_update, ['title', 'body', 'updated'], batch_size=INDEX_CHUNK_SIZE)
+        if to_create:
+            # bulk_create не везде возвращает pk - перечитываем id созданных документов
+            created_ids = SearchDocument.objects.filter(
+                kind=kind, object_id__in=[doc.object_id for doc in to_create]
+            ).values_list('pk', flat=True)
+        else:
+            created_ids = []
+        reindex_ids = [doc.pk for doc in to_update] + list(created_ids)
+        if force:
+            reindex_ids += unchanged_ids
+        backend.index(reindex_ids)
+
+        # Остались документы объектов, которых больше нет
+        if existing:
+            stale_ids = [doc.pk for doc in existing.values()]
+            backend.remove(stale_ids)
+            SearchDocument.objects.filter(pk__in=stale_ids).delete()
+
+
+def remove_objects(kind, object_ids):
+    doc_ids = list(
+        SearchDocument.objects.filter(kind=kind, object_id__in=list(object_ids)).values_list('pk', flat=True)
+    )
+    if not doc_ids:
+        return
+    with transaction.atomic():
+        get_search_backend().remove(doc_ids)
+        SearchDocument.objects.filter(pk__in=doc_ids).delete()
+
+
+def rebuild_index():
+    """Полная переиндексация каталога. Возвращает количество документов по типам."""
+    counts = {}
+    for kind, (model, _, _) in DOCUMENT_SOURCES.items():
+        all_ids = list(model.objects.values_list('pk', flat=True))
+        stale = SearchDocument.objects.filter(kind=kind).exclude(object_id__in=all_ids)
+        remove_objects(kind, stale.values_list('object_id', flat=True))
+        for start in range(0, len(all_ids), INDEX_CHUNK_SIZE):
+            index_objects(kind, all_ids[start:start + INDEX_CHUNK_SIZE], force=True)
+        counts[kind] = len(all_ids)
+    return counts
+
+
+def search_object_ids(query, kind, limit=DEFAULT_SEARCH_LIMIT):
+    """id объектов каталога, подходящих под запрос, в порядке убывания релевантности."""
+    query = (query or '').strip()
+    if not query:
+        return []
+    return get_search_backend().search(query, kind, limit)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from search.indexing import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Полностью пересобирает поисковый индекс каталога (товары и услуги).'
+
+    def handle(self, *args, **options):
+        counts = rebuild_index()
+        for kind, count in counts.items():
+            self.stdout.write(f'{kind}: {count}')
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран.'))
@@ -0,0 +1,63 @@
+from django.db import migrations
+
+FTS_TABLE = 'search_fts'
+
+
+def create_backend_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX search_document_vector_gin ON search_searchdocument USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(title, body, tokenize='unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_backend_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS search_document_vector_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def populate_documents(apps, schema_editor):
+    SearchDocument = apps.get_model('search', 'SearchDocument')
+    Product = apps.get_model('products', 'Product')
+    PrintingService = apps.get_model('products', 'PrintingService')
+
+    documents = []
+    for product in Product.objects.select_related('category').iterator():
+        body = ' '.join(filter(None, [product.description, product.category.name]))
+        documents.append(SearchDocument(kind='product', object_id=product.pk, title=product.name[:255], body=body))
+    for service in PrintingService.objects.prefetch_related('materials'):
+        materials = ' '.join(material.name for material in service.materials.all())
+        body = ' '.join(filter(None, [service.description, service.features, materials]))
+        documents.append(SearchDocument(kind='service', object_id=service.pk, title=service.name[:255], body=body))
+    SearchDocument.objects.bulk_create(documents, batch_size=500)
+
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE search_searchdocument SET search_vector = "
+            "setweight(to_tsvector('russian', title), 'A') || setweight(to_tsvector('russian', body), 'B')"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, body) SELECT id, title, body FROM search_searchdocument'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+        ('products', '0005_catalog_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_backend_index, drop_backend_index),
+        migrations.RunPython(populate_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+
+class SearchDocument(models.Model):
+    """
+    Поисковый документ для одного объекта каталога (товар или услуга).
+
+    Документ поддерживается в актуальном состоянии через сигнал
+    products.signals.catalog_changed. Сам индекс зависит от СУБД:
+    в PostgreSQL это колонка search_vector (tsvector + GIN), в SQLite -
+    виртуальная FTS5-таблица search_fts (см. search.backends).
+    """
+    KIND_PRODUCT = 'product'
+    KIND_SERVICE = 'service'
+    KIND_CHOICES = [
+        (KIND_PRODUCT, _('product')),
+        (KIND_SERVICE, _('printing service')),
+    ]
+
+    kind = models.CharField(_('kind'), max_length=20, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField(_('object id'))
+    title = models.CharField(_('title'), max_length=255)
+    body = models.TextField(_('body'), blank=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    updated = models.DateTimeField(_('updated'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('search document')
+        verbose_name_plural = _('search documents')
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='search_document_kind_object_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind}:{self.object_id}'
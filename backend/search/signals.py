@@ -0,0 +1,40 @@
+from django.db import transaction
+from django.dispatch import receiver
+from products.models import Category, Product, PrintingMaterial, PrintingService
+from products.signals import catalog_changed
+from .indexing import KIND_BY_MODEL, index_objects, remove_objects
+from .models import SearchDocument
+from . import suggest
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(catalog_changed)
+def sync_search_index(sender, pks, deleted=False, **kwargs):
+    try:
+        # Савепоинт: ошибка индексации не должна ломать внешнюю транзакцию сохранения товара
+        with transaction.atomic():
+            if sender in KIND_BY_MODEL:
+                kind = KIND_BY_MODEL[sender]
+                if deleted:
+                    remove_objects(kind, pks)
+                else:
+                    index_objects(kind, pks)
+            elif sender is Category and not deleted:
+                # Название категории входит в документ товара.
+                # При удалении категории товары удаляются каскадно и приходят отдельными сигналами.
+                product_ids = Product.objects.filter(category_id__in=pks).values_list('pk', flat=True)
+                index_objects(SearchDocument.KIND_PRODUCT, product_ids)
+            elif sender is PrintingMaterial and not deleted:
+                # Названия материалов входят в документ услуги. Услуги удаленного
+                # материала приходят отдельным сигналом (products.signals.catalog_object_deleted).
+                service_ids = PrintingService.objects.filter(materials__in=pks).values_list('pk', flat=True).distinct()
+                index_objects(SearchDocument.KIND_SERVICE, service_ids)
+    except Exception as e:
+        logger.error(f"[Search] Ошибка обновления поискового индекса для {sender.__name__} {pks}: {e}", exc_info=True)
+
+
+@receiver(catalog_changed)
+def invalidate_suggestions(sender, **kwargs):
+    suggest.invalidate()
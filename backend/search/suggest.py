@@ -0,0 +1,193 @@
+"""
+Подсказки для строки поиска (typeahead).
+
+Индекс строится в памяти процесса по названиям доступных товаров, категорий
+и услуг: отсортированный список слов для поиска по префиксу и словарь
+триграмм для нечеткого совпадения. Ответы на популярные префиксы кэшируются
+в LRU-кэше. Индекс помечается устаревшим по сигналу catalog_changed и тогда
+перестраивается сразу - воркер, изменивший каталог, видит свои изменения.
+В остальных воркерах индекс перестраивается при смене версии каталога
+(products.cache) и не реже чем раз в SUGGEST_INDEX_TTL секунд - в фоновом потоке:
+версия меняется и без изменения названий (остатки, отзывы, настройки главной),
+поэтому запросы до окончания сборки обслуживает прежний индекс.
+"""
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+
+from products.cache import get_catalog_version
+from products.models import Category, Product, PrintingService
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+DEFAULT_INDEX_TTL = 300
+LRU_CACHE_SIZE = 2048
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall(text.lower().replace('ё', 'е')))
+
+
+def trigrams(text):
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestionIndex:
+    # Порядок типов при равной релевантности
+    KIND_PRIORITY = {'category': 0, 'product': 1, 'service': 2}
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.normalized = [normalize(entry['name']) for entry in entries]
+        words = []
+        self.grams = defaultdict(set)
+        for position, text in enumerate(self.normalized):
+            for word in set(text.split()):
+                words.append((word, position))
+            for gram in trigrams(text):
+                self.grams[gram].add(position)
+        words.sort()
+        self.words = words
+        self.word_keys = [word for word, _ in words]
+
+    @classmethod
+    def build(cls):
+        entries = [
+            {'type': 'category', 'id': pk, 'name': name, 'slug': slug}
+            for pk, name, slug in Category.objects.values_list('pk', 'name', 'slug')
+        ]
+        entries += [
+            {'type': 'product', 'id': pk, 'name': name, 'slug': slug}
+            for pk, name, slug in Product.objects.filter(available=True).values_list('pk', 'name', 'slug')
+        ]
+        entries += [
+            {'type': 'service', 'id': pk, 'name': name}
+            for pk, name in PrintingService.objects.filter(available=True).values_list('pk', 'name')
+        ]
+        return cls(entries)
+
+    def _prefix_matches(self, prefix):
+        start = bisect.bisect_left(self.word_keys, prefix)
+        matches = set()
+        for word, position in self.words[start:]:
+            if not word.startswith(prefix):
+                break
+            matches.add(position)
+        return matches
+
+    def query(self, text, limit):
+        query = normalize(text)
+        if not query:
+            return []
+        scores = {}
+
+        # Каждое слово запроса должно быть префиксом какого-то слова названия
+        positions = None
+        for token in query.split():
+            token_matches = self._prefix_matches(token)
+            positions = token_matches if positions is None else positions & token_matches
+        for position in positions or ():
+            scores[position] = 2.0 if self.normalized[position].startswith(query) else 1.0
+
+        # Нечеткое совпадение по триграммам (опечатки, середина слова)
+        if len(query) >= 3:
+            query_grams = trigrams(query)
+            shared = defaultdict(int)
+            for gram in query_grams:
+                for position in self.grams.get(gram, ()):
+                    shared[position] += 1
+            for position, count in shared.items():
+                similarity = count / len(query_grams)
+                if similarity >= 0.5:
+                    scores[position] = max(scores.get(position, 0.0), similarity * 0.9)
+
+        ranked = sorted(
+            scores,
+            key=lambda p: (
+                -scores[p], self.KIND_PRIORITY[self.entries[p]['type']],
+                len(self.normalized[p]), self.normalized[p],
+            )
+        )
+        return [self.entries[position] for position in ranked[:limit]]
+
+
+_lock = threading.Lock()
+_index = None
+_index_built_at = 0.0
+_index_version = None
+_index_dirty = True
+_building = False
+
+
+def invalidate():
+    global _index_dirty
+    _index_dirty = True
+
+
+def _is_stale(version, ttl):
+    return (
+        _index is None or _index_dirty or version != _index_version
+        or time.monotonic() - _index_built_at >= ttl
+    )
+
+
+def _install(index, version):
+    global _index, _index_built_at, _index_version
+    _index = index
+    _index_built_at = time.monotonic()
+    _index_version = version
+    _cached_suggest.cache_clear()
+
+
+def _build_in_background(version):
+    global _building
+    try:
+        index = SuggestionIndex.build()
+        with _lock:
+            # Локальное изменение каталога во время сборки перестроит индекс само
+            if not _index_dirty:
+                _install(index, version)
+    finally:
+        with _lock:
+            _building = False
+
+
+def _run_background_build(version):
+    try:
+        _build_in_background(version)
+    finally:
+        connection.close()
+
+
+def get_index():
+    global _index_dirty, _building
+    ttl = getattr(settings, 'SUGGEST_INDEX_TTL', DEFAULT_INDEX_TTL)
+    version = get_catalog_version()
+    if not _is_stale(version, ttl):
+        return _index
+    with _lock:
+        if not _is_stale(version, ttl):
+            return _index
+        if _index is None or _index_dirty:
+            _index_dirty = False
+            _install(SuggestionIndex.build(), version)
+        elif not _building:
+            _building = True
+            threading.Thread(target=_run_background_build, args=(version,), daemon=True).start()
+    return _index
+
+
+@lru_cache(maxsize=LRU_CACHE_SIZE)
+def _cached_suggest(index, query, limit):
+    # Индекс входит в ключ: ответы старой версии индекса никогда не вернутся
+    return tuple(index.query(query, limit))
+
+
+def suggest(query, limit=8):
+    return list(_cached_suggest(get_index(), normalize(query), limit))
@@ -0,0 +1,151 @@
+from decimal import Decimal
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from products.cache import bump_catalog_version, get_catalog_version
+from products.models import Category, Product, PrintingService, PrintingMaterial
+from .indexing import rebuild_index, search_object_ids
+from .models import SearchDocument
+from . import suggest
+
+User = get_user_model()
+
+
+class CatalogSearchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Фигурки', slug='figurki')
+        self.dragon = Product.objects.create(
+            name='Дракон', slug='dragon', description='Фигурка дракона из PLA пластика',
+            price=Decimal('500.00'), category=self.category, stock=3, available=True
+        )
+        self.vase = Product.objects.create(
+            name='Ваза', slug='vase', description='Ваза с узором дракона',
+            price=Decimal('900.00'), category=self.category, stock=1, available=True
+        )
+        self.hidden = Product.objects.create(
+            name='Дракон скрытый', slug='hidden-dragon', description='',
+            price=Decimal('100.00'), category=self.category, stock=1, available=False
+        )
+
+    def test_documents_follow_model_saves(self):
+        self.assertTrue(SearchDocument.objects.filter(kind='product', object_id=self.dragon.pk).exists())
+        self.dragon.name = 'Грифон'
+        self.dragon.save()
+        self.assertEqual(SearchDocument.objects.get(kind='product', object_id=self.dragon.pk).title, 'Грифон')
+        self.assertIn(self.dragon.pk, search_object_ids('грифон', SearchDocument.KIND_PRODUCT))
+        self.dragon.delete()
+        self.assertFalse(SearchDocument.objects.filter(kind='product', object_id=self.dragon.pk).exists())
+        self.assertEqual(search_object_ids('грифон', SearchDocument.KIND_PRODUCT), [])
+
+    def test_category_rename_reindexes_products(self):
+        self.category.name = 'Статуэтки'
+        self.category.save()
+        self.assertIn(self.vase.pk, search_object_ids('статуэтки', SearchDocument.KIND_PRODUCT))
+
+    def test_public_search_endpoint_ranks_title_matches_first(self):
+        response = self.client.get(reverse('product-search'), {'q': 'дракон'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = [item['id'] for item in response.data['results']]
+        # Недоступный товар в публичный поиск не попадает
+        self.assertEqual(ids, [self.dragon.pk, self.vase.pk])
+
+    def test_public_search_requires_query(self):
+        response = self.client.get(reverse('product-search'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_service_search_includes_material_names(self):
+        material = PrintingMaterial.objects.create(
+            name='PETG', description='', price_multiplier=Decimal('1.20'), color='black'
+        )
+        service = PrintingService.objects.create(name='FDM печать', description='Печать деталей', base_price=Decimal('300.00'))
+        service.materials.add(material)
+        response = self.client.get(reverse('printingservice-search'), {'q': 'petg'})
+        self.assertEqual([item['id'] for item in response.data['results']], [service.pk])
+
+    def test_deleted_material_leaves_service_documents(self):
+        material = PrintingMaterial.objects.create(
+            name='PETG', description='', price_multiplier=Decimal('1.20'), color='black'
+        )
+        service = PrintingService.objects.create(name='FDM печать', description='Печать деталей', base_price=Decimal('300.00'))
+        service.materials.add(material)
+        material.delete()
+        response = self.client.get(reverse('printingservice-search'), {'q': 'petg'})
+        self.assertEqual(response.data['results'], [])
+
+    def test_management_search_uses_index(self):
+        admin = User.objects.create_superuser(username='search_admin', email='search_admin@example.com', password='admin123')
+        self.client.force_authenticate(user=admin)
+        response = self.client.get(reverse('management-product-list'), {'search': 'дракон'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        ids = {item['id'] for item in response.data['results']}
+        self.assertEqual(ids, {self.dragon.pk, self.vase.pk, self.hidden.pk})
+
+    def test_rebuild_index(self):
+        SearchDocument.objects.all().delete()
+        counts = rebuild_index()
+        self.assertEqual(counts[SearchDocument.KIND_PRODUCT], 3)
+        self.assertIn(self.vase.pk, search_object_ids('ваза', SearchDocument.KIND_PRODUCT))
+
+
+class SuggestTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        suggest.invalidate()
+        self.category = Category.objects.create(name='Фигурки', slug='figurki')
+        self.dragon = Product.objects.create(
+            name='Дракон большой', slug='dragon', description='',
+            price=Decimal('500.00'), category=self.category, stock=3, available=True
+        )
+        Product.objects.create(
+            name='Дракончик скрытый', slug='hidden-dragon', description='',
+            price=Decimal('100.00'), category=self.category, stock=1, available=False
+        )
+        self.service = PrintingService.objects.create(
+            name='Печать фигурок', description='', base_price=Decimal('300.00')
+        )
+
+    def suggest(self, q, **params):
+        response = self.client.get(reverse('product-suggest'), {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [(item['type'], item['id']) for item in response.data['results']]
+
+    def test_prefix_matches_any_word(self):
+        self.assertEqual(self.suggest('драк'), [('product', self.dragon.pk)])
+        self.assertEqual(self.suggest('бол'), [('product', self.dragon.pk)])
+        # Категория выше услуги при одинаковой релевантности
+        self.assertEqual(self.suggest('фигур'), [('category', self.category.pk), ('service', self.service.pk)])
+
+    def test_typo_matches_by_trigrams(self):
+        self.assertIn(('product', self.dragon.pk), self.suggest('дркон большой'))
+
+    def test_empty_query_and_limit(self):
+        self.assertEqual(self.suggest(''), [])
+        self.assertEqual(len(self.suggest('фигур', limit=1)), 1)
+
+    def test_index_follows_catalog_changes(self):
+        self.assertEqual(self.suggest('грифон'), [])
+        griffin = Product.objects.create(
+            name='Грифон', slug='griffin', description='',
+            price=Decimal('700.00'), category=self.category, stock=1, available=True
+        )
+        self.assertEqual(self.suggest('гриф'), [('product', griffin.pk)])
+        griffin.available = False
+        griffin.save()
+        self.assertEqual(self.suggest('гриф'), [])
+
+    def test_version_change_rebuilds_in_background(self):
+        self.suggest('драк')
+        index = suggest.get_index()
+        bump_catalog_version()
+        with mock.patch('search.suggest.threading.Thread') as thread:
+            # Прежний индекс отвечает, пока новый собирается
+            self.assertIs(suggest.get_index(), index)
+            self.assertIs(suggest.get_index(), index)
+        self.assertEqual(thread.return_value.start.call_count, 1)
+        suggest._build_in_background(get_catalog_version())
+        self.assertIsNot(suggest.get_index(), index)
+        self.assertEqual(self.suggest('драк'), [('product', self.dragon.pk)])
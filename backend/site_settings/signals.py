@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from products.cache import bump_catalog_version
+from .models import HomePageSettings
+
+
+@receiver(post_save, sender=HomePageSettings)
+@receiver(post_delete, sender=HomePageSettings)
+def home_page_settings_changed(sender, created=False, **kwargs):
+    # Настройки главной кэшируются вместе с каталогом (CatalogCacheMixin).
+    # Создание записи по умолчанию в HomePageSettings.load() ответ не меняет.
+    if created:
+        return
+    bump_catalog_version()
+    transaction.on_commit(bump_catalog_version)
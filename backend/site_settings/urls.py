@@ -25,7 +25,7 @@ urlpatterns = [
             'get': 'list', 
             'put': 'update',
             'patch': 'partial_update'
-        }), 
+        }, basename='homepage-settings'), # basename - префикс ключа кэша
         name='homepage-settings'
     ),
     # Add the router URLs to our urlpatterns
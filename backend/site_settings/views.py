@@ -2,6 +2,7 @@ from django.shortcuts import render
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAdminUser, AllowAny
+from products.cache import CatalogCacheMixin
 from .models import HomePageSettings, HeroSlideImage, AboutUsImage, WorkGalleryImage
 from .serializers import (
     HomePageSettingsSerializer, 
@@ -12,11 +13,14 @@ from .serializers import (
 
 # Create your views here.
 
-class HomePageSettingsViewSet(viewsets.ViewSet):
+class HomePageSettingsViewSet(CatalogCacheMixin, viewsets.ViewSet):
     """
     A ViewSet for retrieving and updating the singleton HomePageSettings.
     Allows GET to retrieve and PUT/PATCH to update the settings.
+    GET responses are cached until the settings or the catalog change (see site_settings/signals.py).
     """
+    catalog_cache_actions = ('list',)
+
     def get_permissions(self):
         """
         Instantiates and returns the list of permissions that this view requires.
@@ -30,6 +34,9 @@ class HomePageSettingsViewSet(viewsets.ViewSet):
 
     def list(self, request):
         """Handle GET requests to retrieve the home page settings."""
+        return self._cached_response(self._settings, request)
+
+    def _settings(self, request):
         settings_instance = HomePageSettings.load() # Use the load method to get or create
         serializer = HomePageSettingsSerializer(settings_instance)
         return Response(serializer.data)